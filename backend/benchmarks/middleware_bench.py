@@ -0,0 +1,142 @@
+"""
+Microbenchmark for the HTTP middleware stack.
+
+Compares the previous BaseHTTPMiddleware implementations against the pure
+ASGI ones in middleware.py on two measures:
+  - per-request overhead on a small JSON endpoint
+  - time-to-first-byte on a StreamingResponse (like /api/generate)
+
+Run from the backend directory:
+    python -m benchmarks.middleware_bench
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from middleware import CustomHeaderMiddleware, HTTPSRedirectMiddleware
+
+REQUESTS = int(os.getenv("BENCH_REQUESTS", "5000"))
+STREAM_REQUESTS = int(os.getenv("BENCH_STREAM_REQUESTS", "200"))
+CHUNK_DELAY = 0.002  # Simulated generation delay between streamed chunks
+
+
+class LegacyCustomHeaderMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        request.scope["headers"].append((b"large-allocation", b"true"))
+        response = await call_next(request)
+        response.headers["Content-Security-Policy"] = "frame-ancestors 'self'"
+        return response
+
+
+class LegacyHTTPSRedirectMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        if os.getenv('RAILWAY_ENVIRONMENT_NAME') and response.status_code == 307:
+            location = response.headers.get('location', '')
+            if location.startswith('http://'):
+                response.headers['location'] = location.replace('http://', 'https://', 1)
+        return response
+
+
+def build_app(legacy: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.get("/stream")
+    async def stream():
+        async def generate():
+            for _ in range(5):
+                yield b"x" * 100
+                await asyncio.sleep(CHUNK_DELAY)
+
+        return StreamingResponse(generate(), media_type='text/event-stream')
+
+    if legacy:
+        app.add_middleware(LegacyHTTPSRedirectMiddleware)
+        app.add_middleware(LegacyCustomHeaderMiddleware)
+    else:
+        app.add_middleware(HTTPSRedirectMiddleware)
+        app.add_middleware(CustomHeaderMiddleware)
+    return app
+
+
+async def call(app, path: str):
+    """Drive one request through the ASGI app, returning (total, ttfb) seconds."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1234),
+        "server": ("bench", 80),
+    }
+    request_sent = False
+    first_body_at = None
+    start = time.perf_counter()
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.sleep(3600)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal first_body_at
+        if message["type"] == "http.response.body" and message.get("body") and first_body_at is None:
+            first_body_at = time.perf_counter()
+
+    await app(scope, receive, send)
+    end = time.perf_counter()
+    return end - start, (first_body_at or end) - start
+
+
+async def measure(app, path: str, n: int):
+    for _ in range(min(n, 50)):  # Warm-up
+        await call(app, path)
+    totals, ttfbs = [], []
+    for _ in range(n):
+        total, ttfb = await call(app, path)
+        totals.append(total)
+        ttfbs.append(ttfb)
+    return totals, ttfbs
+
+
+def summarize(label: str, samples):
+    samples = sorted(samples)
+    p50 = statistics.median(samples) * 1e6
+    p99 = samples[int(len(samples) * 0.99) - 1] * 1e6
+    print(f"  {label:<28} p50={p50:9.1f}us  p99={p99:9.1f}us")
+
+
+async def main():
+    for legacy in (True, False):
+        name = "BaseHTTPMiddleware (before)" if legacy else "pure ASGI (after)"
+        app = build_app(legacy)
+        print(name)
+        totals, _ = await measure(app, "/health", REQUESTS)
+        summarize("JSON request latency", totals)
+        _, ttfbs = await measure(app, "/stream", STREAM_REQUESTS)
+        summarize("streaming TTFB", ttfbs)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
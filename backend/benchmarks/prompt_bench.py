@@ -0,0 +1,123 @@
+"""
+Benchmark for the LinkedIn summary prompt.
+
+Compares the previous prompt (the instructions followed by str() of the whole
+RapidAPI payload) with the compacted one from src.profile_prompt, over the
+raw LinkedIn payloads stored with existing profiles:
+  - prompt size in characters and estimated tokens, for every document
+  - with --count-tokens, Gemini's own token count for a sample
+  - with --generate N, end-to-end generation latency for N documents
+
+Run from the backend directory:
+    python -m benchmarks.prompt_bench [--limit 500] [--count-tokens] [--generate 10]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from src.raw_profiles import RAW_COLLECTION, decode_payload
+from src.profile_prompt import SUMMARY_INSTRUCTIONS, build_summary_prompt, estimate_tokens
+
+SUMMARY_MODEL = "gemini-1.5-pro"
+
+
+def legacy_prompt(profile) -> str:
+    return SUMMARY_INSTRUCTIONS + str(profile)
+
+
+def load_documents(limit: int):
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGODB_URI"))["UPenn"]
+    documents = [
+        decode_payload(doc["codec"], doc["data"])
+        for doc in db[RAW_COLLECTION].find({}).limit(limit)
+    ]
+    # Profiles not yet moved by `python -m src.raw_profiles migrate`
+    if len(documents) < limit:
+        cursor = db.profilematch.find(
+            {"raw_linkedin_data": {"$type": "object"}},
+            {"raw_linkedin_data": 1}
+        ).limit(limit - len(documents))
+        documents.extend(doc["raw_linkedin_data"] for doc in cursor)
+    return documents
+
+
+def summarize(label: str, values):
+    ordered = sorted(values)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"  {label:<28} mean {statistics.mean(ordered):>9.1f}  p50 {statistics.median(ordered):>9.1f}  "
+          f"p95 {p95:>9.1f}  max {ordered[-1]:>9.1f}")
+
+
+def measure_sizes(documents):
+    before = [legacy_prompt(doc) for doc in documents]
+    started = time.perf_counter()
+    after = [build_summary_prompt(doc) for doc in documents]
+    build_ms = (time.perf_counter() - started) * 1000 / len(documents)
+
+    print(f"Prompt size over {len(documents)} documents")
+    summarize("before chars", [len(p) for p in before])
+    summarize("after chars", [len(p) for p in after])
+    summarize("before est. tokens", [estimate_tokens(p) for p in before])
+    summarize("after est. tokens", [estimate_tokens(p) for p in after])
+    reduction = 1 - sum(map(len, after)) / sum(map(len, before))
+    print(f"  total size reduction: {reduction:.1%}; build time {build_ms:.3f} ms/prompt")
+    return before, after
+
+
+async def measure_gemini(before, after, count_tokens: bool, generate: int):
+    from google import generativeai
+
+    generativeai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+    model = generativeai.GenerativeModel(SUMMARY_MODEL)
+
+    if count_tokens:
+        sample = list(zip(before, after))[:50]
+        counts = {"before": [], "after": []}
+        for old, new in sample:
+            counts["before"].append((await model.count_tokens_async(old)).total_tokens)
+            counts["after"].append((await model.count_tokens_async(new)).total_tokens)
+        print(f"Gemini token count over {len(sample)} documents")
+        summarize("before tokens", counts["before"])
+        summarize("after tokens", counts["after"])
+
+    if generate:
+        latencies = {"before": [], "after": []}
+        # Alternate so drift in provider latency affects both sides equally
+        for old, new in list(zip(before, after))[:generate]:
+            for label, prompt in (("before", old), ("after", new)):
+                started = time.perf_counter()
+                await model.generate_content_async(prompt)
+                latencies[label].append(time.perf_counter() - started)
+        print(f"Generation latency (s) over {generate} documents")
+        summarize("before", latencies["before"])
+        summarize("after", latencies["after"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark summary prompt size and latency")
+    parser.add_argument("--limit", type=int, default=500, help="documents to load")
+    parser.add_argument("--count-tokens", action="store_true", help="ask Gemini for exact token counts")
+    parser.add_argument("--generate", type=int, default=0, help="documents to time end-to-end generation on")
+    args = parser.parse_args()
+
+    documents = load_documents(args.limit)
+    if not documents:
+        print("No stored raw LinkedIn payloads found")
+        return
+    before, after = measure_sizes(documents)
+    if args.count_tokens or args.generate:
+        asyncio.run(measure_gemini(before, after, args.count_tokens, args.generate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,303 @@
+"""
+Search relevance and latency regression harness.
+
+Every search path (Mongo aggregation, the memory-mapped embedding index, and
+whatever approximate or quantized paths come next) is compared against an
+exact dot-product ranking computed here over the same profiles it searches,
+so corpus changes don't show up as regressions:
+  - offline backends (exact, index) search the snapshot itself; "index"
+    builds a temporary index file from it
+  - live backends (mongo) can't be pointed at a snapshot, so their ground
+    truth comes from a fresh snapshot of profilematch taken in the same run
+
+Inputs are fixed so runs are comparable:
+  - a query set with stored query embeddings, so results don't depend on
+    the embedding provider on the day
+  - a profile snapshot (.npz of IDs and embeddings)
+
+For each backend the run reports mean recall@k, mean nDCG@k (graded by
+exact rank) and p50/p95 latency, and exits non-zero if recall or nDCG falls
+below its threshold, or p95 latency exceeds the saved baseline by more than
+the allowed ratio.
+
+Run from the backend directory:
+    # once: embed a query set (from a text file or the most frequent logged queries)
+    python -m benchmarks.search_eval queries --from-log 100 --out data/eval/queries.json
+    # once per corpus: snapshot profile embeddings
+    python -m benchmarks.search_eval snapshot --out data/eval/snapshot.npz
+    # every change:
+    python -m benchmarks.search_eval run --backends exact,index,mongo --k 10 \\
+        --min-recall 0.95 --baseline data/eval/baseline.json [--save-baseline]
+"""
+import argparse
+import asyncio
+import atexit
+import json
+import math
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+from dotenv import load_dotenv
+
+from src.embedding_index import EmbeddingIndex, build_index, top_k, top_k_rows
+
+load_dotenv()
+
+Backend = Callable[[List[float], int], List[str]]
+
+DEFAULT_K = 10
+WARMUP_QUERIES = 3
+
+
+def mongo_db(sync: bool = True):
+    if sync:
+        from pymongo import MongoClient
+        return MongoClient(os.getenv("MONGODB_URI"))["UPenn"]
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(os.getenv("MONGODB_URI"))["UPenn"]
+
+
+# Inputs
+
+async def embed_queries(queries: List[str]) -> List[List[float]]:
+    from src.embeddings import embed_texts
+    return await embed_texts(queries)
+
+
+def build_query_set(args):
+    if args.from_file:
+        queries = [line.strip() for line in open(args.from_file) if line.strip()]
+    else:
+        pipeline = [
+            {"$group": {"_id": "$query", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": args.from_log},
+        ]
+        queries = [doc["_id"] for doc in mongo_db().search_queries.aggregate(pipeline) if doc["_id"]]
+    embeddings = asyncio.run(embed_queries(queries))
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump({"queries": [{"query": q, "embedding": e} for q, e in zip(queries, embeddings)]}, f)
+    print(f"Saved {len(queries)} queries to {args.out}")
+
+
+def live_snapshot():
+    """IDs and embeddings currently in profilematch, keeping the most common dimension."""
+    ids, vectors = [], []
+    cursor = mongo_db().profilematch.find({"summary_embedding": {"$type": "array"}}, {"summary_embedding": 1})
+    for doc in cursor:
+        ids.append(str(doc["_id"]))
+        vectors.append(doc["summary_embedding"])
+    dims = {len(vector) for vector in vectors}
+    if len(dims) > 1:
+        dim = max(dims, key=lambda d: sum(len(v) == d for v in vectors))
+        ids, vectors = zip(*[(i, v) for i, v in zip(ids, vectors) if len(v) == dim])
+    return list(ids), np.asarray(vectors, dtype=np.float32)
+
+
+def take_snapshot(args):
+    ids, matrix = live_snapshot()
+    Path(args.out).parent.mkdir(parents=True, exist_ok=True)
+    np.savez(args.out, ids=np.asarray(ids), matrix=matrix)
+    print(f"Saved {len(ids)} profiles to {args.out}")
+
+
+def load_inputs(queries_path: str, snapshot_path: str):
+    with open(queries_path) as f:
+        entries = json.load(f)["queries"]
+    snapshot = np.load(snapshot_path)
+    return ([entry["query"] for entry in entries],
+            np.asarray([entry["embedding"] for entry in entries], dtype=np.float32),
+            [str(i) for i in snapshot["ids"]],
+            snapshot["matrix"])
+
+
+# Metrics
+
+def ground_truth(queries: np.ndarray, matrix: np.ndarray, ids: Sequence[str], k: int) -> List[List[str]]:
+    rows = top_k_rows(queries @ matrix.T, k)
+    return [[ids[i] for i in row] for row in rows]
+
+
+def recall_at_k(truth: List[str], ranked: List[str], k: int) -> float:
+    if not truth:
+        return 1.0
+    return len(set(truth[:k]) & set(ranked[:k])) / min(k, len(truth))
+
+
+def ndcg_at_k(truth: List[str], ranked: List[str], k: int) -> float:
+    """Graded relevance: the exact #1 result has gain k, #2 has k-1, and so on."""
+    gains = {profile_id: k - position for position, profile_id in enumerate(truth[:k])}
+    dcg = sum(gains.get(profile_id, 0) / math.log2(position + 2) for position, profile_id in enumerate(ranked[:k]))
+    ideal = sum((k - position) / math.log2(position + 2) for position in range(min(k, len(truth))))
+    return dcg / ideal if ideal else 1.0
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+# Backends
+
+def exact_backend(ids: Sequence[str], matrix: np.ndarray) -> Backend:
+    """Brute force over the snapshot; a sanity check that should score 1.0."""
+    def search(query: List[float], k: int) -> List[str]:
+        return [ids[i] for i in top_k(matrix @ np.asarray(query, dtype=np.float32), k)]
+    return search
+
+
+def index_backend(ids: Sequence[str], matrix: np.ndarray) -> Backend:
+    """The memory-mapped embedding index, built into a temporary file from the snapshot."""
+    directory = tempfile.mkdtemp(prefix="search_eval_")
+    atexit.register(shutil.rmtree, directory, True)
+    path = os.path.join(directory, "snapshot.idx")
+    build_index(zip(ids, matrix.tolist()), path)
+    index = EmbeddingIndex(path)
+
+    def search(query: List[float], k: int) -> List[str]:
+        return [profile_id for profile_id, _ in index.search(query, k)]
+    return search
+
+
+def mongo_backend(ids: Sequence[str], matrix: np.ndarray) -> Backend:
+    """User.search_users_by_embedding: the $reduce aggregation over the live collection."""
+    from models.user import User
+
+    loop = asyncio.new_event_loop()
+    user_model = User(mongo_db(sync=False))
+
+    def search(query: List[float], k: int) -> List[str]:
+        results = loop.run_until_complete(user_model.search_users_by_embedding(query, limit=k))
+        return [doc["_id"] for doc in results]
+    return search
+
+
+BACKENDS: Dict[str, Callable[[Sequence[str], np.ndarray], Backend]] = {
+    "exact": exact_backend,
+    "index": index_backend,
+    "mongo": mongo_backend,
+}
+# Backends that search the live database; scored against a snapshot taken now
+LIVE_BACKENDS = {"mongo"}
+
+
+def evaluate(name: str, backend: Backend, query_embeddings: np.ndarray, truth: List[List[str]], k: int) -> Dict[str, float]:
+    for query in query_embeddings[:WARMUP_QUERIES]:
+        backend(query.tolist(), k)
+    recalls, ndcgs, latencies = [], [], []
+    for query, expected in zip(query_embeddings, truth):
+        started = time.perf_counter()
+        ranked = backend(query.tolist(), k)
+        latencies.append((time.perf_counter() - started) * 1000)
+        recalls.append(recall_at_k(expected, ranked, k))
+        ndcgs.append(ndcg_at_k(expected, ranked, k))
+    return {
+        "recall": round(statistics.mean(recalls), 4),
+        "min_recall": round(min(recalls), 4),
+        "ndcg": round(statistics.mean(ndcgs), 4),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(percentile(latencies, 95), 3),
+    }
+
+
+def check(name: str, result: Dict[str, float], baseline: Dict[str, Dict[str, float]], args) -> List[str]:
+    failures = []
+    if result["recall"] < args.min_recall:
+        failures.append(f"{name}: recall@{args.k} {result['recall']} < {args.min_recall}")
+    if result["ndcg"] < args.min_ndcg:
+        failures.append(f"{name}: nDCG@{args.k} {result['ndcg']} < {args.min_ndcg}")
+    previous = baseline.get(name)
+    if previous and result["p95_ms"] > previous["p95_ms"] * args.max_latency_ratio:
+        failures.append(f"{name}: p95 {result['p95_ms']}ms > {args.max_latency_ratio}x baseline {previous['p95_ms']}ms")
+    return failures
+
+
+def run(args) -> int:
+    queries, query_embeddings, ids, matrix = load_inputs(args.queries, args.snapshot)
+    if query_embeddings.shape[1] != matrix.shape[1]:
+        print(f"Query dimension {query_embeddings.shape[1]} doesn't match snapshot dimension {matrix.shape[1]}")
+        return 2
+    truth = ground_truth(query_embeddings, matrix, ids, args.k)
+    live_truth = None
+
+    baseline = {}
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(f"{len(queries)} queries over {len(ids)} profiles, k={args.k}")
+    print(f"  {'backend':<10} {'recall':>8} {'min':>8} {'nDCG':>8} {'p50 ms':>10} {'p95 ms':>10}")
+    results, failures = {}, []
+    for name in args.backends.split(","):
+        if name not in BACKENDS:
+            print(f"Unknown backend {name!r}; expected one of {sorted(BACKENDS)}")
+            return 2
+        expected = truth
+        if name in LIVE_BACKENDS:
+            if live_truth is None:
+                live_ids, live_matrix = live_snapshot()
+                live_truth = ground_truth(query_embeddings, live_matrix, live_ids, args.k)
+            expected = live_truth
+        result = evaluate(name, BACKENDS[name](ids, matrix), query_embeddings, expected, args.k)
+        results[name] = result
+        print(f"  {name:<10} {result['recall']:>8} {result['min_recall']:>8} {result['ndcg']:>8} "
+              f"{result['p50_ms']:>10} {result['p95_ms']:>10}")
+        failures.extend(check(name, result, baseline, args))
+
+    if args.save_baseline and args.baseline:
+        Path(args.baseline).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump({**baseline, **results}, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search relevance and latency regression harness")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    queries = commands.add_parser("queries", help="embed and store a fixed query set")
+    source = queries.add_mutually_exclusive_group(required=True)
+    source.add_argument("--from-file", help="text file with one query per line")
+    source.add_argument("--from-log", type=int, help="use the N most frequent logged queries")
+    queries.add_argument("--out", default="data/eval/queries.json")
+
+    snapshot = commands.add_parser("snapshot", help="save profile IDs and embeddings")
+    snapshot.add_argument("--out", default="data/eval/snapshot.npz")
+
+    evaluate_cmd = commands.add_parser("run", help="evaluate backends against exact ground truth")
+    evaluate_cmd.add_argument("--queries", default="data/eval/queries.json")
+    evaluate_cmd.add_argument("--snapshot", default="data/eval/snapshot.npz")
+    evaluate_cmd.add_argument("--backends", default="exact,index")
+    evaluate_cmd.add_argument("--k", type=int, default=DEFAULT_K)
+    evaluate_cmd.add_argument("--min-recall", type=float, default=0.95)
+    evaluate_cmd.add_argument("--min-ndcg", type=float, default=0.9)
+    evaluate_cmd.add_argument("--max-latency-ratio", type=float, default=1.25,
+                              help="fail if p95 latency exceeds the baseline by this factor")
+    evaluate_cmd.add_argument("--baseline", default="data/eval/baseline.json")
+    evaluate_cmd.add_argument("--save-baseline", action="store_true")
+
+    args = parser.parse_args()
+    if args.command == "queries":
+        build_query_set(args)
+    elif args.command == "snapshot":
+        take_snapshot(args)
+    else:
+        sys.exit(run(args))
+
+
+if __name__ == "__main__":
+    main()
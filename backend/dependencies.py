@@ -1,11 +1,18 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
-from fastapi import HTTPException
+import hmac
+from typing import Optional
+from fastapi import Header, HTTPException
 from contextlib import asynccontextmanager
+import logging
+from src.job_queue import JobQueue
+from src.batch_jobs import BatchJobRunner
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 MONGODB_URI = os.getenv("MONGODB_URI")
 if not MONGODB_URI:
     raise ValueError("MONGODB_URI environment variable is not set")
@@ -14,11 +21,26 @@ if not MONGODB_URI:
 client = AsyncIOMotorClient(MONGODB_URI)
 db = client.get_database("UPenn")
 
+# Background jobs for write paths; workers are started in main.py
+job_queue = JobQueue(db)
+
+# CPU-heavy admin jobs (kNN graph, clustering), run in a process pool
+batch_runner = BatchJobRunner(db)
+
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
 async def get_db():
-    try:
-        # Test the connection
-        await client.admin.command('ping')
-        return db
-    except Exception as e:
-        print(f"Database error: {e}")
-        raise HTTPException(status_code=500, detail="Database connection error")
+    # No per-request ping: it cost an extra round trip on every endpoint, and
+    # connection failures already surface from the queries themselves
+    return db
+
+def get_job_queue() -> JobQueue:
+    return job_queue
+
+def get_batch_runner() -> BatchJobRunner:
+    return batch_runner
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)):
+    # Admin routes are off entirely unless a key is configured
+    if not ADMIN_API_KEY or not x_admin_key or not hmac.compare_digest(x_admin_key, ADMIN_API_KEY):
+        raise HTTPException(status_code=403, detail="Admin key required")
@@ -0,0 +1,118 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+from datetime import datetime, timezone
+from typing import Any
+
+# Longest rendered log message; anything past this is cut off
+MAX_MESSAGE_LENGTH = int(os.getenv("LOG_MAX_MESSAGE_LENGTH", "2000"))
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def is_production() -> bool:
+    return bool(os.getenv("RAILWAY_ENVIRONMENT_NAME"))
+
+
+def truncate(value: Any, limit: int = 200) -> str:
+    """Render a value for logging, cutting it off after `limit` characters."""
+    text = value if isinstance(value, str) else repr(value)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}...<{len(text) - limit} more chars>"
+
+
+def describe_payload(payload: Any) -> str:
+    """
+    Summarize a request/response payload without logging its contents.
+    Dicts are described by their keys, everything else by type and size.
+    """
+    if isinstance(payload, dict):
+        return f"dict(keys={sorted(payload.keys())})"
+    if isinstance(payload, (list, tuple, str, bytes)):
+        return f"{type(payload).__name__}(len={len(payload)})"
+    return type(payload).__name__
+
+
+def should_sample(rate: float) -> bool:
+    return rate >= 1.0 or random.random() < rate
+
+
+class TruncatingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that renders the message in the calling thread (so mutable
+    arguments are captured as they were) but truncates it before enqueueing,
+    leaving the actual formatting and I/O to the listener thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        message = record.getMessage()
+        if len(message) > MAX_MESSAGE_LENGTH:
+            message = truncate(message, MAX_MESSAGE_LENGTH)
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, for log aggregation in production."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+def configure_logging():
+    """
+    Route all logging through a queue drained by a background thread so
+    request handlers never block on stream I/O. Safe to call more than once.
+
+    LOG_LEVEL overrides the level; otherwise production logs at INFO and
+    local development at DEBUG.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    default_level = "INFO" if is_production() else "DEBUG"
+    level = os.getenv("LOG_LEVEL", default_level).upper()
+
+    stream_handler = logging.StreamHandler()
+    if is_production():
+        stream_handler.setFormatter(JSONFormatter())
+    else:
+        stream_handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(
+        log_queue, stream_handler, respect_handler_level=True
+    )
+    _listener.start()
+    atexit.register(_listener.stop)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(TruncatingQueueHandler(log_queue))
+    root.setLevel(level)
+
+    # Third-party clients are chatty at DEBUG and log whole payloads
+    for noisy in ("pymongo", "urllib3", "httpx", "httpcore", "asyncio"):
+        logging.getLogger(noisy).setLevel(max(root.level, logging.INFO))
@@ -6,13 +6,21 @@ backend_dir = str(Path(__file__).parent)
 if backend_dir not in sys.path:
     sys.path.append(backend_dir)
 
-from fastapi import FastAPI, HTTPException, Request, APIRouter
+from fastapi import FastAPI, HTTPException, Request, APIRouter, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, JSONResponse
 from src.profile_search import ProfileSearch
-from src.text_generation import TextGenerationRequest, create_prompt
-from routes import auth, users, search
-from dependencies import get_db
+from models.user import User
+from src.text_generation import EXPLANATION_MODEL, TextGenerationRequest, create_prompt
+from routes import auth, users, search, photos, admin
+from dependencies import get_db, db, job_queue, batch_runner, require_admin
+from src.profile_jobs import PendingEmbeddingSweep, register_profile_jobs
+from src.profile_sync import ProfileChangeFeed
+from src import embedding_index, http_cache
+from src.knn_graph import KnnGraphUpdater
+from src.outbound import ProviderUnavailable, gemini, outbound_stats
+from src.embeddings import hedged_embedder
+from src.photo_cache import photo_cache
 from typing import List, Dict, Any
 from bson.json_util import dumps
 import traceback
@@ -22,40 +30,27 @@ import os
 from dotenv import load_dotenv
 import requests
 from google import generativeai
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.types import ASGIApp
-from starlette.datastructures import Headers
+from middleware import CustomHeaderMiddleware, HTTPSRedirectMiddleware, RequestLogMiddleware
+from logging_config import configure_logging
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-class CustomHeaderMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        # Modify the headers to increase size limits
-        request.scope["headers"].append(
-            (b"large-allocation", b"true")
-        )
-        response = await call_next(request)
-        response.headers["Content-Security-Policy"] = "frame-ancestors 'self'"
-        return response
-
-class HTTPSRedirectMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-        # Only enforce HTTPS on Railway (production)
-        if os.getenv('RAILWAY_ENVIRONMENT_NAME') and response.status_code == 307:
-            location = response.headers.get('location', '')
-            if location.startswith('http://'):
-                response.headers['location'] = location.replace('http://', 'https://', 1)
-        return response
-
 app = FastAPI()
 
 # Initialize services
 profile_search = ProfileSearch()
+profile_feed = ProfileChangeFeed(db)
+embedding_index.attach(profile_feed)
+profile_feed.subscribe(KnnGraphUpdater(db))
+profile_feed.subscribe(search.warm_cache)
+profile_feed.subscribe(search.suggest_index)
+http_cache.attach(profile_feed, search.warm_cache)
+register_profile_jobs(job_queue, db)
+pending_sweep = PendingEmbeddingSweep(job_queue, db)
 
 # Initialize Gemini if API key exists
 if os.getenv("GEMINI_API_KEY"):
@@ -87,24 +82,76 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # Add custom header middleware
 app.add_middleware(CustomHeaderMiddleware)
 
+# Sampled request logging, outermost so durations cover the whole stack
+app.add_middleware(RequestLogMiddleware)
+
 # Include routers with prefixes
 app.include_router(users.router, prefix="/api/users", tags=["users"])
 app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
 app.include_router(search.router, prefix="/api/search", tags=["search"])
+app.include_router(photos.router, prefix="/api/photos", tags=["photos"])
+app.include_router(admin.router, prefix="/api/admin/jobs", tags=["admin"], dependencies=[Depends(require_admin)])
 
 @app.get("/")
 async def root():
     return {"message": "API is running"}
 
+@app.on_event("startup")
+async def start_background_tasks():
+    profile_feed.start()
+    search.query_log.start()
+    search.warm_cache.start()
+    search.suggest_index.start()
+    await job_queue.ensure_indexes()
+    try:
+        await User(db).ensure_indexes()
+    except Exception as e:
+        # Existing duplicates block the unique index; src.dedupe merges them
+        logger.error("Failed to create the unique linkedinUrl index: %s", e)
+    job_queue.start()
+    pending_sweep.start()
+    await batch_runner.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await job_queue.stop()
+    await pending_sweep.stop()
+    await batch_runner.stop()
+    await profile_feed.stop()
+    await search.warm_cache.stop()
+    await search.suggest_index.stop()
+    await search.query_log.stop()
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/sync")
+async def sync_status():
+    return profile_feed.stats()
+
+@app.get("/health/outbound")
+async def outbound_status():
+    return {**outbound_stats(), "embedding_hedging": hedged_embedder.snapshot()}
+
+@app.get("/health/photos")
+async def photo_cache_status():
+    return photo_cache.snapshot()
+
+@app.get("/health/search-cache")
+async def search_cache_status():
+    return {
+        **search.warm_cache.stats(),
+        "http_cache": http_cache.stats(),
+        "suggest": search.suggest_index.stats(),
+    }
+
 @app.post("/api/generate")
 async def generate_text(request: TextGenerationRequest):
     try:
@@ -115,8 +162,8 @@ async def generate_text(request: TextGenerationRequest):
         prompt = create_prompt(request)
         
         # Use Gemini to generate the response
-        model = generativeai.GenerativeModel('gemini-1.5-flash-8b')
-        response = await model.generate_content_async(prompt)
+        model = generativeai.GenerativeModel(EXPLANATION_MODEL)
+        response = await gemini.call(model.generate_content_async, prompt)
         text = response.text
 
         # Stream the response in chunks
@@ -130,9 +177,13 @@ async def generate_text(request: TextGenerationRequest):
             generate(),
             media_type='text/event-stream'
         )
+    except HTTPException:
+        raise
+    except ProviderUnavailable as e:
+        # Fail fast rather than holding the connection behind a slow provider
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
-        logger.error(f"Error in generate_text: {str(e)}")
-        logger.error(traceback.format_exc())
+        logger.exception("Error in generate_text: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+import logging
+import os
+import time
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from logging_config import is_production, should_sample
+
+request_logger = logging.getLogger("requests")
+
+
+class CustomHeaderMiddleware:
+    """
+    Adds the Content-Security-Policy header to every HTTP response.
+
+    Implemented as plain ASGI middleware so it only rewrites the
+    http.response.start message and never buffers or wraps the body,
+    which keeps StreamingResponse chunks flowing straight to the client.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_headers(message: Message):
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["Content-Security-Policy"] = "frame-ancestors 'self'"
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+
+class HTTPSRedirectMiddleware:
+    """
+    Rewrites http:// redirect locations to https:// on Railway (production),
+    where TLS is terminated in front of the app.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # Only enforce HTTPS on Railway (production)
+        self.enabled = bool(os.getenv('RAILWAY_ENVIRONMENT_NAME'))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if not self.enabled or scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_https_location(message: Message):
+            if message["type"] == "http.response.start" and message["status"] == 307:
+                headers = MutableHeaders(scope=message)
+                location = headers.get('location', '')
+                if location.startswith('http://'):
+                    headers['location'] = location.replace('http://', 'https://', 1)
+            await send(message)
+
+        await self.app(scope, receive, send_with_https_location)
+
+
+class RequestLogMiddleware:
+    """
+    Logs one line per request (method, path, status, duration).
+
+    Only a sample of successful requests is logged, controlled by
+    LOG_REQUEST_SAMPLE_RATE (default 1% in production, everything locally).
+    Server errors and slow requests are always logged.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        default_rate = "0.01" if is_production() else "1.0"
+        self.sample_rate = float(os.getenv("LOG_REQUEST_SAMPLE_RATE", default_rate))
+        self.slow_threshold = float(os.getenv("LOG_SLOW_REQUEST_SECONDS", "2.0"))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            duration = time.perf_counter() - start
+            if status_code >= 500 or duration >= self.slow_threshold or should_sample(self.sample_rate):
+                request_logger.info(
+                    "%s %s %d %.1fms",
+                    scope["method"], scope["path"], status_code, duration * 1000
+                )
@@ -1,15 +1,37 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from datetime import datetime
 import logging
+import re
+from logging_config import describe_payload
+from src.embedding_index import search_embedding_index
+from src.raw_profiles import RawProfileStore
 from urllib.parse import urlparse, urljoin
 
 logger = logging.getLogger(__name__)
 
+# Everything except the bulky fields only search and signup need. Raw
+# LinkedIn data now lives in RawProfileStore; the exclusion covers profiles
+# that haven't been migrated yet.
+PROFILE_PROJECTION = {"raw_linkedin_data": 0, "summary_embedding": 0}
+
 class User:
     def __init__(self, db: AsyncIOMotorDatabase):
         self.collection = db.profilematch
+        self.knn_collection = db.profile_knn
+        self.raw_profiles = RawProfileStore(db)
+
+    async def ensure_indexes(self):
+        """One profile per LinkedIn URL, so concurrent signups can't both insert."""
+        await self.collection.create_index(
+            "linkedinUrl",
+            unique=True,
+            # Profiles without a URL aren't constrained
+            partialFilterExpression={"linkedinUrl": {"$gt": ""}}
+        )
 
     @staticmethod
     def normalize_linkedin_url(url: str) -> str:
@@ -54,55 +76,108 @@ class User:
         
         return normalized
 
-    async def create_user(self, user_data: Dict[str, Any], raw_linkedin_data: Dict[str, Any], embedding: List[float]) -> str:
+    def build_user_doc(self, user_data: Dict[str, Any], embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+        """
+        Validates signup data and builds a new profile document. Without an
+        embedding the profile is stored with embedding_status "pending" and
+        stays out of search until a background job fills it in.
+        """
+        # Validate required fields
+        required_fields = {
+            "email": str,
+            "name": str,
+            "location": str,
+            "linkedinUrl": str,
+            "company": str,
+            "role": str,
+            "summary": str
+        }
+        
+        for field, field_type in required_fields.items():
+            if field not in user_data:
+                raise ValueError(f"Missing required field: {field}")
+            if not isinstance(user_data[field], field_type):
+                raise ValueError(f"Invalid type for {field}. Expected {field_type.__name__}, got {type(user_data[field]).__name__}")
+        
+        # Validate embedding
+        if embedding is not None and (not isinstance(embedding, list) or not all(isinstance(x, float) for x in embedding)):
+            raise ValueError("Invalid embedding format. Expected list of floats.")
+        
+        # Normalize LinkedIn URL
+        user_data["linkedinUrl"] = self.normalize_linkedin_url(user_data["linkedinUrl"])
+        
+        # Mongo stores milliseconds; truncate so the value round-trips exactly
+        now = datetime.utcnow()
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        return {
+            "email": user_data["email"],
+            "name": user_data["name"],
+            "location": user_data["location"],
+            "linkedinUrl": user_data["linkedinUrl"],
+            "company": user_data["company"],
+            "role": user_data["role"],
+            "summary": user_data["summary"],
+            "photoUrl": user_data.get("photoUrl", ""),
+            "summary_embedding": embedding,
+            "embedding_status": "ready" if embedding is not None else "pending",
+            "created_at": now,
+            "updated_at": now
+        }
+
+    async def create_user(self, user_data: Dict[str, Any], raw_linkedin_data: Dict[str, Any], embedding: Optional[List[float]] = None) -> str:
         try:
-            # Validate required fields
-            required_fields = {
-                "email": str,
-                "name": str,
-                "location": str,
-                "linkedinUrl": str,
-                "company": str,
-                "role": str,
-                "summary": str
-            }
-            
-            for field, field_type in required_fields.items():
-                if field not in user_data:
-                    raise ValueError(f"Missing required field: {field}")
-                if not isinstance(user_data[field], field_type):
-                    raise ValueError(f"Invalid type for {field}. Expected {field_type.__name__}, got {type(user_data[field]).__name__}")
-            
-            # Validate embedding
-            if not isinstance(embedding, list) or not all(isinstance(x, float) for x in embedding):
-                raise ValueError("Invalid embedding format. Expected list of floats.")
-            
-            # Normalize LinkedIn URL
-            user_data["linkedinUrl"] = self.normalize_linkedin_url(user_data["linkedinUrl"])
-            
-            user_doc = {
-                "email": user_data["email"],
-                "name": user_data["name"],
-                "location": user_data["location"],
-                "linkedinUrl": user_data["linkedinUrl"],
-                "company": user_data["company"],
-                "role": user_data["role"],
-                "summary": user_data["summary"],
-                "photoUrl": user_data.get("photoUrl", ""),
-                "summary_embedding": embedding,
-                "raw_linkedin_data": raw_linkedin_data,
-                "created_at": datetime.utcnow(),
-                "updated_at": datetime.utcnow()
-            }
-            
+            user_doc = self.build_user_doc(user_data, embedding)
+            raw = self.raw_profiles.encode(raw_linkedin_data)
             result = await self.collection.insert_one(user_doc)
-            logger.info(f"Created user with ID: {result.inserted_id}")
+            await self.raw_profiles.save_encoded(str(result.inserted_id), raw)
+            logger.info("Created user with ID: %s", result.inserted_id)
             return str(result.inserted_id)
             
         except Exception as e:
-            logger.error(f"Error in create_user: {str(e)}")
+            logger.error("Error in create_user: %s", e)
             raise
 
+    async def create_or_claim_user(self, user_data: Dict[str, Any], raw_linkedin_data: Dict[str, Any]) -> Tuple[str, bool]:
+        """
+        Creates the profile for user_data's LinkedIn URL, or claims the existing
+        one by setting its email, in a single upsert.
+        Returns (user_id, claimed).
+        """
+        try:
+            user_doc = self.build_user_doc(user_data)
+            # Validated up front: a bad payload must not leave a profile behind
+            raw = self.raw_profiles.encode(raw_linkedin_data)
+            email, updated_at = user_doc.pop("email"), user_doc.pop("updated_at")
+            linkedin_url = user_doc.pop("linkedinUrl")
+            try:
+                result = await self._upsert_by_linkedin_url(linkedin_url, email, updated_at, user_doc)
+            except DuplicateKeyError:
+                # A concurrent signup inserted this URL first; now the upsert claims it
+                result = await self._upsert_by_linkedin_url(linkedin_url, email, updated_at, user_doc)
+            # created_at only matches ours if this call inserted the document
+            claimed = result.get("created_at") != user_doc["created_at"]
+            user_id = str(result["_id"])
+            if not claimed:
+                await self.raw_profiles.save_encoded(user_id, raw)
+            logger.info("%s user with ID: %s", "Claimed" if claimed else "Created", user_id)
+            return user_id, claimed
+        except Exception as e:
+            logger.error("Error in create_or_claim_user: %s", e)
+            raise
+
+    async def _upsert_by_linkedin_url(self, linkedin_url: str, email: str, updated_at: datetime,
+                                      user_doc: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.collection.find_one_and_update(
+            {"linkedinUrl": linkedin_url},
+            {
+                "$set": {"email": email, "updated_at": updated_at},
+                "$setOnInsert": user_doc
+            },
+            projection={"created_at": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
     async def get_user_by_linkedin_url(self, linkedin_url: str) -> Optional[Dict[str, Any]]:
         try:
             # Normalize the URL before querying
@@ -112,17 +187,17 @@ class User:
                 user["_id"] = str(user["_id"])
             return user
         except Exception as e:
-            logger.error(f"Error in get_user_by_linkedin_url: {str(e)}")
+            logger.error("Error in get_user_by_linkedin_url: %s", e)
             raise
 
-    async def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
+    async def get_user_by_email(self, email: str, projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
         try:
-            user = await self.collection.find_one({"email": email})
+            user = await self.collection.find_one({"email": email}, projection)
             if user:
                 user["_id"] = str(user["_id"])
             return user
         except Exception as e:
-            logger.error(f"Error in get_user_by_email: {str(e)}")
+            logger.error("Error in get_user_by_email: %s", e)
             raise
 
     async def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
@@ -132,34 +207,66 @@ class User:
                 user["_id"] = str(user["_id"])
             return user
         except Exception as e:
-            logger.error(f"Error in get_user_by_id: {str(e)}")
+            logger.error("Error in get_user_by_id: %s", e)
             raise
 
-    async def update_user(self, email: str, update_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    async def get_raw_linkedin_data(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """The scraped LinkedIn payload for a profile, loaded only on request.
+
+        Internal use only (prompts, migrations): it holds more than the public
+        profile, so routes must not hand it out by profile ID.
+        """
+        try:
+            return await self.raw_profiles.load(user_id)
+        except Exception as e:
+            logger.error("Error in get_raw_linkedin_data: %s", e)
+            raise
+
+    async def update_user(self, email: str, update_data: Dict[str, Any], projection: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Updates the user in one find_one_and_update and returns the updated
+        document, or None if no user has this email.
+
+        When the summary changes, embedding_status is set to "pending" in the
+        same write so callers can tell from the result whether to re-embed.
+        """
         try:
-            logger.debug(f"Updating user {email} with data: {update_data}")
+            logger.debug("Updating user %s with data: %s", email, describe_payload(update_data))
             
             # Remove fields that shouldn't be updated
             update_data.pop("email", None)
             update_data.pop("_id", None)  # Remove _id field as it's immutable
             update_data["updated_at"] = datetime.utcnow()
             
+            # Pipeline update so the summary comparison sees the stored value;
+            # $literal keeps user-supplied strings like "$foo" from being read as field paths
+            fields = {key: {"$literal": value} for key, value in update_data.items()}
+            if "summary" in update_data:
+                fields["embedding_status"] = {
+                    "$cond": [
+                        {"$ne": ["$summary", {"$literal": update_data["summary"]}]},
+                        "pending",
+                        "$embedding_status"
+                    ]
+                }
+            
             # Perform the update
             result = await self.collection.find_one_and_update(
                 {"email": email},
-                {"$set": update_data},
-                return_document=True
+                [{"$set": fields}],
+                projection=projection,
+                return_document=ReturnDocument.AFTER
             )
             
             if result:
                 result["_id"] = str(result["_id"])
-                logger.info(f"Successfully updated user {email}")
+                logger.info("Successfully updated user %s", email)
             else:
-                logger.warning(f"No user found to update with email {email}")
+                logger.warning("No user found to update with email %s", email)
                 
             return result
         except Exception as e:
-            logger.error(f"Error in update_user: {str(e)}")
+            logger.error("Error in update_user: %s", e)
             raise
 
     async def claim_profile(self, linkedin_url: str, email: str) -> Optional[Dict[str, Any]]:
@@ -170,20 +277,16 @@ class User:
         try:
             # Normalize the URL before querying
             normalized_url = self.normalize_linkedin_url(linkedin_url)
-            
-            # Find the profile by LinkedIn URL
-            user = await self.collection.find_one({"linkedinUrl": normalized_url})
-            if not user:
-                return None
                 
-            # Update the email
+            # Update the email; a missing profile simply matches nothing
             result = await self.collection.find_one_and_update(
                 {"linkedinUrl": normalized_url},
                 {"$set": {
                     "email": email,
                     "updated_at": datetime.utcnow()
                 }},
-                return_document=True
+                projection=PROFILE_PROJECTION,
+                return_document=ReturnDocument.AFTER
             )
             
             if result:
@@ -191,12 +294,39 @@ class User:
             return result
             
         except Exception as e:
-            logger.error(f"Error in claim_profile: {str(e)}")
+            logger.error("Error in claim_profile: %s", e)
+            raise
+
+    async def get_users_by_ids(self, user_ids: List[str], scores: Optional[List[float]] = None) -> List[Dict[str, Any]]:
+        """
+        Fetches users by ID, preserving the order of `user_ids`.
+        When `scores` is given, each user gets a matching `similarity` field.
+        """
+        try:
+            object_ids = [ObjectId(user_id) for user_id in user_ids]
+            docs = {}
+            async for doc in self.collection.find({"_id": {"$in": object_ids}}, PROFILE_PROJECTION):
+                doc["_id"] = str(doc["_id"])
+                docs[doc["_id"]] = doc
+
+            results = []
+            for position, user_id in enumerate(user_ids):
+                doc = docs.get(user_id)
+                if doc is None:
+                    continue
+                if scores is not None:
+                    doc["similarity"] = scores[position]
+                results.append(doc)
+            return results
+        except Exception as e:
+            logger.error("Error in get_users_by_ids: %s", e)
             raise
 
     async def search_users_by_embedding(self, query_embedding: List[float], offset: int = 0, limit: int = 6) -> List[Dict[str, Any]]:
         try:
             pipeline = [
+                # Profiles still waiting on their embedding job aren't searchable
+                {"$match": {"summary_embedding": {"$type": "array"}}},
                 {
                     "$addFields": {
                         "similarity": {
@@ -220,7 +350,9 @@ class User:
                 },
                 {"$sort": {"similarity": -1}},
                 {"$skip": offset},
-                {"$limit": limit}
+                {"$limit": limit},
+                # Results go straight to clients
+                {"$project": PROFILE_PROJECTION}
             ]
             
             results = []
@@ -230,18 +362,102 @@ class User:
             
             return results
         except Exception as e:
-            logger.error(f"Error in search_users_by_embedding: {str(e)}")
+            logger.error("Error in search_users_by_embedding: %s", e)
+            raise
+
+    async def search_users_lexical(self, query: str, offset: int = 0, limit: int = 6) -> List[Dict[str, Any]]:
+        """
+        Keyword fallback used when embeddings are unavailable: ranks profiles
+        by how many query terms appear in their name, role, company,
+        location or summary.
+        """
+        try:
+            terms = [re.escape(term) for term in query.split() if len(term) > 1][:10]
+            if not terms:
+                return []
+            fields = ["name", "role", "company", "location", "summary"]
+            text = {"$concat": [
+                part for field in fields for part in ({"$ifNull": [f"${field}", ""]}, " ")
+            ]}
+            pipeline = [
+                {"$match": {"$or": [
+                    {field: {"$regex": term, "$options": "i"}}
+                    for term in terms
+                    for field in fields
+                ]}},
+                {"$addFields": {"similarity": {"$add": [
+                    {"$cond": [{"$regexMatch": {"input": text, "regex": term, "options": "i"}}, 1, 0]}
+                    for term in terms
+                ]}}},
+                {"$sort": {"similarity": -1, "_id": 1}},
+                {"$skip": offset},
+                {"$limit": limit},
+                {"$project": PROFILE_PROJECTION}
+            ]
+            results = []
+            async for doc in self.collection.aggregate(pipeline):
+                doc["_id"] = str(doc["_id"])
+                results.append(doc)
+            return results
+        except Exception as e:
+            logger.error("Error in search_users_lexical: %s", e)
+            raise
+
+    async def get_similar_users(self, user_id: str, limit: int = 6) -> Optional[List[Dict[str, Any]]]:
+        """
+        Returns the profiles most similar to `user_id`, best first.
+
+        Reads the precomputed kNN graph when the profile has a row there;
+        otherwise ranks against the profile's stored embedding. Returns None
+        if the profile doesn't exist.
+        """
+        # A negative $slice would return the *least* similar neighbours
+        limit = max(1, limit)
+        try:
+            row = await self.knn_collection.find_one(
+                {"_id": ObjectId(user_id)},
+                {"neighbors": {"$slice": limit}}
+            )
+            if row and row.get("neighbors"):
+                neighbours = row["neighbors"]
+                return await self.get_users_by_ids(
+                    [str(neighbour["id"]) for neighbour in neighbours],
+                    [neighbour["score"] for neighbour in neighbours]
+                )
+
+            user = await self.collection.find_one(
+                {"_id": ObjectId(user_id)},
+                {"summary_embedding": 1}
+            )
+            if not user:
+                return None
+            if not user.get("summary_embedding"):
+                return []
+
+            ranked = search_embedding_index(user["summary_embedding"], limit + 1)
+            if ranked is not None:
+                ranked = [(other_id, score) for other_id, score in ranked if other_id != user_id][:limit]
+                return await self.get_users_by_ids(
+                    [other_id for other_id, _ in ranked],
+                    [score for _, score in ranked]
+                )
+
+            results = await self.search_users_by_embedding(user["summary_embedding"], limit=limit + 1)
+            return [doc for doc in results if doc["_id"] != user_id][:limit]
+        except Exception as e:
+            logger.error("Error in get_similar_users: %s", e)
             raise
 
     async def delete_user(self, email: str) -> bool:
         try:
-            result = await self.collection.delete_one({"email": email})
-            success = result.deleted_count > 0
+            deleted = await self.collection.find_one_and_delete({"email": email}, projection={"_id": 1})
+            success = deleted is not None
             if success:
-                logger.info(f"Successfully deleted user {email}")
+                await self.raw_profiles.delete(str(deleted["_id"]))
+                logger.info("Successfully deleted user %s", email)
             else:
-                logger.warning(f"No user found to delete with email {email}")
+                logger.warning("No user found to delete with email %s", email)
             return success
         except Exception as e:
-            logger.error(f"Error in delete_user: {str(e)}")
+            logger.error("Error in delete_user: %s", e)
             raise
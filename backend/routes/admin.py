@@ -0,0 +1,55 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel
+from bson import ObjectId
+from typing import Any, Dict
+from dependencies import get_batch_runner
+from src.batch_jobs import JOB_TYPES
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Job parameters that must be positive integers when given
+POSITIVE_INT_PARAMS = ("k", "clusters", "iterations")
+
+class JobRequest(BaseModel):
+    type: str
+    params: Dict[str, Any] = {}
+
+def _check_job_id(job_id: str):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="Invalid job ID")
+
+@router.post("", status_code=202)
+async def submit_job(request: JobRequest, runner = Depends(get_batch_runner)):
+    if request.type not in JOB_TYPES:
+        raise HTTPException(status_code=400, detail=f"type must be one of {sorted(JOB_TYPES)}")
+    for name in POSITIVE_INT_PARAMS:
+        value = request.params.get(name)
+        if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value <= 0):
+            raise HTTPException(status_code=400, detail=f"{name} must be a positive integer")
+    job_id = await runner.submit(request.type, request.params)
+    logger.info("Submitted batch job %s (%s)", job_id, request.type)
+    return {"jobId": job_id, "status": "queued"}
+
+@router.get("")
+async def list_jobs(limit: int = 20, runner = Depends(get_batch_runner)):
+    return {"jobs": await runner.recent(min(max(limit, 1), 100))}
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, runner = Depends(get_batch_runner)):
+    _check_job_id(job_id)
+    job = await runner.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.post("/{job_id}/cancel", status_code=202)
+async def cancel_job(job_id: str, runner = Depends(get_batch_runner)):
+    _check_job_id(job_id)
+    if not await runner.cancel(job_id):
+        job = await runner.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return {"jobId": job_id, "cancelRequested": True}
@@ -1,14 +1,23 @@
 from fastapi import APIRouter, HTTPException, Depends, Header
-from typing import Dict, Any
+from fastapi.responses import JSONResponse
+from typing import Dict, Any, Optional
 import requests
 import os
 from google import generativeai
-from models.user import User
-import voyageai
-from dependencies import get_db
+from models.user import User, PROFILE_PROJECTION
+from dependencies import get_db, get_job_queue
+from src.profile_jobs import enqueue_profile_embedding
+from src.outbound import ProviderUnavailable, gemini, rapidapi
+from src.embeddings import get_embedding_provider
+from src.profile_prompt import build_summary_prompt, estimate_tokens
+from src.http_cache import (
+    PROFILE_CACHE_CONTROL, cache_headers, etag_matches, not_modified, profile_etag, profile_versions
+)
 import uuid
+from bson import ObjectId
 from datetime import datetime, timedelta
 import logging
+from logging_config import describe_payload, truncate
 
 logger = logging.getLogger(__name__)
 
@@ -17,11 +26,8 @@ router = APIRouter()
 # Initialize Gemini
 generativeai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 model = generativeai.GenerativeModel('gemini-1.5-pro')
-# Initialize VoyageAI
-voyage_api_key = os.getenv("VOYAGE_API_KEY")
-if not voyage_api_key:
-    raise ValueError("VOYAGE_API_KEY environment variable is not set")
-voyageai.api_key = voyage_api_key
+# Fail at startup, not on the first signup, if embeddings are misconfigured
+get_embedding_provider()
 
 # Temporary storage for LinkedIn data with TTL
 linkedin_data_store = {}
@@ -43,13 +49,13 @@ async def scrape_linkedin_profile(data: Dict[str, str]):
         if not linkedin_url:
             raise HTTPException(status_code=400, detail="LinkedIn URL is required")
         
-        print(f"Attempting to scrape LinkedIn URL: {linkedin_url}")
+        logger.info("Attempting to scrape LinkedIn URL: %s", linkedin_url)
         
         # Use RapidAPI LinkedIn API
         url = "https://linkedin-api8.p.rapidapi.com/get-profile-data-by-url"
         api_key = os.getenv("RAPIDAPI_KEY")
         if not api_key:
-            print("RAPIDAPI_KEY environment variable is not set")
+            logger.error("RAPIDAPI_KEY environment variable is not set")
             raise HTTPException(status_code=500, detail="API key configuration error")
             
         headers = {
@@ -58,18 +64,19 @@ async def scrape_linkedin_profile(data: Dict[str, str]):
         }
         querystring = {"url": linkedin_url}
         
-        response = requests.get(url, headers=headers, params=querystring)
+        response = await rapidapi.call_blocking(
+            requests.get, url, headers=headers, params=querystring, timeout=rapidapi.timeout
+        )
         
         if response.status_code != 200:
-            print(f"RapidAPI LinkedIn error: Status {response.status_code}, Response: {response.text}")
+            logger.error("RapidAPI LinkedIn error: Status %s, Response: %s", response.status_code, truncate(response.text))
             raise HTTPException(
                 status_code=response.status_code,
                 detail=f"LinkedIn scraping failed: {response.text}"
             )
         
         profile_data = response.json()
-        raw_profile = str(profile_data)
-        print(f"Successfully scraped profile data length: {len(raw_profile)}")
+        logger.debug("Successfully scraped profile data: %s", describe_payload(profile_data))
         
         if not profile_data:
             raise HTTPException(status_code=400, detail="LinkedIn scraping failed: Empty response")
@@ -87,24 +94,12 @@ async def scrape_linkedin_profile(data: Dict[str, str]):
         photo_url = profile_data.get('profilePicture', '')
         name = profile_data.get('fullName', '')  # Extract name from LinkedIn data
         
-        # Generate summary using Gemini
-        prompt = f"""
-You are an AI assistant that specializes in generating concise professional summaries for a knowledge database. You will be given raw JSON data containing a person's LinkedIn profile information. Your goal is to:
-
-Parse the JSON carefully to extract the most relevant details (e.g., name, education, positions, key accomplishments, honors).
-Produce a single-paragraph summary that is succinct, factual, and professional.
-Avoid including personal contact details, links, or any extraneous information (e.g., email addresses).
-Focus on the individual’s academic background, professional experience, notable projects, and honors.
-Write in the third person, using a neutral, professional tone.
-Ensure the paragraph is 300 words.
-Do not output anything other than this single-paragraph summary. Do not format the text with markdown. If data is missing or not relevant, simply omit it. If there is no data at all, return an empty string.
-
-Here is the raw JSON (do not summarize this instruction text, only the JSON content below):
-        {raw_profile}
-        """
+        # Generate summary using Gemini from the compacted profile, not the raw payload
+        prompt = build_summary_prompt(profile_data)
+        logger.debug("Summary prompt is ~%d tokens", estimate_tokens(prompt))
         
-        print("Generating summary with Gemini...")
-        response = model.generate_content(prompt)
+        logger.debug("Generating summary with Gemini...")
+        response = await gemini.call(model.generate_content_async, prompt)
         summary = response.text
         
         # Generate a unique ID for this data
@@ -138,32 +133,51 @@ Here is the raw JSON (do not summarize this instruction text, only the JSON cont
         
     except HTTPException:
         raise
+    except ProviderUnavailable as e:
+        logger.warning("Scrape short-circuited: %s", e)
+        raise HTTPException(status_code=503, detail=f"LinkedIn scraping temporarily unavailable: {e.reason}")
     except Exception as e:
-        print(f"Error in scrape_linkedin_profile: {str(e)}")
+        logger.exception("Error in scrape_linkedin_profile: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to scrape LinkedIn profile: {str(e)}")
 
 @router.get("/linkedin-data/{data_id}")
 async def get_linkedin_data(data_id: str):
+    # Only pending scrapes (unguessable, 1-hour IDs). Stored raw data of saved
+    # profiles is internal; profile IDs are public through search results.
     cleanup_old_data()
     stored_data = linkedin_data_store.get(data_id)
-    if not stored_data:
-        raise HTTPException(status_code=404, detail="LinkedIn data not found or expired")
-    return stored_data['data']  # Return the raw LinkedIn data
+    if stored_data:
+        return stored_data['data']  # Return the raw LinkedIn data
+    raise HTTPException(status_code=404, detail="LinkedIn data not found or expired")
 
 @router.get("/user/profile")
 async def get_user_profile(
     email: str = Header(...),
+    if_none_match: Optional[str] = Header(None),
     db = Depends(get_db)
 ):
     try:
-        logger.info(f"Getting user profile for email: {email}")
+        logger.debug("Getting user profile for email: %s", email)
+
+        # The email header selects the profile, so caches must key on it
+        known_etag = profile_versions.etag(email)
+        if etag_matches(if_none_match, known_etag):
+            return not_modified(known_etag, PROFILE_CACHE_CONTROL, vary="email")
         
         user_model = User(db)
-        user = await user_model.get_user_by_email(email)
+        user = await user_model.get_user_by_email(email, PROFILE_PROJECTION)
         
         if not user:
-            logger.error(f"No user found for email: {email}")
+            logger.warning("No user found for email: %s", email)
             raise HTTPException(status_code=404, detail="User not found")
+
+        headers = {"Vary": "email"}
+        if user.get("updated_at") is not None:
+            profile_versions.record(str(user["_id"]), email, user["updated_at"])
+            etag = profile_etag(email, user["updated_at"])
+            if etag_matches(if_none_match, etag):
+                return not_modified(etag, PROFILE_CACHE_CONTROL, vary="email")
+            headers = cache_headers(etag, PROFILE_CACHE_CONTROL, vary="email")
         
         # Convert ObjectId to string for JSON serialization
         if '_id' in user:
@@ -182,99 +196,51 @@ async def get_user_profile(
             "_id": user.get("_id")
         }
         
-        logger.debug(f"Formatted response data: {response_data}")
-        return {"profile": response_data}
+        return JSONResponse({"profile": response_data}, headers=headers)
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in get_user_profile: {e}")
+        logger.error("Error in get_user_profile: %s", e)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 @router.post("/complete-signup")
 async def complete_signup(
     user_data: Dict[str, Any],
-    db = Depends(get_db)
+    db = Depends(get_db),
+    job_queue = Depends(get_job_queue)
 ):
     try:
-        print("\n=== Starting Complete Signup ===")
-        print(f"Raw request data: {user_data}")
-        
-        # Check if we have all required fields
-        required_fields = ["email", "name", "location", "linkedinUrl", "company", "role", "summary"]
-        for field in required_fields:
-            print(f"Checking field '{field}': {field in user_data}")
-            if field in user_data:
-                print(f"Value: {user_data[field]}")
+        logger.info("Starting complete signup for LinkedIn URL: %s", user_data.get("linkedinUrl"))
+        logger.debug("Signup request data: %s", describe_payload(user_data))
         
         # Create user model instance
-        print("\nCreating User model instance...")
         user_model = User(db)
-        
-        # Check if user exists
-        print(f"\nChecking for existing user with LinkedIn URL: {user_data.get('linkedinUrl')}")
-        existing_user = await user_model.get_user_by_linkedin_url(user_data.get("linkedinUrl"))
-        if existing_user:
-            print(f"Found existing user: {existing_user}")
-            # Instead of raising an error, try to claim the profile
-            claimed_profile = await user_model.claim_profile(user_data.get("linkedinUrl"), user_data.get("email"))
-            if claimed_profile:
-                print(f"Successfully claimed profile for user: {claimed_profile['_id']}")
-                return {"userId": claimed_profile["_id"], "claimed": True}
-            else:
-                raise HTTPException(status_code=400, detail="Failed to claim existing profile")
 
-        print("\nGenerating embedding...")
         try:
-            # Check if VoyageAI key is set
-            if not voyageai.api_key:
-                print("VoyageAI API key is not set!")
-                raise ValueError("VoyageAI API key is not configured")
-                
-            # Generate embedding for the summary using voyage-3 model
-            print(f"Summary text length: {len(user_data.get('summary', ''))}")
-            print(f"Summary text: {user_data.get('summary', '')[:100]}...")  # Print first 100 chars
-            
-            embedding = voyageai.get_embedding(
-                user_data["summary"],
-                model="voyage-3-large"
-            )
-            print(f"Generated embedding length: {len(embedding)}")
-            
-        except Exception as e:
-            print(f"Error generating embedding: {str(e)}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            print(f"Embedding error traceback: {traceback.format_exc()}")
-            raise HTTPException(status_code=500, detail=f"Failed to generate embedding: {str(e)}")
-        
-        print("\nCreating user in database...")
-        try:
-            # Log raw data size
             raw_data = user_data.get("raw_data", {})
-            print(f"Raw LinkedIn data size: {len(str(raw_data))} characters")
-            print(f"Raw data keys: {raw_data.keys() if isinstance(raw_data, dict) else 'Not a dictionary'}")
+            logger.debug("Raw LinkedIn data: %s", describe_payload(raw_data))
             
-            # Create user in database
-            user_id = await user_model.create_user(
+            # Create the user, or claim the existing profile for this LinkedIn URL,
+            # in one upsert; the embedding is filled in by a background job
+            user_id, claimed = await user_model.create_or_claim_user(
                 user_data=user_data,
-                raw_linkedin_data=raw_data,
-                embedding=embedding
+                raw_linkedin_data=raw_data
             )
-            print(f"Successfully created user with ID: {user_id}")
-            return {"userId": user_id}
             
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
         except Exception as e:
-            print(f"Database error: {str(e)}")
-            print(f"Error type: {type(e)}")
-            import traceback
-            print(f"Database error traceback: {traceback.format_exc()}")
+            logger.exception("Database error: %s", e)
             raise HTTPException(status_code=500, detail=f"Failed to create user in database: {str(e)}")
+
+        if claimed:
+            return {"userId": user_id, "claimed": True}
+
+        await enqueue_profile_embedding(job_queue, user_id, user_data["summary"])
+        return {"userId": user_id, "embeddingStatus": "pending"}
             
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Unexpected error in complete_signup: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Unexpected error in complete_signup: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal server error during signup: {str(e)}")
@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, RedirectResponse
+from bson import ObjectId
+from dependencies import get_db
+from src.outbound import ProviderUnavailable
+from src.photo_cache import (DEFAULT_SIZE, SIZES, PhotoUnavailable, is_allowed_photo_url, photo_cache,
+                             thumbnail_url, url_hash)
+import logging
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+# Versioned URLs never change content, so browsers and CDNs can keep them
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@router.get("/{profile_id}/{size}")
+async def get_profile_photo(profile_id: str, size: int = DEFAULT_SIZE, v: str = "", db = Depends(get_db)):
+    if size not in SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of {list(SIZES)}")
+    if not ObjectId.is_valid(profile_id):
+        raise HTTPException(status_code=400, detail="Invalid profile ID")
+
+    # Cache hits are served straight from disk, without a profile lookup
+    if v:
+        path = photo_cache.lookup(profile_id, v, size)
+        if path is not None:
+            return FileResponse(path, media_type="image/webp", headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL})
+
+    profile = await db.profilematch.find_one({"_id": ObjectId(profile_id)}, {"photoUrl": 1})
+    if not profile or not profile.get("photoUrl") or not is_allowed_photo_url(profile["photoUrl"]):
+        raise HTTPException(status_code=404, detail="Photo not found")
+    photo_url = profile["photoUrl"]
+    if v != url_hash(photo_url):
+        # Stale or missing version: send the client to the current URL
+        profile["_id"] = profile_id
+        return RedirectResponse(thumbnail_url(profile, size), status_code=302, headers={"Cache-Control": "no-cache"})
+
+    try:
+        path = await photo_cache.get(profile_id, photo_url, size)
+    except ProviderUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except PhotoUnavailable as e:
+        logger.info("Photo for %s unavailable: %s", profile_id, e)
+        raise HTTPException(status_code=404, detail="Photo not available", headers={"Cache-Control": "public, max-age=600"})
+    except Exception as e:
+        logger.warning("Failed to fetch photo for %s: %s", profile_id, e)
+        raise HTTPException(status_code=502, detail="Failed to fetch photo")
+    return FileResponse(path, media_type="image/webp", headers={"Cache-Control": IMMUTABLE_CACHE_CONTROL})
@@ -1,29 +1,223 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
 from models.user import User
-from dependencies import get_db
-import voyageai
-from typing import List
+from dependencies import get_db, db as database
+from src.embedding_index import search_embedding_index, search_embedding_index_many
+from src.embeddings import embed_query, embed_texts
+from src.http_cache import SEARCH_CACHE_CONTROL, cache_headers, corpus_version, etag_matches, not_modified
+from src.query_cache import QueryLog, WarmCache, normalize_query
+from src.photo_cache import add_thumbnail_urls, photo_cache
+from src.suggest import SuggestIndex
+from src.text_generation import stream_explanation
+from typing import Any, Dict, List, Optional, Tuple
+from contextlib import aclosing
+import asyncio
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+PAGE_SIZE = 6
+MAX_BATCH_QUERIES = 32
+MAX_BATCH_LIMIT = 50
+MAX_SUGGESTIONS = 20
+# Explanations generated at once for one stream request, so a single page
+# can't take every Gemini slot
+EXPLANATIONS_PER_REQUEST = 3
+# Fields the result cards (and their explanations) need
+CARD_FIELDS = ("_id", "name", "role", "company", "location", "photoUrl", "linkedinUrl", "summary", "similarity")
+
+# Started and fed from main.py
+query_log = QueryLog(database)
+warm_cache = WarmCache(database)
+suggest_index = SuggestIndex(database)
+
+async def rank_search_page(user_model: User, query: str, offset: int, limit: int = PAGE_SIZE) -> Tuple[List[Dict[str, Any]], str]:
+    """Ranks one page of results for `query`. Returns (profiles, mode)."""
+    # Popular queries are served from the precomputed ranking
+    ranked = warm_cache.get(query, offset, limit)
+    if ranked is None:
+        # Generate embedding for the search query
+        try:
+            query_embedding = await embed_query(query)
+        except Exception as e:
+            # Degrade to keyword matching rather than failing the search
+            logger.warning("Embedding unavailable, falling back to lexical search: %s", e)
+            return await user_model.search_users_lexical(query, offset=offset, limit=limit), "lexical"
+
+        # Search for users using the embedding
+        ranked = search_embedding_index(query_embedding, limit=offset + limit)
+        if ranked is None:
+            return await user_model.search_users_by_embedding(query_embedding, offset=offset, limit=limit), "semantic"
+        # Ranked in-process against the shared memory-mapped matrix
+        ranked = ranked[offset:]
+
+    results = await user_model.get_users_by_ids(
+        [user_id for user_id, _ in ranked],
+        [score for _, score in ranked]
+    )
+    return results, "semantic"
+
 @router.get("/")  
-async def search_users(query: str, offset: int = 0, db = Depends(get_db)):
+async def search_users(query: str, offset: int = 0, if_none_match: Optional[str] = Header(None), db = Depends(get_db)):
     try:
-        logger.info(f"Searching for users with query: {query}, offset: {offset}")
-        # Generate embedding for the search query
-        query_embedding = voyageai.get_embedding(
-            query,
-            model="voyage-3-large"
+        logger.debug("Searching for users with query: %s, offset: %d", query, offset)
+        if offset == 0:
+            query_log.record(query)
+
+        # Same query against the same corpus version: the client's copy is current
+        etag = corpus_version.search_etag(query, offset)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag, SEARCH_CACHE_CONTROL)
+
+        results, mode = await rank_search_page(User(db), query, offset)
+        logger.debug("Found %d results", len(results))
+        add_thumbnail_urls(results)
+        photo_cache.prefetch(results)
+        if mode == "lexical":
+            # Degraded results aren't cached
+            return {"results": results, "mode": mode}
+        return JSONResponse(
+            jsonable_encoder({"results": results}),
+            headers=cache_headers(etag, SEARCH_CACHE_CONTROL) if etag else None
         )
-        
-        # Search for users using the embedding
+    except Exception as e:
+        logger.error("Error in search_users: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/suggest")
+async def suggest(q: str, limit: int = 8):
+    """Typeahead over names, companies and roles, served from memory."""
+    return {"suggestions": suggest_index.suggest(q, max(1, min(limit, MAX_SUGGESTIONS)))}
+
+def _ndjson(event: Dict[str, Any]) -> bytes:
+    return (json.dumps(event, default=str) + "\n").encode("utf-8")
+
+@router.get("/stream")
+async def stream_search_users(query: str, offset: int = 0, db = Depends(get_db)):
+    """
+    Streaming search as newline-delimited JSON. The first line carries the
+    ranked result cards as soon as ranking finishes:
+        {"type": "results", "mode": ..., "results": [...]}
+    then explanation text for each profile as it is generated, interleaved
+    across the few profiles being explained at a time:
+        {"type": "explanation", "id": ..., "text": ...}
+        {"type": "explanation_done", "id": ...}    (or "explanation_error")
+    and finally {"type": "done"}.
+    """
+    try:
+        if offset == 0:
+            query_log.record(query)
+        results, mode = await rank_search_page(User(db), query, offset)
+    except Exception as e:
+        logger.error("Error in stream_search_users: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    cards = [{field: doc.get(field) for field in CARD_FIELDS} for doc in results]
+    add_thumbnail_urls(cards)
+    photo_cache.prefetch(cards)
+
+    async def events():
+        yield _ndjson({"type": "results", "mode": mode, "results": cards})
+
+        queue: asyncio.Queue = asyncio.Queue()
+        slots = asyncio.Semaphore(EXPLANATIONS_PER_REQUEST)
+
+        async def explain(card: Dict[str, Any]):
+            try:
+                async with slots, aclosing(stream_explanation(query, card)) as texts:
+                    async for text in texts:
+                        await queue.put({"type": "explanation", "id": card["_id"], "text": text})
+                await queue.put({"type": "explanation_done", "id": card["_id"]})
+            except Exception as e:
+                logger.warning("Explanation for %s failed: %s", card["_id"], e)
+                await queue.put({"type": "explanation_error", "id": card["_id"]})
+
+        tasks = [asyncio.create_task(explain(card)) for card in cards]
+        try:
+            remaining = len(tasks)
+            while remaining:
+                event = await queue.get()
+                if event["type"] != "explanation":
+                    remaining -= 1
+                yield _ndjson(event)
+            yield _ndjson({"type": "done"})
+        finally:
+            # Client went away: stop generating explanations nobody will read
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    limit: int = PAGE_SIZE
+
+
+@router.post("/batch")
+async def search_users_batch(request: BatchSearchRequest, db = Depends(get_db)):
+    """
+    Runs several searches at once: one embedding call for all queries, one
+    matrix-matrix product against the index, and one profile lookup.
+    Returns the top `limit` profiles for each query, in request order.
+    """
+    queries = [query for query in request.queries if query.strip()]
+    if not queries:
+        raise HTTPException(status_code=400, detail="No queries given")
+    if len(queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_QUERIES} queries per batch")
+    if not 1 <= request.limit <= MAX_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_BATCH_LIMIT}")
+
+    try:
         user_model = User(db)
-        results = await user_model.search_users_by_embedding(query_embedding, offset=offset, limit=6)
-        logger.info(f"Found {len(results)} results")
-        
-        return {"results": results}
+        # Repeated queries are embedded and ranked once
+        unique = list(dict.fromkeys(normalize_query(query) for query in queries))
+        embeddings = {query: warm_cache.embedding_for(query) for query in unique}
+        missing = [query for query, embedding in embeddings.items() if embedding is None]
+        if missing:
+            try:
+                embeddings.update(zip(missing, await embed_texts(missing)))
+            except Exception as e:
+                logger.warning("Embedding unavailable, falling back to lexical batch search: %s", e)
+                pages = await asyncio.gather(*(
+                    user_model.search_users_lexical(query, limit=request.limit) for query in unique
+                ))
+                by_query = dict(zip(unique, pages))
+                return {
+                    "results": [{"query": query, "results": by_query[normalize_query(query)]} for query in queries],
+                    "mode": "lexical"
+                }
+
+        ranked_lists = search_embedding_index_many([embeddings[query] for query in unique], limit=request.limit)
+        if ranked_lists is None:
+            pages = await asyncio.gather(*(
+                user_model.search_users_by_embedding(embeddings[query], limit=request.limit) for query in unique
+            ))
+            by_query = dict(zip(unique, pages))
+        else:
+            ids = list(dict.fromkeys(user_id for ranked in ranked_lists for user_id, _ in ranked))
+            docs = {doc["_id"]: doc for doc in await user_model.get_users_by_ids(ids)}
+            by_query = {
+                query: [
+                    {**docs[user_id], "similarity": score}
+                    for user_id, score in ranked if user_id in docs
+                ]
+                for query, ranked in zip(unique, ranked_lists)
+            }
+
+        for page in by_query.values():
+            add_thumbnail_urls(page)
+        return {"results": [{"query": query, "results": by_query[normalize_query(query)]} for query in queries]}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in search_users: {str(e)}")
+        logger.error("Error in search_users_batch: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
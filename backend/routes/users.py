@@ -1,9 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, Header
-from models.user import User
-from dependencies import get_db
-from typing import Dict, Any
-import voyageai
+from models.user import User, PROFILE_PROJECTION
+from dependencies import get_db, get_job_queue
+from src.profile_jobs import enqueue_profile_embedding
+from fastapi.responses import JSONResponse
+from src.http_cache import (
+    PROFILE_CACHE_CONTROL, cache_headers, etag_matches, not_modified, profile_etag, profile_versions
+)
+from typing import Dict, Any, Optional
+from bson import ObjectId
 import logging
+from logging_config import describe_payload
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
@@ -11,17 +17,30 @@ router = APIRouter()
 @router.get("/check")
 async def check_user_exists(email: str, db = Depends(get_db)):
     user_model = User(db)
-    user = await user_model.get_user_by_email(email)
+    user = await user_model.get_user_by_email(email, {"_id": 1})
     return {"exists": user is not None}
 
 @router.get("/profile")
-async def get_user_profile(email: str = None, db = Depends(get_db)):
-    logger.info(f"Fetching profile for email: {email}")
+async def get_user_profile(email: str = None, if_none_match: Optional[str] = Header(None), db = Depends(get_db)):
+    logger.debug("Fetching profile for email: %s", email)
+    # Answer revalidations from the in-memory version map when we can
+    known_etag = profile_versions.etag(email)
+    if etag_matches(if_none_match, known_etag):
+        return not_modified(known_etag, PROFILE_CACHE_CONTROL)
+
     user_model = User(db)
-    user = await user_model.get_user_by_email(email)
+    user = await user_model.get_user_by_email(email, PROFILE_PROJECTION)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
+    headers = {}
+    if user.get("updated_at") is not None:
+        profile_versions.record(user["_id"], email, user["updated_at"])
+        etag = profile_etag(email, user["updated_at"])
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag, PROFILE_CACHE_CONTROL)
+        headers = cache_headers(etag, PROFILE_CACHE_CONTROL)
+    
     # Convert ObjectId to string for JSON serialization
     if '_id' in user:
         user['_id'] = str(user['_id'])
@@ -39,36 +58,55 @@ async def get_user_profile(email: str = None, db = Depends(get_db)):
         "_id": user.get("_id", "")
     }
     
-    logger.debug(f"Returning profile data: {profile_data}")
-    return {"profile": profile_data}
+    return JSONResponse({"profile": profile_data}, headers=headers)
+
+@router.get("/{user_id}/similar")
+async def get_similar_users(user_id: str, limit: int = 6, db = Depends(get_db)):
+    if not ObjectId.is_valid(user_id):
+        raise HTTPException(status_code=400, detail="Invalid user ID")
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be at least 1")
+    try:
+        user_model = User(db)
+        results = await user_model.get_similar_users(user_id, limit=min(limit, 50))
+    except Exception as e:
+        logger.error("Error finding similar users: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
+    if results is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"results": results}
+
+@router.get("/{user_id}/embedding-status")
+async def get_embedding_status(user_id: str, db = Depends(get_db)):
+    """Polled by the frontend after signup/profile edits until the profile is searchable."""
+    if not ObjectId.is_valid(user_id):
+        raise HTTPException(status_code=400, detail="Invalid user ID")
+    user = await db.profilematch.find_one({"_id": ObjectId(user_id)}, {"embedding_status": 1})
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"embeddingStatus": user.get("embedding_status", "ready")}
 
 @router.put("/profile")
-async def update_user_profile(email: str, profile_data: Dict[str, Any], db = Depends(get_db)):
+async def update_user_profile(email: str, profile_data: Dict[str, Any], db = Depends(get_db), job_queue = Depends(get_job_queue)):
     try:
-        logger.info(f"Updating profile for email: {email}")
-        logger.debug(f"Profile data: {profile_data}")
+        logger.info("Updating profile for email: %s", email)
+        logger.debug("Profile data: %s", describe_payload(profile_data))
         
         user_model = User(db)
-        user = await user_model.get_user_by_email(email)
-        if not user:
+
+        # One find_one_and_update; it flags embedding_status "pending" itself
+        # when the summary changed
+        updated_user = await user_model.update_user(email, profile_data, PROFILE_PROJECTION)
+        if not updated_user:
             raise HTTPException(status_code=404, detail="User not found")
 
-        # Generate new embedding if summary changed
-        if "summary" in profile_data and profile_data["summary"] != user["summary"]:
-            try:
-                embedding = voyageai.get_embedding(
-                    profile_data["summary"],
-                    model="voyage-3-large"
-                )
-                profile_data["summary_embedding"] = embedding
-            except Exception as e:
-                logger.error(f"Error generating embedding: {e}")
-                # Continue without embedding if it fails
-                pass
+        # Our own write: later revalidations see the new version straight away
+        profile_versions.record(str(updated_user["_id"]), email, updated_user.get("updated_at"))
 
-        updated_user = await user_model.update_user(email, profile_data)
-        if not updated_user:
-            raise HTTPException(status_code=500, detail="Failed to update user")
+        # Re-embed in the background if summary changed; the old embedding
+        # keeps the profile searchable until the new one lands
+        if updated_user.get("embedding_status") == "pending":
+            await enqueue_profile_embedding(job_queue, updated_user["_id"], updated_user["summary"])
             
         # Format response data
         response_data = {
@@ -80,25 +118,28 @@ async def update_user_profile(email: str, profile_data: Dict[str, Any], db = Dep
             "summary": updated_user.get("summary", ""),
             "linkedinUrl": updated_user.get("linkedinUrl", ""),
             "photoUrl": updated_user.get("photoUrl", ""),
-            "_id": str(updated_user.get("_id", ""))
+            "_id": str(updated_user.get("_id", "")),
+            "embeddingStatus": updated_user.get("embedding_status", "ready")
         }
         
-        logger.info(f"Successfully updated profile for {email}")
+        logger.info("Successfully updated profile for %s", email)
         return {"profile": response_data}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error updating profile: {str(e)}")
+        logger.error("Error updating profile: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.delete("/profile")
 async def delete_user_profile(email: str, db = Depends(get_db)):
     try:
         user_model = User(db)
-        user = await user_model.get_user_by_email(email)
-        if not user:
+        if not await user_model.delete_user(email):
             raise HTTPException(status_code=404, detail="User not found")
-        
-        await user_model.delete_user(email)
+        profile_versions.forget(email)
         return {"message": "Profile deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error deleting profile: {str(e)}")
+        logger.error("Error deleting profile: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
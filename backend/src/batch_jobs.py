@@ -0,0 +1,482 @@
+"""
+Admin runner for CPU-heavy batch jobs (kNN graph rebuilds, clustering).
+
+Work never runs on the API event loop: a job splits itself into chunks and
+the runner dispatches them to a ProcessPoolExecutor, keeping only a few
+chunks in flight so progress updates and cancellation take effect quickly.
+The embedding matrix is copied once into shared memory and every worker
+attaches to it instead of receiving a pickled copy.
+
+CPU use is capped three ways so /api/search latency holds up while a job
+runs: BATCH_JOB_WORKERS processes (default a quarter of the cores), each
+lowered by BATCH_JOB_NICE and limited to one BLAS thread, optionally pinned
+to BATCH_JOB_CPUS (e.g. "2,3"). Only one job runs at a time across all API
+processes: a job must claim the single document in batch_job_slot before
+it starts, and others wait in "queued".
+
+Job state lives in the batch_jobs collection so any API worker can report
+on it:
+    {_id, type, params, status: queued|running|done|failed|cancelled,
+     progress: {done, total}, result, error, cancel_requested, owner,
+     heartbeat_at, created_at, started_at, finished_at, updated_at}
+
+Each runner heartbeats its queued and running jobs (and the slot, while it
+holds it). Every runner periodically fails jobs whose owner's heartbeat has
+stopped, and a slot with a stale heartbeat can be claimed by another job.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from multiprocessing import shared_memory
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from bson import ObjectId
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from src import batch_worker
+from src.embedding_index import get_embedding_index, overlay
+from src.knn_graph import DEFAULT_K as DEFAULT_KNN_K
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("BATCH_JOB_WORKERS", str(max(1, (os.cpu_count() or 1) // 4))))
+NICE = int(os.getenv("BATCH_JOB_NICE", "10"))
+CPUS = tuple(int(cpu) for cpu in os.getenv("BATCH_JOB_CPUS", "").split(",") if cpu.strip()) or None
+CHUNK_ROWS = 256
+PROGRESS_INTERVAL = 1.0
+WRITE_BATCH_SIZE = 1000
+HEARTBEAT_INTERVAL = 10.0
+STALE_AFTER = timedelta(seconds=60)  # No heartbeat for this long means the owning process died
+SLOT_POLL_INTERVAL = 2.0
+SLOT_ID = "slot"
+# Identifies this process's runner; a restarted process is a new owner
+OWNER = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class SharedArray:
+    """A NumPy array copied into a shared memory segment owned by this process."""
+
+    def __init__(self, array: np.ndarray):
+        array = np.ascontiguousarray(array)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+        self.array = np.ndarray(array.shape, dtype=array.dtype, buffer=self._shm.buf)
+        self.array[:] = array
+        self.spec = {"name": self._shm.name, "shape": array.shape, "dtype": array.dtype.str}
+
+    def close(self):
+        self.array = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _index_snapshot(index, upserts: Dict[str, np.ndarray], deleted) -> Tuple[List[str], np.ndarray]:
+    """The index's rows with the live overlay applied: deleted profiles dropped, edited and new ones current."""
+    ids = index.ids()
+    keep = [row for row, profile_id in enumerate(ids) if profile_id not in deleted and profile_id not in upserts]
+    added = [(profile_id, vector) for profile_id, vector in upserts.items() if len(vector) == index.dim]
+    matrix = index.matrix[keep]
+    if added:
+        matrix = np.vstack([matrix, np.asarray([vector for _, vector in added], dtype=np.float32)])
+    return [ids[row] for row in keep] + [profile_id for profile_id, _ in added], matrix
+
+
+def _stack(ids: List[str], vectors: List[List[float]]) -> Tuple[List[str], np.ndarray]:
+    if not vectors:
+        return [], np.empty((0, 0), dtype=np.float32)
+    dim = len(vectors[0])
+    kept = [(i, v) for i, v in zip(ids, vectors) if len(v) == dim]
+    return [i for i, _ in kept], np.asarray([v for _, v in kept], dtype=np.float32)
+
+
+async def load_embeddings(db) -> Tuple[List[str], np.ndarray, datetime]:
+    """
+    Profile IDs, embeddings and snapshot time: the index file plus the live
+    overlay if an index is mapped, else Mongo. Materialising the arrays runs
+    in a thread so the API event loop keeps serving.
+    """
+    taken_at = datetime.utcnow()
+    index = get_embedding_index()
+    if index is not None:
+        upserts, deleted = overlay.changes()
+        ids, matrix = await asyncio.to_thread(_index_snapshot, index, upserts, deleted)
+        return ids, matrix, taken_at
+    ids, vectors = [], []
+    async for doc in db.profilematch.find({"summary_embedding": {"$type": "array"}}, {"summary_embedding": 1}):
+        ids.append(str(doc["_id"]))
+        vectors.append(doc["summary_embedding"])
+    ids, matrix = await asyncio.to_thread(_stack, ids, vectors)
+    return ids, matrix, taken_at
+
+
+class JobContext:
+    """What a running job uses to dispatch work and report progress."""
+
+    def __init__(self, runner: "BatchJobRunner", job_id: ObjectId):
+        self.runner = runner
+        self.job_id = job_id
+        self.done = 0
+        self.total = 0
+        self.cancelled = False
+        self._last_report = 0.0
+
+    async def map(self, fn: Callable, calls: Iterable[Tuple], on_result: Callable[[Any], Any]):
+        """Run fn(*args) in the pool for every args tuple, at most 2 per worker in flight."""
+        loop = asyncio.get_running_loop()
+        calls = iter(calls)
+        in_flight = set()
+        try:
+            while True:
+                while len(in_flight) < 2 * self.runner.workers:
+                    args = next(calls, None)
+                    if args is None:
+                        break
+                    in_flight.add(loop.run_in_executor(self.runner.pool, fn, *args))
+                if not in_flight:
+                    return
+                finished, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for future in finished:
+                    result = on_result(future.result())
+                    if asyncio.iscoroutine(result):
+                        await result
+                    self.done += 1
+                await self.report()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+    async def report(self, force: bool = False):
+        if self.cancelled:
+            raise JobCancelled()
+        now = time.monotonic()
+        if not force and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        job = await self.runner.collection.find_one_and_update(
+            {"_id": self.job_id},
+            {"$set": {"progress": {"done": self.done, "total": self.total}, "updated_at": datetime.utcnow()}},
+            projection={"cancel_requested": 1}
+        )
+        if job and job.get("cancel_requested"):
+            raise JobCancelled()
+
+
+# Job types. Each is a coroutine (db, params, context) -> result summary.
+
+async def knn_graph_job(db, params: Dict[str, Any], context: JobContext) -> Dict[str, Any]:
+    """Rebuild profile_knn (same format as src.knn_graph) with the pool doing the scoring."""
+    ids, matrix, snapshot_at = await load_embeddings(db)
+    if len(ids) < 2:
+        return {"rows": 0}
+    k = min(int(params.get("k", DEFAULT_KNN_K)), len(ids) - 1)
+    object_ids = [ObjectId(profile_id) for profile_id in ids]
+    started = datetime.utcnow()
+    await db.profile_knn.create_index("neighbors.id")
+    # Copying a large matrix takes a while; keep it off the event loop
+    shared = await asyncio.to_thread(SharedArray, matrix)
+    operations: List[ReplaceOne] = []
+    written = 0
+
+    async def write(result):
+        nonlocal operations, written
+        start, neighbours, scores = result
+        for offset, row in enumerate(neighbours):
+            operations.append(ReplaceOne(
+                {"_id": object_ids[start + offset]},
+                {
+                    "neighbors": [{"id": object_ids[col], "score": float(score)}
+                                  for col, score in zip(row, scores[offset])],
+                    "updated_at": started
+                },
+                upsert=True
+            ))
+        if len(operations) >= WRITE_BATCH_SIZE:
+            batch, operations = operations, []
+            await db.profile_knn.bulk_write(batch, ordered=False)
+            written += len(batch)
+
+    try:
+        chunks = [(start, min(start + CHUNK_ROWS, len(ids))) for start in range(0, len(ids), CHUNK_ROWS)]
+        context.total = len(chunks)
+        await context.map(
+            batch_worker.knn_chunk,
+            ((shared.spec, start, end, k) for start, end in chunks),
+            write
+        )
+    finally:
+        shared.close()
+    if operations:
+        await db.profile_knn.bulk_write(operations, ordered=False)
+        written += len(operations)
+    # Drop rows for profiles that no longer exist. Rows the live updater
+    # wrote after the snapshot was taken are kept.
+    await db.profile_knn.delete_many({"updated_at": {"$lt": snapshot_at}})
+    return {"rows": written, "k": k}
+
+
+async def kmeans_job(db, params: Dict[str, Any], context: JobContext) -> Dict[str, Any]:
+    """Cluster profile embeddings; labels go to profile_clusters {_id, cluster, updated_at}."""
+    ids, matrix, _ = await load_embeddings(db)
+    if not ids:
+        return {"profiles": 0}
+    clusters = min(int(params.get("clusters", 20)), len(ids))
+    iterations = max(1, int(params.get("iterations", 10)))
+    rng = np.random.default_rng(params.get("seed", 0))
+    shared = await asyncio.to_thread(SharedArray, matrix)
+    centroids = shared.array[rng.choice(len(ids), clusters, replace=False)].copy()
+    labels = np.zeros(len(ids), dtype=np.int64)
+    chunks = [(start, min(start + CHUNK_ROWS * 8, len(ids))) for start in range(0, len(ids), CHUNK_ROWS * 8)]
+    context.total = len(chunks) * iterations
+    inertia_history = []
+
+    try:
+        for iteration in range(iterations):
+            final = iteration == iterations - 1
+            sums = np.zeros_like(centroids)
+            counts = np.zeros(clusters, dtype=np.int64)
+            inertia = 0.0
+
+            def accumulate(result):
+                nonlocal sums, counts, inertia
+                start, chunk_sums, chunk_counts, chunk_inertia, chunk_labels = result
+                sums += chunk_sums
+                counts += chunk_counts
+                inertia += chunk_inertia
+                if chunk_labels is not None:
+                    labels[start:start + len(chunk_labels)] = chunk_labels
+
+            await context.map(
+                batch_worker.kmeans_assign,
+                ((shared.spec, centroids, start, end, final) for start, end in chunks),
+                accumulate
+            )
+            inertia_history.append(round(inertia, 3))
+            if not final:
+                # Empty clusters keep their previous centroid
+                nonempty = counts > 0
+                centroids[nonempty] = sums[nonempty] / counts[nonempty, None]
+    finally:
+        shared.close()
+
+    now = datetime.utcnow()
+    for start in range(0, len(ids), WRITE_BATCH_SIZE):
+        await db.profile_clusters.bulk_write([
+            UpdateOne({"_id": ObjectId(profile_id)}, {"$set": {"cluster": int(label), "updated_at": now}}, upsert=True)
+            for profile_id, label in zip(ids[start:start + WRITE_BATCH_SIZE], labels[start:start + WRITE_BATCH_SIZE])
+        ], ordered=False)
+    await db.profile_clusters.delete_many({"updated_at": {"$lt": now}})
+    return {
+        "profiles": len(ids),
+        "clusters": clusters,
+        "sizes": np.bincount(labels, minlength=clusters).tolist(),
+        "inertia": inertia_history,
+    }
+
+
+JOB_TYPES: Dict[str, Callable] = {
+    "knn_graph": knn_graph_job,
+    "kmeans": kmeans_job,
+}
+
+
+class BatchJobRunner:
+    def __init__(self, db, workers: int = WORKERS):
+        self.db = db
+        self.collection = db.batch_jobs
+        self.slots = db.batch_job_slot
+        self.workers = workers
+        self.owner = OWNER
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._heartbeat: Optional[asyncio.Task] = None
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._contexts: Dict[str, JobContext] = {}
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn: forking a process that holds Mongo client threads isn't safe
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=batch_worker.init_worker,
+                initargs=(NICE, CPUS)
+            )
+        return self._pool
+
+    async def submit(self, job_type: str, params: Dict[str, Any]) -> str:
+        if job_type not in JOB_TYPES:
+            raise ValueError(f"Unknown job type {job_type!r}; expected one of {sorted(JOB_TYPES)}")
+        now = datetime.utcnow()
+        result = await self.collection.insert_one({
+            "type": job_type,
+            "params": params,
+            "status": "queued",
+            "progress": {"done": 0, "total": 0},
+            "cancel_requested": False,
+            "owner": self.owner,
+            "heartbeat_at": now,
+            "created_at": now,
+            "updated_at": now,
+        })
+        job_id = str(result.inserted_id)
+        task = asyncio.create_task(self._run(result.inserted_id, job_type, params))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await self.collection.find_one({"_id": ObjectId(job_id)})
+        if job is not None:
+            job["_id"] = str(job["_id"])
+        return job
+
+    async def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        jobs = []
+        async for job in self.collection.find({}, {"result": 0}).sort("created_at", -1).limit(limit):
+            job["_id"] = str(job["_id"])
+            jobs.append(job)
+        return jobs
+
+    async def cancel(self, job_id: str) -> bool:
+        """Request cancellation; the job stops after its in-flight chunks. False if already finished."""
+        result = await self.collection.update_one(
+            {"_id": ObjectId(job_id), "status": {"$in": ["queued", "running"]}},
+            {"$set": {"cancel_requested": True, "updated_at": datetime.utcnow()}}
+        )
+        context = self._contexts.get(job_id)
+        if context is not None:
+            context.cancelled = True
+        return result.modified_count > 0
+
+    async def _finish(self, job_id: ObjectId, status: str, **fields):
+        now = datetime.utcnow()
+        await self.collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": status, "finished_at": now, "updated_at": now, **fields}}
+        )
+
+    async def _claim_slot(self, job_id: ObjectId) -> bool:
+        """Take the single running slot if it is free or its holder stopped heartbeating."""
+        now = datetime.utcnow()
+        try:
+            slot = await self.slots.find_one_and_update(
+                {"_id": SLOT_ID, "$or": [{"job_id": None}, {"heartbeat_at": {"$lt": now - STALE_AFTER}}]},
+                {"$set": {"job_id": job_id, "owner": self.owner, "heartbeat_at": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # The slot exists and is held: the upsert tried to insert a second one
+            return False
+        return slot is not None and slot["job_id"] == job_id
+
+    async def _release_slot(self, job_id: ObjectId):
+        await self.slots.update_one({"_id": SLOT_ID, "job_id": job_id}, {"$set": {"job_id": None}})
+
+    async def _wait_for_slot(self, job_id: ObjectId, context: JobContext) -> bool:
+        """Wait until this job holds the slot. False if it was cancelled while queued."""
+        while not await self._claim_slot(job_id):
+            job = await self.collection.find_one({"_id": job_id}, {"cancel_requested": 1})
+            if context.cancelled or job is None or job.get("cancel_requested"):
+                return False
+            await asyncio.sleep(SLOT_POLL_INTERVAL)
+        return True
+
+    async def _run(self, job_id: ObjectId, job_type: str, params: Dict[str, Any]):
+        context = JobContext(self, job_id)
+        self._contexts[str(job_id)] = context
+        try:
+            if not await self._wait_for_slot(job_id, context):
+                await self._finish(job_id, "cancelled")
+                return
+            try:
+                job = await self.collection.find_one_and_update(
+                    {"_id": job_id, "status": "queued", "cancel_requested": False},
+                    {"$set": {"status": "running", "started_at": datetime.utcnow(), "updated_at": datetime.utcnow()}}
+                )
+                if job is None:
+                    await self._finish(job_id, "cancelled")
+                    return
+                logger.info("Batch job %s (%s) started", job_id, job_type)
+                started = time.perf_counter()
+                result = await JOB_TYPES[job_type](self.db, params, context)
+                await context.report(force=True)
+                await self._finish(job_id, "done", result={**result, "seconds": round(time.perf_counter() - started, 2)})
+                logger.info("Batch job %s (%s) finished in %.1fs", job_id, job_type, time.perf_counter() - started)
+            finally:
+                await self._release_slot(job_id)
+        except JobCancelled:
+            logger.info("Batch job %s (%s) cancelled", job_id, job_type)
+            await self._finish(job_id, "cancelled")
+        except asyncio.CancelledError:
+            await self._finish(job_id, "cancelled", error="server shutting down")
+            raise
+        except Exception as e:
+            logger.exception("Batch job %s (%s) failed: %s", job_id, job_type, e)
+            if isinstance(e, BrokenProcessPool):
+                # A worker died (e.g. OOM-killed); start a fresh pool for the next job
+                self._pool = None
+            await self._finish(job_id, "failed", error=str(e))
+        finally:
+            self._contexts.pop(str(job_id), None)
+
+    async def heartbeat(self):
+        now = datetime.utcnow()
+        await self.collection.update_many(
+            {"owner": self.owner, "status": {"$in": ["queued", "running"]}},
+            {"$set": {"heartbeat_at": now}}
+        )
+        await self.slots.update_one(
+            {"_id": SLOT_ID, "owner": self.owner, "job_id": {"$ne": None}},
+            {"$set": {"heartbeat_at": now}}
+        )
+
+    async def recover(self):
+        """Fail queued and running jobs whose owner stopped heartbeating (crashed, OOM-killed, restarted)."""
+        now = datetime.utcnow()
+        result = await self.collection.update_many(
+            {"status": {"$in": ["queued", "running"]}, "heartbeat_at": {"$lt": now - STALE_AFTER}},
+            {"$set": {"status": "failed", "error": "owning process stopped", "finished_at": now, "updated_at": now}}
+        )
+        if result.modified_count:
+            logger.warning("Marked %d orphaned batch jobs as failed", result.modified_count)
+
+    async def _heartbeat_loop(self):
+        while True:
+            try:
+                await self.heartbeat()
+                await self.recover()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Batch job heartbeat failed: %s", e)
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def start(self):
+        await self.collection.create_index("created_at")
+        await self.collection.create_index([("status", 1), ("heartbeat_at", 1)])
+        if self._heartbeat is None:
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+        for task in list(self._tasks.values()):
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
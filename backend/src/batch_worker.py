@@ -0,0 +1,74 @@
+"""
+Code that runs inside the batch job process pool (see src.batch_jobs).
+
+Workers are started with the spawn method and init_worker runs before any
+task is unpickled, so the BLAS thread limits it sets apply to the NumPy the
+task functions load. Keep module-level imports here free of NumPy for that
+reason; task functions import it on first use.
+
+Inputs arrive as SharedArray specs (name, shape, dtype) and are attached
+without copying; each worker keeps its most recent attachment open.
+"""
+import os
+from typing import Any, Dict, Optional, Tuple
+
+# BLAS libraries read these when NumPy loads
+THREAD_LIMIT_VARIABLES = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+_attached: Dict[str, Any] = {}
+
+
+def init_worker(nice: int, cpus: Optional[Tuple[int, ...]]):
+    """Keep batch work from competing with the API process for CPU."""
+    for variable in THREAD_LIMIT_VARIABLES:
+        os.environ[variable] = "1"
+    if nice:
+        os.nice(nice)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+
+
+def attach(spec: Dict[str, Any]):
+    """A NumPy view of the shared array described by `spec`."""
+    import numpy as np
+    from multiprocessing import shared_memory
+
+    if spec["name"] not in _attached:
+        for shm, _ in _attached.values():
+            shm.close()
+        _attached.clear()
+        # Spawned workers share the parent's resource tracker; the parent unlinks
+        shm = shared_memory.SharedMemory(name=spec["name"])
+        _attached[spec["name"]] = (shm, np.ndarray(spec["shape"], dtype=spec["dtype"], buffer=shm.buf))
+    return _attached[spec["name"]][1]
+
+
+def knn_chunk(spec: Dict[str, Any], start: int, end: int, k: int):
+    """Top-k neighbours (excluding self) for rows [start, end)."""
+    import numpy as np
+    from src.embedding_index import top_k_rows
+
+    matrix = attach(spec)
+    scores = matrix[start:end] @ matrix.T
+    scores[np.arange(end - start), np.arange(start, end)] = -np.inf
+    neighbours = top_k_rows(scores, k)
+    return start, neighbours, np.take_along_axis(scores, neighbours, axis=1)
+
+
+def kmeans_assign(spec: Dict[str, Any], centroids, start: int, end: int, return_labels: bool):
+    """Assign rows [start, end) to their nearest centroid.
+
+    Returns per-cluster vector sums and counts, the chunk's inertia and,
+    on the final pass, the labels.
+    """
+    import numpy as np
+
+    rows = attach(spec)[start:end]
+    # argmin ||x - c||^2 == argmax (x.c - ||c||^2 / 2)
+    scores = rows @ centroids.T - 0.5 * np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.argmax(scores, axis=1)
+    sums = np.zeros_like(centroids)
+    np.add.at(sums, labels, rows)
+    counts = np.bincount(labels, minlength=centroids.shape[0])
+    distances = np.einsum("ij,ij->i", rows, rows) - 2 * scores[np.arange(len(rows)), labels]
+    return start, sums, counts, float(distances.sum()), labels if return_labels else None
@@ -0,0 +1,285 @@
+"""
+Near-duplicate profile detection.
+
+complete_signup only matches profiles on the exact (normalized) linkedinUrl,
+so re-scrapes and URL variants leave duplicates behind. This job finds them
+by combining:
+  - embedding similarity, computed block by block as matrix products over
+    the normalized summary_embedding matrix (no per-pair Python loops)
+  - the same email address
+
+Either signal only counts when the names also match; empty or template
+summaries embed almost identically, so similarity alone proves nothing.
+Profiles with the same normalized linkedinUrl are duplicates outright.
+
+Pairs are joined into groups with union-find. By default the job only
+reports; with --merge it keeps one profile per group (claimed/most recently
+updated first), fills its empty fields from the others and deletes the rest.
+A claimed profile (one with an email) whose email differs from the
+keeper's is never deleted; it is reported as a conflict instead.
+
+Run from the backend directory:
+    python -m src.dedupe [--merge] [--threshold 0.95]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from models.user import User
+from src.raw_profiles import RAW_COLLECTION
+
+logger = logging.getLogger(__name__)
+
+# Embedding similarity above which profiles with matching names are duplicates
+DEFAULT_THRESHOLD = 0.95
+ROW_BLOCK = 2048
+COLUMN_BLOCK = 8192  # 2048 x 8192 float32 scores is 64 MB per block
+
+MERGE_FIELDS = ["email", "name", "location", "company", "role", "summary", "photoUrl", "linkedinUrl"]
+
+
+def normalize_name(name: str) -> str:
+    """Lowercase, drop credentials after a comma and strip punctuation."""
+    name = (name or "").split(",")[0].lower()
+    return " ".join(re.sub(r"[^a-z\s]", " ", name).split())
+
+
+def names_match(a: str, b: str) -> bool:
+    a_list, b_list = normalize_name(a).split(), normalize_name(b).split()
+    if not a_list or not b_list:
+        return False
+    # Same first and last name, ignoring middle names and initials
+    if a_list[0] == b_list[0] and a_list[-1] == b_list[-1]:
+        return True
+    a_tokens, b_tokens = set(a_list), set(b_list)
+    return len(a_tokens & b_tokens) / len(a_tokens | b_tokens) >= 0.75
+
+
+def normalize_email(email: str) -> str:
+    return (email or "").strip().lower()
+
+
+class UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, item: int) -> int:
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a: int, b: int):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+
+
+def similar_pairs(matrix: np.ndarray, threshold: float) -> Iterable[Tuple[int, int, float]]:
+    """
+    Yield (i, j, similarity) for every i < j whose rows have cosine
+    similarity >= threshold. Only blocks on or above the diagonal are scored.
+    """
+    count = matrix.shape[0]
+    for row_start in range(0, count, ROW_BLOCK):
+        row_end = min(row_start + ROW_BLOCK, count)
+        rows = matrix[row_start:row_end]
+        for col_start in range(row_start, count, COLUMN_BLOCK):
+            col_end = min(col_start + COLUMN_BLOCK, count)
+            scores = rows @ matrix[col_start:col_end].T
+            hits_i, hits_j = np.nonzero(scores >= threshold)
+            for i, j in zip(hits_i, hits_j):
+                global_i, global_j = row_start + i, col_start + j
+                if global_i < global_j:
+                    yield global_i, global_j, float(scores[i, j])
+        logger.info("Scored rows %d/%d", row_end, count)
+
+
+def load_profiles(collection) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+    profiles, vectors = [], []
+    dim = None
+    cursor = collection.find(
+        {"summary_embedding": {"$type": "array"}},
+        {"name": 1, "email": 1, "linkedinUrl": 1, "updated_at": 1, "summary_embedding": 1}
+    )
+    for doc in cursor:
+        embedding = doc.pop("summary_embedding")
+        if dim is None:
+            dim = len(embedding)
+        if len(embedding) != dim:
+            continue
+        profiles.append(doc)
+        vectors.append(np.asarray(embedding, dtype=np.float32))
+
+    if not vectors:
+        return profiles, np.empty((0, 0), dtype=np.float32)
+    matrix = np.vstack(vectors)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix /= np.where(norms == 0, 1, norms)
+    return profiles, matrix
+
+
+def find_duplicate_groups(profiles: List[Dict[str, Any]], matrix: np.ndarray,
+                          threshold: float = DEFAULT_THRESHOLD) -> List[List[int]]:
+    groups = UnionFind(len(profiles))
+
+    # Same LinkedIn profile URL is a duplicate regardless of anything else
+    by_url: Dict[str, int] = {}
+    for position, profile in enumerate(profiles):
+        url = User.normalize_linkedin_url(profile.get("linkedinUrl") or "")
+        if not url:
+            continue
+        if url in by_url:
+            groups.union(by_url[url], position)
+        else:
+            by_url[url] = position
+
+    # Same email or similar embeddings, but only for people with the same name
+    by_email: Dict[str, List[int]] = {}
+    for position, profile in enumerate(profiles):
+        email = normalize_email(profile.get("email"))
+        if email:
+            by_email.setdefault(email, []).append(position)
+    for positions in by_email.values():
+        for index, i in enumerate(positions):
+            for j in positions[index + 1:]:
+                if names_match(profiles[i].get("name"), profiles[j].get("name")):
+                    groups.union(i, j)
+
+    for i, j, similarity in similar_pairs(matrix, threshold):
+        if names_match(profiles[i].get("name"), profiles[j].get("name")):
+            groups.union(i, j)
+
+    members: Dict[int, List[int]] = {}
+    for position in range(len(profiles)):
+        members.setdefault(groups.find(position), []).append(position)
+    return [group for group in members.values() if len(group) > 1]
+
+
+def merge_group(collection, docs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Keep the best profile of a duplicate group and delete the rest.
+
+    Claimed profiles whose email differs from the keeper's are left alone
+    and listed under "conflicts". "reembed" is set when the keeper's summary
+    was filled in from another profile and needs a new embedding.
+    """
+    # Prefer a claimed profile (has an email), then the most recently updated
+    docs = sorted(
+        docs,
+        key=lambda doc: (bool(doc.get("email")), doc.get("updated_at") or datetime.min),
+        reverse=True
+    )
+    keeper, others = docs[0], docs[1:]
+    keeper_email = normalize_email(keeper.get("email"))
+    conflicts, removed = [], []
+    for other in others:
+        if other.get("email") and normalize_email(other["email"]) != keeper_email:
+            conflicts.append(other)
+        else:
+            removed.append(other)
+
+    updates = {}
+    for field in MERGE_FIELDS:
+        if keeper.get(field):
+            continue
+        for other in removed:
+            if other.get(field):
+                updates[field] = other[field]
+                break
+    reembed = "summary" in updates
+    # The URL is unique across profiles: it can only move to the keeper once
+    # the profile holding it is gone
+    linkedin_url = updates.pop("linkedinUrl", None)
+    if updates:
+        updates["updated_at"] = datetime.utcnow()
+        if reembed:
+            updates["embedding_status"] = "pending"
+        collection.update_one({"_id": keeper["_id"]}, {"$set": updates})
+    removed_ids = [other["_id"] for other in removed]
+    if removed_ids:
+        collection.delete_many({"_id": {"$in": removed_ids}})
+        collection.database[RAW_COLLECTION].delete_many({"_id": {"$in": removed_ids}})
+    if linkedin_url:
+        collection.update_one(
+            {"_id": keeper["_id"]},
+            {"$set": {"linkedinUrl": linkedin_url, "updated_at": datetime.utcnow()}}
+        )
+    return {
+        "kept": str(keeper["_id"]),
+        "removed": [str(profile_id) for profile_id in removed_ids],
+        "conflicts": [str(other["_id"]) for other in conflicts],
+        "reembed": reembed,
+    }
+
+
+async def enqueue_reembeds(profiles: List[Tuple[str, str]]):
+    """Queue embed_profile jobs for (profile_id, summary) pairs; the API workers run them."""
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from src.job_queue import JobQueue
+    from src.profile_jobs import enqueue_profile_embedding
+
+    queue = JobQueue(AsyncIOMotorClient(os.getenv("MONGODB_URI"))["UPenn"])
+    for profile_id, summary in profiles:
+        await enqueue_profile_embedding(queue, profile_id, summary)
+
+
+def main():
+    from dotenv import load_dotenv
+    from bson import ObjectId
+    from pymongo import MongoClient
+    from logging_config import configure_logging
+
+    parser = argparse.ArgumentParser(description="Find and optionally merge near-duplicate profiles")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--merge", action="store_true", help="merge each group into one profile")
+    args = parser.parse_args()
+
+    configure_logging()
+    load_dotenv()
+    collection = MongoClient(os.getenv("MONGODB_URI"))["UPenn"]["profilematch"]
+
+    started = time.perf_counter()
+    profiles, matrix = load_profiles(collection)
+    logger.info("Loaded %d profiles in %.1fs", len(profiles), time.perf_counter() - started)
+    groups = find_duplicate_groups(profiles, matrix, args.threshold)
+    logger.info("Found %d duplicate groups in %.1fs", len(groups), time.perf_counter() - started)
+
+    report = []
+    reembeds = []
+    for group in groups:
+        entry = {"profiles": [
+            {
+                "_id": str(profiles[position]["_id"]),
+                "name": profiles[position].get("name"),
+                "email": profiles[position].get("email"),
+                "linkedinUrl": profiles[position].get("linkedinUrl"),
+            }
+            for position in group
+        ]}
+        if args.merge:
+            full_docs = list(collection.find(
+                {"_id": {"$in": [profiles[position]["_id"] for position in group]}},
+                {"raw_linkedin_data": 0, "summary_embedding": 0}
+            ))
+            entry["merge"] = merge_group(collection, full_docs)
+            if entry["merge"]["reembed"]:
+                keeper = collection.find_one({"_id": ObjectId(entry["merge"]["kept"])}, {"summary": 1})
+                reembeds.append((entry["merge"]["kept"], keeper["summary"]))
+        report.append(entry)
+
+    if reembeds:
+        asyncio.run(enqueue_reembeds(reembeds))
+        logger.info("Queued %d re-embeds for merged summaries", len(reembeds))
+    print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
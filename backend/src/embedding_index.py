@@ -0,0 +1,374 @@
+"""
+Memory-mapped embedding index over profilematch.summary_embedding.
+
+The index is a single file laid out as:
+    header (64 bytes) | float32 matrix [count x dim] | ids [count x 24 bytes]
+
+Every uvicorn worker maps the same file read-only, so the matrix lives once
+in the OS page cache no matter how many workers are running. A builder
+process writes a fresh file next to the live one and swaps it in with
+os.replace; workers notice the new inode and remap.
+
+Build or rebuild the index from the backend directory with:
+    python -m src.embedding_index build [path]
+"""
+import asyncio
+import os
+import struct
+import sys
+import threading
+import time
+import logging
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"EMBIDX01"
+VERSION = 1
+HEADER_SIZE = 64
+# magic, version, count, dim, id width, built_at
+HEADER_FORMAT = "<8sIQIId"
+ID_WIDTH = 24  # hex ObjectId
+DEFAULT_INDEX_PATH = "data/embeddings.idx"
+RELOAD_CHECK_INTERVAL = 1.0
+
+
+def _pack_header(count: int, dim: int, built_at: float) -> bytes:
+    header = struct.pack(HEADER_FORMAT, MAGIC, VERSION, count, dim, ID_WIDTH, built_at)
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+def _unpack_header(raw: bytes) -> Tuple[int, int, float]:
+    magic, version, count, dim, id_width, built_at = struct.unpack_from(HEADER_FORMAT, raw)
+    if magic != MAGIC:
+        raise ValueError("Not an embedding index file")
+    if version != VERSION or id_width != ID_WIDTH:
+        raise ValueError(f"Unsupported embedding index version {version}")
+    return count, dim, built_at
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def top_k_rows(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indices of the k highest scores in each row, best first."""
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+class EmbeddingIndex:
+    """Read-only, zero-copy view of an embedding index file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.count, self.dim, self.built_at = _unpack_header(f.read(HEADER_SIZE))
+        self._inode = (stat.st_dev, stat.st_ino)
+
+        matrix_bytes = self.count * self.dim * 4
+        if self.count:
+            self.matrix = np.memmap(path, dtype=np.float32, mode="r",
+                                    offset=HEADER_SIZE, shape=(self.count, self.dim))
+            self._ids = np.memmap(path, dtype=f"S{ID_WIDTH}", mode="r",
+                                  offset=HEADER_SIZE + matrix_bytes, shape=(self.count,))
+        else:
+            self.matrix = np.empty((0, self.dim), dtype=np.float32)
+            self._ids = np.empty(0, dtype=f"S{ID_WIDTH}")
+
+    def is_stale(self) -> bool:
+        """True when a builder has swapped a new file in at our path."""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (stat.st_dev, stat.st_ino) != self._inode
+
+    def id_at(self, row: int) -> str:
+        return self._ids[row].decode("ascii")
+
+    def ids(self) -> List[str]:
+        """Every row's profile ID, in row order."""
+        return [raw.decode("ascii") for raw in self._ids.tolist()]
+
+    def search(self, query_embedding: List[float], limit: int) -> List[Tuple[str, float]]:
+        """Exact dot-product ranking; returns (profile_id, score) best first."""
+        return self.search_many([query_embedding], limit)[0]
+
+    def search_many(self, query_embeddings: List[List[float]], limit: int) -> List[List[Tuple[str, float]]]:
+        """Rank several queries with one matrix-matrix product."""
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        if queries.shape[1] != self.dim:
+            raise ValueError(f"Query has dimension {queries.shape[1]}, index has {self.dim}")
+        scores = queries @ self.matrix.T
+        rows = top_k_rows(scores, limit)
+        return [
+            [(self.id_at(row), float(scores[position, row])) for row in rows[position]]
+            for position in range(len(queries))
+        ]
+
+
+class IndexOverlay:
+    """
+    In-memory changes applied on top of the mapped index between rebuilds.
+
+    Upserted vectors are scored alongside the matrix and shadow any row with
+    the same ID; deleted IDs are filtered out. Entries are dropped once a
+    rebuilt index that already contains them is mapped.
+    """
+
+    def __init__(self):
+        self.upserts: Dict[str, Tuple[np.ndarray, float]] = {}
+        self.deleted: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        # profilematch, set by attach()
+        self.collection = None
+
+    async def on_upsert(self, doc: Dict[str, Any]):
+        profile_id = str(doc["_id"])
+        embedding = doc.get("summary_embedding")
+        if not embedding:
+            # Profiles without an embedding are not searchable
+            await self.on_delete(profile_id)
+            return
+        with self._lock:
+            self.deleted.pop(profile_id, None)
+            self.upserts[profile_id] = (np.asarray(embedding, dtype=np.float32), time.time())
+
+    async def on_delete(self, profile_id: str):
+        with self._lock:
+            self.upserts.pop(profile_id, None)
+            self.deleted[profile_id] = time.time()
+
+    async def on_reset(self):
+        """
+        Events may have been missed (or this process just started, with only
+        the index file to go on): catch up on every change since the mapped
+        index was built.
+        """
+        index = get_embedding_index()
+        if index is None or self.collection is None:
+            return
+        built_at = datetime.utcfromtimestamp(index.built_at)
+        changed = 0
+        async for doc in self.collection.find({"updated_at": {"$gt": built_at}}, {"summary_embedding": 1}):
+            await self.on_upsert(doc)
+            changed += 1
+        live_ids = {str(doc["_id"]) async for doc in self.collection.find({}, {"_id": 1})}
+        indexed_ids = set(await asyncio.to_thread(index.ids))
+        deleted = indexed_ids - live_ids
+        for profile_id in deleted:
+            await self.on_delete(profile_id)
+        logger.info("Index overlay caught up: %d changed, %d deleted since the index was built",
+                    changed, len(deleted))
+
+    def changes(self) -> Tuple[Dict[str, np.ndarray], Set[str]]:
+        """A consistent copy of (upserted vectors by ID, deleted IDs)."""
+        with self._lock:
+            return {k: vector for k, (vector, _) in self.upserts.items()}, set(self.deleted)
+
+    def prune(self, built_at: float):
+        """Forget changes the index built at `built_at` already reflects."""
+        with self._lock:
+            self.upserts = {k: v for k, v in self.upserts.items() if v[1] > built_at}
+            self.deleted = {k: ts for k, ts in self.deleted.items() if ts > built_at}
+
+    def merge(self, index: EmbeddingIndex, query_embedding: List[float], limit: int) -> List[Tuple[str, float]]:
+        return self.merge_many(index, [query_embedding], limit)[0]
+
+    def merge_many(self, index: EmbeddingIndex, query_embeddings: List[List[float]],
+                   limit: int) -> List[List[Tuple[str, float]]]:
+        with self._lock:
+            upserts = dict(self.upserts)
+            masked = set(upserts) | set(self.deleted)
+
+        # Over-fetch by the number of masked IDs so filtering can't starve the page
+        ranked_lists = [
+            [(profile_id, score) for profile_id, score in ranked if profile_id not in masked]
+            for ranked in index.search_many(query_embeddings, limit + len(masked))
+        ]
+        if upserts:
+            live_ids = [profile_id for profile_id, (vector, _) in upserts.items() if vector.shape == (index.dim,)]
+            if live_ids:
+                live_matrix = np.vstack([upserts[profile_id][0] for profile_id in live_ids])
+                live_scores = np.asarray(query_embeddings, dtype=np.float32) @ live_matrix.T
+                for position, ranked in enumerate(ranked_lists):
+                    ranked.extend(zip(live_ids, live_scores[position].tolist()))
+                    ranked.sort(key=lambda item: item[1], reverse=True)
+        return [ranked[:limit] for ranked in ranked_lists]
+
+
+def iter_embeddings(collection) -> Iterable[Tuple[str, List[float]]]:
+    cursor = collection.find(
+        {"summary_embedding": {"$type": "array"}},
+        {"summary_embedding": 1}
+    )
+    for doc in cursor:
+        yield str(doc["_id"]), doc["summary_embedding"]
+
+
+def index_is_current(index: "EmbeddingIndex", collection) -> bool:
+    """
+    Whether the index still matches profilematch (synchronous pymongo): no
+    profile written since it was built, and as many embedded profiles as rows.
+    """
+    built_at = datetime.utcfromtimestamp(index.built_at)
+    if collection.find_one({"updated_at": {"$gt": built_at}}, {"_id": 1}) is not None:
+        return False
+    return collection.count_documents({"summary_embedding": {"$type": "array"}}) == index.count
+
+
+def build_index(rows: Iterable[Tuple[str, List[float]]], path: str) -> int:
+    """
+    Write a new index file from (profile_id, embedding) rows and atomically
+    swap it in at `path`. Returns the number of rows written.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+
+    # Stamp the file with the start time: writes that land mid-build may be
+    # missing from it, so the live overlay must keep them
+    started_at = time.time()
+    ids: List[bytes] = []
+    dim: Optional[int] = None
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(b"\0" * HEADER_SIZE)
+            for profile_id, embedding in rows:
+                if dim is None:
+                    dim = len(embedding)
+                if len(embedding) != dim:
+                    logger.warning("Skipping %s: embedding dimension %d != %d",
+                                   profile_id, len(embedding), dim)
+                    continue
+                f.write(np.asarray(embedding, dtype=np.float32).tobytes())
+                ids.append(profile_id.encode("ascii"))
+            f.write(np.asarray(ids, dtype=f"S{ID_WIDTH}").tobytes())
+            f.seek(0)
+            f.write(_pack_header(len(ids), dim or 0, started_at))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    logger.info("Built embedding index at %s with %d rows (dim=%s)", path, len(ids), dim)
+    return len(ids)
+
+
+def attach(feed):
+    """Feed the overlay from the profile change feed (called from main.py)."""
+    overlay.collection = feed.collection
+    feed.subscribe(overlay)
+
+
+def index_path() -> str:
+    return os.getenv("EMBEDDING_INDEX_PATH", DEFAULT_INDEX_PATH)
+
+
+_index: Optional[EmbeddingIndex] = None
+_last_check = 0.0
+_lock = threading.Lock()
+
+# Fed by the profile change feed (see src/profile_sync.py)
+overlay = IndexOverlay()
+# built_at of the index a dimension mismatch was last logged for
+_mismatch_logged: Optional[float] = None
+
+
+def get_embedding_index() -> Optional[EmbeddingIndex]:
+    """
+    The process-wide index, remapped when a builder swaps in a new file.
+    Returns None when no index has been built, so callers can fall back to
+    the Mongo aggregation.
+    """
+    global _index, _last_check
+    now = time.monotonic()
+    if now - _last_check < RELOAD_CHECK_INTERVAL:
+        return _index
+
+    with _lock:
+        _last_check = now
+        path = index_path()
+        if _index is not None and not _index.is_stale():
+            return _index
+        if not os.path.exists(path):
+            return _index
+        try:
+            _index = EmbeddingIndex(path)
+            overlay.prune(_index.built_at)
+            logger.info("Mapped embedding index %s (%d rows)", path, _index.count)
+        except Exception as e:
+            logger.error("Failed to map embedding index %s: %s", path, e)
+    return _index
+
+
+def _usable_index(query_embeddings: List[List[float]]) -> Optional[EmbeddingIndex]:
+    """
+    The index, or None when it can't answer these queries: none built, built
+    from an empty collection, or a different embedding dimension (e.g. after
+    switching EMBEDDING_PROVIDER). Callers then fall back to Mongo.
+    """
+    global _mismatch_logged
+    index = get_embedding_index()
+    if index is None or index.count == 0:
+        return None
+    if any(len(query) != index.dim for query in query_embeddings):
+        if _mismatch_logged != index.built_at:
+            _mismatch_logged = index.built_at
+            logger.warning("Query dimension doesn't match embedding index dimension %d; "
+                           "searching Mongo until the index is rebuilt", index.dim)
+        return None
+    return index
+
+
+def search_embedding_index(query_embedding: List[float], limit: int) -> Optional[List[Tuple[str, float]]]:
+    """
+    Rank profiles against the mapped index plus any live changes.
+    Returns None when no usable index is available.
+    """
+    index = _usable_index([query_embedding])
+    if index is None:
+        return None
+    return overlay.merge(index, query_embedding, limit)
+
+
+def search_embedding_index_many(query_embeddings: List[List[float]], limit: int) -> Optional[List[List[Tuple[str, float]]]]:
+    """Batch form of search_embedding_index: one matrix product for all queries."""
+    index = _usable_index(query_embeddings)
+    if index is None:
+        return None
+    return overlay.merge_many(index, query_embeddings, limit)
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+
+    if len(sys.argv) < 2 or sys.argv[1] != "build":
+        print("Usage: python -m src.embedding_index build [path]")
+        sys.exit(1)
+
+    load_dotenv()
+    target = sys.argv[2] if len(sys.argv) > 2 else index_path()
+    client = MongoClient(os.getenv("MONGODB_URI"))
+    collection = client["UPenn"]["profilematch"]
+    count = build_index(iter_embeddings(collection), target)
+    print(f"Wrote {count} embeddings to {target}")
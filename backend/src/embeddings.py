@@ -0,0 +1,293 @@
+"""
+Text embeddings for profiles and search queries.
+
+All embedding calls go through an EmbeddingProvider chosen by the
+EMBEDDING_PROVIDER setting:
+  - "voyage" (default): the Voyage AI HTTP API, guarded by src.outbound
+  - "local": a deterministic feature-hashing embedder that runs on the CPU
+    with no network, for load tests and degraded operation
+
+Vectors from different providers are not comparable, so the stored
+summary_embeddings and the query provider must match; rebuild embeddings
+(and the embedding index) when switching providers for real traffic.
+"""
+import asyncio
+import collections
+import logging
+import os
+import random
+import re
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import requests
+from dotenv import load_dotenv
+
+from src.outbound import ProviderUnavailable, voyage
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "voyage-3-large")
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "1024"))
+
+# Hedging and retry settings for latency-sensitive query embeddings
+LATENCY_BUDGET = float(os.getenv("EMBED_LATENCY_BUDGET_SECONDS", "4.0"))
+HEDGE_PERCENTILE = float(os.getenv("EMBED_HEDGE_PERCENTILE", "95"))
+MIN_HEDGE_DELAY = 0.05
+DEFAULT_HEDGE_DELAY = 0.5  # Used until enough latencies have been observed
+MIN_SAMPLES = 20
+BASE_RETRY_DELAY = 0.1
+
+
+class EmbeddingProvider:
+    """Interface for embedding backends. Subclasses implement embed_batch_sync."""
+
+    name = "base"
+
+    def embed_batch_sync(self, texts: List[str]) -> List[List[float]]:
+        raise NotImplementedError
+
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.to_thread(self.embed_batch_sync, texts)
+
+    async def embed(self, text: str) -> List[float]:
+        return (await self.embed_batch([text]))[0]
+
+
+class VoyageProvider(EmbeddingProvider):
+    name = "voyage"
+    API_URL = "https://api.voyageai.com/v1/embeddings"
+    MAX_BATCH = 128  # Voyage's per-request input limit
+
+    def __init__(self, model: str = EMBEDDING_MODEL):
+        self.model = model
+        self.api_key = os.getenv("VOYAGE_API_KEY")
+        if not self.api_key:
+            raise ValueError("VOYAGE_API_KEY environment variable is not set")
+
+    def _request(self, texts: List[str]) -> List[List[float]]:
+        response = requests.post(
+            self.API_URL,
+            headers={
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.api_key}"
+            },
+            json={"input": texts, "model": self.model},
+            timeout=voyage.timeout
+        )
+        response.raise_for_status()
+        data = sorted(response.json()["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+    def embed_batch_sync(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.MAX_BATCH):
+            embeddings.extend(voyage.call_sync(self._request, texts[start:start + self.MAX_BATCH]))
+        return embeddings
+
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.MAX_BATCH):
+            embeddings.extend(await voyage.call_blocking(self._request, texts[start:start + self.MAX_BATCH]))
+        return embeddings
+
+
+class HashingProvider(EmbeddingProvider):
+    """
+    Deterministic CPU embedder: signed feature hashing of word unigrams,
+    bigrams and character trigrams, L2-normalized. Same text, same vector, in
+    every process, with no model files or network.
+    """
+
+    name = "local"
+    TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION):
+        self.dimension = dimension
+
+    def _features(self, text: str) -> List[str]:
+        words = self.TOKEN_PATTERN.findall(text.lower())
+        features = list(words)
+        features.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(f"#3{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    def embed_one(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for feature in self._features(text):
+            digest = zlib.crc32(feature.encode("utf-8"))
+            sign = 1.0 if digest & 0x80000000 else -1.0
+            vector[digest % self.dimension] += sign
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_batch_sync(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_one(text) for text in texts]
+
+    async def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        # Cheap enough that a thread hop would cost more than it saves
+        if sum(len(text) for text in texts) < 20000:
+            return self.embed_batch_sync(texts)
+        return await super().embed_batch(texts)
+
+
+PROVIDER_CLASSES = {
+    VoyageProvider.name: VoyageProvider,
+    HashingProvider.name: HashingProvider,
+}
+
+_provider: Optional[EmbeddingProvider] = None
+
+
+def get_embedding_provider() -> EmbeddingProvider:
+    """The configured provider (EMBEDDING_PROVIDER), created on first use."""
+    global _provider
+    if _provider is None:
+        name = os.getenv("EMBEDDING_PROVIDER", VoyageProvider.name)
+        if name not in PROVIDER_CLASSES:
+            raise ValueError(f"Unknown EMBEDDING_PROVIDER {name!r}; expected one of {sorted(PROVIDER_CLASSES)}")
+        _provider = PROVIDER_CLASSES[name]()
+        logger.info("Using %s embedding provider", name)
+    return _provider
+
+
+async def embed_text(text: str) -> List[float]:
+    """Embed one text without blocking the event loop."""
+    return await get_embedding_provider().embed(text)
+
+
+async def embed_texts(texts: List[str]) -> List[List[float]]:
+    """Embed several texts with as few provider calls as possible."""
+    return await get_embedding_provider().embed_batch(texts)
+
+
+def is_retryable(error: Exception) -> bool:
+    """Rate limits and server errors are worth retrying; bad requests and open circuits aren't."""
+    if isinstance(error, ProviderUnavailable):
+        return error.reason.startswith("no response")
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+class HedgedEmbedder:
+    """
+    Query embeddings with hedging and retries.
+
+    If the first request hasn't answered within the recent p95 latency, a
+    second identical request is issued and whichever answers first wins.
+    Rate-limit and server errors are retried with full-jitter backoff while
+    the latency budget allows.
+    """
+
+    def __init__(self):
+        self.latencies: collections.deque = collections.deque(maxlen=500)
+        self.stats = {
+            "requests": 0,
+            "hedges_fired": 0,
+            "hedge_wins": 0,
+            "retries": 0,
+            "time_saved_seconds": 0.0,
+        }
+
+    def hedge_delay(self) -> float:
+        if len(self.latencies) < MIN_SAMPLES:
+            return DEFAULT_HEDGE_DELAY
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * HEDGE_PERCENTILE / 100))
+        return max(MIN_HEDGE_DELAY, ordered[index])
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "time_saved_seconds": round(self.stats["time_saved_seconds"], 3),
+            "hedge_delay_seconds": round(self.hedge_delay(), 3),
+        }
+
+    def _launch(self, text: str) -> asyncio.Task:
+        started = time.perf_counter()
+        task = asyncio.create_task(embed_text(text))
+
+        def record(done: asyncio.Task):
+            if not done.cancelled() and done.exception() is None:
+                done.latency = time.perf_counter() - started
+                self.latencies.append(done.latency)
+
+        task.add_done_callback(record)
+        return task
+
+    async def _attempt(self, text: str, deadline: float) -> List[float]:
+        primary = self._launch(text)
+        started = time.perf_counter()
+        done, _ = await asyncio.wait({primary}, timeout=min(self.hedge_delay(), max(0.0, deadline - time.monotonic())))
+        if done:
+            return primary.result()
+
+        self.stats["hedges_fired"] += 1
+        hedge = self._launch(text)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(
+                pending,
+                timeout=max(0.0, deadline - time.monotonic()),
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            if not done:
+                break
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                if task is hedge:
+                    self.stats["hedge_wins"] += 1
+                    hedge_finished = time.perf_counter() - started
+
+                    # Credit the saving once we know how long the primary would have taken
+                    def credit(primary_task: asyncio.Task):
+                        latency = getattr(primary_task, "latency", None)
+                        if latency is not None:
+                            self.stats["time_saved_seconds"] += max(0.0, latency - hedge_finished)
+
+                    primary.add_done_callback(credit)
+                else:
+                    # The loser keeps running in its thread; just ignore its result
+                    hedge.add_done_callback(lambda t: t.cancelled() or t.exception())
+                return task.result()
+        # Don't leave "exception never retrieved" warnings behind
+        for task in pending:
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        raise error or ProviderUnavailable("voyage", "embedding latency budget exhausted")
+
+    async def embed(self, text: str) -> List[float]:
+        self.stats["requests"] += 1
+        deadline = time.monotonic() + LATENCY_BUDGET
+        attempt = 0
+        while True:
+            try:
+                return await self._attempt(text, deadline)
+            except Exception as e:
+                attempt += 1
+                # Full jitter: sleep anywhere up to the exponential backoff
+                delay = random.uniform(0, BASE_RETRY_DELAY * 2 ** attempt)
+                if not is_retryable(e) or time.monotonic() + delay >= deadline:
+                    raise
+                self.stats["retries"] += 1
+                logger.debug("Retrying embedding after %s (attempt %d)", e, attempt)
+                await asyncio.sleep(delay)
+
+
+hedged_embedder = HedgedEmbedder()
+
+
+async def embed_query(text: str) -> List[float]:
+    """Embed a search query, hedging and retrying to keep tail latency down."""
+    return await hedged_embedder.embed(text)
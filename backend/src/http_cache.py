@@ -0,0 +1,229 @@
+"""
+HTTP validation caching (ETag / If-None-Match) for profile and search reads.
+
+Profile ETags are derived from the profile's updated_at; search ETags from a
+corpus version (newest updated_at, profile count, index built_at) that is
+the same in every worker, so a revalidation can be answered by any of them.
+Both version sources are kept in memory and fed by the profile change feed,
+so a conditional request whose version is known can be answered with 304
+without touching Mongo. Unknown versions fall through to a normal lookup,
+which records them.
+
+The version map only answers once the change feed is running; if the feed
+reports it may have missed events (on_reset), the map is cleared.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import Response
+
+from src.embedding_index import get_embedding_index
+
+logger = logging.getLogger(__name__)
+
+# Bump when a cached response body changes shape, so old ETags stop matching
+RESPONSE_VERSION = "2"
+MAX_TRACKED_PROFILES = int(os.getenv("ETAG_MAX_TRACKED_PROFILES", "100000"))
+
+PROFILE_CACHE_CONTROL = "private, no-cache"
+SEARCH_CACHE_CONTROL = "private, max-age=30, must-revalidate"
+
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.sha1("\x1f".join(map(str, (RESPONSE_VERSION, *parts))).encode("utf-8")).hexdigest()
+    return f'"{digest[:20]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    """If-None-Match uses weak comparison, so a W/ prefix is ignored."""
+    if not if_none_match or not etag:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+    return False
+
+
+def cache_headers(etag: str, cache_control: str, vary: Optional[str] = None) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if vary:
+        headers["Vary"] = vary
+    return headers
+
+
+def not_modified(etag: str, cache_control: str, vary: Optional[str] = None) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag, cache_control, vary))
+
+
+def profile_etag(email: str, updated_at: datetime) -> str:
+    return make_etag("profile", email, updated_at.isoformat())
+
+
+class ProfileVersions:
+    """email -> updated_at for recently served profiles, kept current by the change feed."""
+
+    def __init__(self):
+        self.feed = None
+        # email -> (updated_at, profile_id), least recently served first
+        self._versions: "OrderedDict[str, Tuple[datetime, str]]" = OrderedDict()
+        self._emails_by_id: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    @property
+    def live(self) -> bool:
+        return self.feed is not None and self.feed.mode is not None
+
+    def record(self, profile_id: str, email: Optional[str], updated_at: Optional[datetime]):
+        if not email or updated_at is None:
+            return
+        with self._lock:
+            current = self._versions.get(email)
+            # A change feed event may already have recorded a newer version
+            if current is not None and current[0] > updated_at:
+                return
+            self._versions[email] = (updated_at, profile_id)
+            self._versions.move_to_end(email)
+            self._emails_by_id[profile_id] = email
+            while len(self._versions) > MAX_TRACKED_PROFILES:
+                _, (_, evicted_id) = self._versions.popitem(last=False)
+                self._emails_by_id.pop(evicted_id, None)
+
+    def forget(self, email: str):
+        with self._lock:
+            entry = self._versions.pop(email, None)
+            if entry is not None:
+                self._emails_by_id.pop(entry[1], None)
+
+    def etag(self, email: Optional[str]) -> Optional[str]:
+        """The current ETag for `email`'s profile, if it is known without a lookup."""
+        if not email or not self.live:
+            return None
+        entry = self._versions.get(email)
+        if entry is None:
+            return None
+        self.hits += 1
+        return profile_etag(email, entry[0])
+
+    def stats(self) -> Dict[str, Any]:
+        return {"tracked": len(self._versions), "hits": self.hits, "live": self.live}
+
+    async def on_upsert(self, doc: Dict[str, Any]):
+        email = self._emails_by_id.get(doc["_id"])
+        if email is None:
+            return  # Not tracked; recorded when it is next served
+        if doc.get("email") != email or doc.get("updated_at") is None:
+            self.forget(email)
+            return
+        with self._lock:
+            if email in self._versions:
+                self._versions[email] = (doc["updated_at"], doc["_id"])
+
+    async def on_delete(self, profile_id: str):
+        email = self._emails_by_id.get(profile_id)
+        if email is not None:
+            self.forget(email)
+
+    async def on_reset(self):
+        with self._lock:
+            self._versions.clear()
+            self._emails_by_id.clear()
+
+
+class CorpusVersion:
+    """A version for search results, the same in every worker process.
+
+    Built from shared state only: the newest profile updated_at, the profile
+    count (so deletes change it too) and the embedding index's built_at. The
+    Mongo part is read once and cached; a profile change clears it, and
+    searches get no ETag until it has been read again.
+    """
+
+    def __init__(self):
+        self.feed = None
+        self.warm_cache = None
+        self.value: Optional[Tuple[str, int]] = None
+        self._changes = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def read(self) -> Tuple[str, int]:
+        collection = self.feed.collection
+        latest = await collection.find_one({}, {"updated_at": 1}, sort=[("updated_at", -1)])
+        updated_at = latest.get("updated_at") if latest else None
+        return (updated_at.isoformat() if updated_at else "", await collection.estimated_document_count())
+
+    async def _refresh(self):
+        while self.value is None:
+            changes = self._changes
+            try:
+                value = await self.read()
+            except Exception as e:
+                logger.warning("Failed to read corpus version: %s", e)
+                return
+            # A change that arrived during the read may not be reflected in it
+            if changes == self._changes:
+                self.value = value
+
+    def _schedule_refresh(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._refresh())
+
+    def current(self) -> Optional[Tuple[Any, ...]]:
+        if self.value is None:
+            return None
+        index = get_embedding_index()
+        return (*self.value, index.built_at if index is not None else 0)
+
+    def search_etag(self, query: str, offset: int) -> Optional[str]:
+        """None until the change feed is running and the version has been read."""
+        if self.feed is None or self.feed.mode is None:
+            return None
+        # Warm rankings from before the latest change would be served under the new version
+        if self.warm_cache is not None and self.warm_cache.stale:
+            return None
+        version = self.current()
+        if version is None:
+            self._schedule_refresh()
+            return None
+        return make_etag("search", *version, " ".join(query.lower().split()), offset)
+
+    def invalidate(self):
+        self.value = None
+        self._changes += 1
+        if self.feed is not None and self.feed.mode is not None:
+            self._schedule_refresh()
+
+    async def on_upsert(self, doc: Dict[str, Any]):
+        self.invalidate()
+
+    async def on_delete(self, profile_id: str):
+        self.invalidate()
+
+    async def on_reset(self):
+        self.invalidate()
+
+
+profile_versions = ProfileVersions()
+corpus_version = CorpusVersion()
+
+
+def attach(feed, warm_cache):
+    """Feed both version sources from the profile change feed (called from main.py)."""
+    profile_versions.feed = feed
+    corpus_version.feed = feed
+    corpus_version.warm_cache = warm_cache
+    feed.subscribe(profile_versions)
+    feed.subscribe(corpus_version)
+
+
+def stats() -> Dict[str, Any]:
+    return {"profiles": profile_versions.stats(), "corpus_version": corpus_version.current()}
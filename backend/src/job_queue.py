@@ -0,0 +1,178 @@
+"""
+Durable background job queue stored in the Mongo `jobs` collection.
+
+Request handlers enqueue work and return immediately; worker tasks in every
+API process claim jobs with an atomic find_one_and_update, so each job runs
+once even with several uvicorn workers. A claimed job holds a lease; if its
+worker dies the lease expires and another worker picks it up.
+
+Jobs carry an idempotency key (unique index): enqueueing the same key twice
+while the first job is still pending is a no-op. Failed jobs are retried
+with exponential backoff up to max_attempts.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+WORKER_COUNT = int(os.getenv("JOB_WORKERS", "2"))
+POLL_INTERVAL = 1.0
+LEASE = timedelta(minutes=2)
+MAX_ATTEMPTS = 5
+BASE_RETRY_DELAY = 2.0
+
+Handler = Callable[[Dict[str, Any]], Awaitable[None]]
+GiveUpHandler = Callable[[Dict[str, Any], str], Awaitable[None]]
+
+
+class JobQueue:
+    def __init__(self, db):
+        self.collection = db.jobs
+        self.handlers: Dict[str, Handler] = {}
+        self.give_up_handlers: Dict[str, GiveUpHandler] = {}
+        self._wakeup = asyncio.Event()
+        self._workers = []
+
+    def register(self, job_type: str, handler: Handler, on_give_up: Optional[GiveUpHandler] = None):
+        """Register the coroutine that runs jobs of `job_type`.
+
+        `on_give_up(payload, error)` runs once a job has failed for the last time.
+        """
+        self.handlers[job_type] = handler
+        if on_give_up is not None:
+            self.give_up_handlers[job_type] = on_give_up
+
+    async def enqueue(self, job_type: str, payload: Dict[str, Any], idempotency_key: str,
+                      max_attempts: int = MAX_ATTEMPTS) -> str:
+        """Queue a job unless one with the same key is already pending. Returns the job ID."""
+        now = datetime.utcnow()
+        job = {
+            "type": job_type,
+            "payload": payload,
+            "idempotency_key": idempotency_key,
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": max_attempts,
+            "run_after": now,
+            "created_at": now,
+            "updated_at": now,
+        }
+        try:
+            result = await self.collection.insert_one(job)
+            job_id = str(result.inserted_id)
+        except DuplicateKeyError:
+            # Re-queue a finished job with the same key; leave pending ones alone
+            existing = await self.collection.find_one_and_update(
+                {"idempotency_key": idempotency_key, "status": {"$in": ["done", "failed"]}},
+                {"$set": {**job, "created_at": now}},
+                return_document=ReturnDocument.AFTER
+            )
+            if existing is None:
+                existing = await self.collection.find_one({"idempotency_key": idempotency_key}, {"_id": 1})
+            job_id = str(existing["_id"])
+        self._wakeup.set()
+        return job_id
+
+    def start(self, worker_count: int = WORKER_COUNT):
+        if self._workers:
+            return
+        self._workers = [asyncio.create_task(self._work()) for _ in range(worker_count)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def ensure_indexes(self):
+        await self.collection.create_index("idempotency_key", unique=True)
+        await self.collection.create_index([("status", 1), ("run_after", 1)])
+
+    async def _claim(self) -> Optional[Dict[str, Any]]:
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {
+                "type": {"$in": list(self.handlers)},
+                "$or": [
+                    {"status": "queued", "run_after": {"$lte": now}},
+                    # Lease expired: the worker that claimed it is gone
+                    {"status": "running", "locked_until": {"$lt": now}},
+                ]
+            },
+            {
+                "$set": {"status": "running", "locked_until": now + LEASE, "updated_at": now},
+                "$inc": {"attempts": 1}
+            },
+            sort=[("run_after", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _work(self):
+        while True:
+            try:
+                job = await self._claim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Failed to claim job: %s", e)
+                job = None
+
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # A failed status write or give-up handler must not end this
+                # worker; the job's lease expires and it is picked up again
+                logger.error("Job %s (%s) bookkeeping failed: %s", job["_id"], job["type"], e)
+
+    async def _run(self, job: Dict[str, Any]):
+        job_type = job["type"]
+        try:
+            await self.handlers[job_type](job["payload"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            error = str(e)
+            now = datetime.utcnow()
+            if job["attempts"] >= job["max_attempts"]:
+                logger.error("Job %s (%s) failed permanently: %s", job["_id"], job_type, error)
+                await self.collection.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {"status": "failed", "last_error": error, "updated_at": now}}
+                )
+                give_up = self.give_up_handlers.get(job_type)
+                if give_up is not None:
+                    await give_up(job["payload"], error)
+            else:
+                delay = BASE_RETRY_DELAY * 2 ** (job["attempts"] - 1)
+                logger.warning("Job %s (%s) failed, retrying in %.0fs: %s", job["_id"], job_type, delay, error)
+                await self.collection.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {
+                        "status": "queued",
+                        "last_error": error,
+                        "run_after": now + timedelta(seconds=delay),
+                        "updated_at": now
+                    }}
+                )
+            return
+
+        await self.collection.update_one(
+            {"_id": job["_id"]},
+            {"$set": {"status": "done", "updated_at": datetime.utcnow()}, "$unset": {"locked_until": ""}}
+        )
@@ -0,0 +1,189 @@
+"""
+Precomputed k-nearest-neighbour graph over profile embeddings.
+
+Each profile gets one document in the profile_knn collection:
+    {"_id": ObjectId, "neighbors": [{"id": ObjectId, "score": float}, ...], "updated_at": datetime}
+with neighbours sorted best first, so "similar alumni" is a single _id lookup.
+
+The batch job scores the whole corpus in row chunks (chunk x N matrix
+products against the memory-mapped index) and writes the graph with bulk
+upserts. Between batch runs KnnGraphUpdater keeps the graph current from the
+profile change feed.
+
+Rebuild the graph from the backend directory with:
+    python -m src.knn_graph build [k] [--rebuild-index]
+The embedding index is rebuilt first if it is missing or older than the
+latest profile change.
+"""
+import hashlib
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List
+
+import numpy as np
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+
+from src.embedding_index import EmbeddingIndex, search_embedding_index, top_k_rows
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_K = int(os.getenv("KNN_GRAPH_K", "20"))
+CHUNK_SIZE = 256  # 256 x 100k float32 scores is ~100 MB per chunk
+WRITE_BATCH_SIZE = 1000
+
+
+def build_knn_graph(index: EmbeddingIndex, collection, k: int = DEFAULT_K) -> int:
+    """Compute every profile's top-k neighbours and upsert them. Returns rows written."""
+    if index.count < 2:
+        return 0
+
+    k = min(k, index.count - 1)
+    collection.create_index("neighbors.id")
+    now = datetime.utcnow()
+    ids = [ObjectId(index.id_at(row)) for row in range(index.count)]
+    operations = []
+    written = 0
+
+    for start in range(0, index.count, CHUNK_SIZE):
+        end = min(start + CHUNK_SIZE, index.count)
+        scores = index.matrix[start:end] @ index.matrix.T
+        # A profile is not its own neighbour
+        scores[np.arange(end - start), np.arange(start, end)] = -np.inf
+        neighbours = top_k_rows(scores, k)
+
+        for offset, row in enumerate(range(start, end)):
+            operations.append(ReplaceOne(
+                {"_id": ids[row]},
+                {
+                    "neighbors": [
+                        {"id": ids[col], "score": float(scores[offset, col])}
+                        for col in neighbours[offset]
+                    ],
+                    "updated_at": now
+                },
+                upsert=True
+            ))
+            if len(operations) >= WRITE_BATCH_SIZE:
+                collection.bulk_write(operations, ordered=False)
+                written += len(operations)
+                operations = []
+
+        logger.info("kNN graph: %d/%d rows", end, index.count)
+
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+        written += len(operations)
+
+    # Drop rows for profiles that no longer exist. Rows the live updater
+    # wrote after the index snapshot was taken are kept.
+    collection.delete_many({"updated_at": {"$lt": datetime.utcfromtimestamp(index.built_at)}})
+    return written
+
+
+class KnnGraphUpdater:
+    """Change-feed subscriber that patches the graph around changed profiles.
+
+    Every API worker runs one, so each write is safe to apply more than
+    once and in any interleaving: the neighbour-row update is a single
+    pipeline update, and the profile's own row records a hash of the
+    embedding it was ranked with so unchanged embeddings are skipped.
+    The pipeline update uses $sortArray (MongoDB 5.2+).
+    """
+
+    def __init__(self, db, k: int = DEFAULT_K):
+        self.collection = db.profile_knn
+        self.k = k
+
+    @staticmethod
+    def embedding_hash(embedding: List[float]) -> str:
+        return hashlib.sha1(np.asarray(embedding, dtype=np.float32).tobytes()).hexdigest()
+
+    def _offer(self, row_id: ObjectId, profile_id: ObjectId, score: float) -> UpdateOne:
+        """Replace profile_id's entry in row_id's list, re-sort and keep the top k, atomically."""
+        others = {"$filter": {
+            "input": {"$ifNull": ["$neighbors", []]},
+            "cond": {"$ne": ["$$this.id", profile_id]}
+        }}
+        return UpdateOne({"_id": row_id}, [{"$set": {"neighbors": {"$slice": [
+            {"$sortArray": {
+                "input": {"$concatArrays": [others, [{"id": profile_id, "score": score}]]},
+                "sortBy": {"score": -1}
+            }},
+            self.k
+        ]}}}])
+
+    async def on_upsert(self, doc: Dict[str, Any]):
+        embedding = doc.get("summary_embedding")
+        if not embedding:
+            await self.on_delete(doc["_id"])
+            return
+
+        profile_id = ObjectId(doc["_id"])
+        digest = self.embedding_hash(embedding)
+        current = await self.collection.find_one({"_id": profile_id}, {"embedding_hash": 1})
+        if current is not None and current.get("embedding_hash") == digest:
+            # Edit that didn't touch the embedding
+            return
+
+        ranked = search_embedding_index(embedding, self.k + 1)
+        if ranked is None:
+            return
+        neighbours = [
+            {"id": ObjectId(neighbour_id), "score": score}
+            for neighbour_id, score in ranked
+            if neighbour_id != str(doc["_id"])
+        ][:self.k]
+        neighbour_ids = [neighbour["id"] for neighbour in neighbours]
+
+        # Rows that listed the profile under its old embedding drop it
+        await self.collection.update_many(
+            {"neighbors.id": profile_id, "_id": {"$nin": neighbour_ids}},
+            {"$pull": {"neighbors": {"id": profile_id}}}
+        )
+        operations = [self._offer(neighbour["id"], profile_id, neighbour["score"]) for neighbour in neighbours]
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+        # Written last, so a crash part-way leaves the hash unset and the next event redoes it
+        await self.collection.replace_one(
+            {"_id": profile_id},
+            {"neighbors": neighbours, "embedding_hash": digest, "updated_at": datetime.utcnow()},
+            upsert=True
+        )
+
+    async def on_delete(self, profile_id: str):
+        object_id = ObjectId(profile_id)
+        await self.collection.delete_one({"_id": object_id})
+        await self.collection.update_many(
+            {"neighbors.id": object_id},
+            {"$pull": {"neighbors": {"id": object_id}}}
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+    from dotenv import load_dotenv
+    from pymongo import MongoClient
+    from src.embedding_index import build_index, index_is_current, index_path, iter_embeddings
+
+    parser = argparse.ArgumentParser(description="Rebuild the kNN graph")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("k", type=int, nargs="?", default=DEFAULT_K)
+    parser.add_argument("--rebuild-index", action="store_true",
+                        help="rebuild the embedding index first even if it looks current")
+    args = parser.parse_args()
+    if args.k <= 0:
+        parser.error("k must be positive")
+
+    load_dotenv()
+    client = MongoClient(os.getenv("MONGODB_URI"))
+    db = client["UPenn"]
+    path = index_path()
+    # A stale index would rebuild the graph from outdated embeddings
+    if args.rebuild_index or not os.path.exists(path) or not index_is_current(EmbeddingIndex(path), db["profilematch"]):
+        print(f"Rebuilding embedding index at {path}")
+        build_index(iter_embeddings(db["profilematch"]), path)
+    count = build_knn_graph(EmbeddingIndex(path), db["profile_knn"], args.k)
+    print(f"Wrote {count} kNN rows (k={args.k})")
@@ -0,0 +1,237 @@
+"""
+Shared guard for calls to external providers (Voyage, Gemini, RapidAPI,
+LinkedIn's image CDN).
+
+Each provider gets a ProviderGuard that applies:
+  - admission control: at most `max_concurrency` calls in flight; callers
+    wait up to `queue_timeout` for a slot and are rejected after that
+  - a deadline on every call; for streaming calls it covers the whole
+    stream, and the slot stays taken until the stream ends
+  - a circuit breaker: after `failure_threshold` consecutive failures the
+    provider is short-circuited for `reset_timeout` seconds, then a single
+    trial call decides whether to close the circuit again
+
+Rejected and short-circuited calls raise ProviderUnavailable immediately so
+callers can fall back (lexical search, 503) instead of queueing behind a
+slow provider.
+
+Limits are configurable per provider, e.g. OUTBOUND_VOYAGE_CONCURRENCY,
+OUTBOUND_VOYAGE_TIMEOUT.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, TypeVar
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class ProviderUnavailable(Exception):
+    """The provider was not called: it is overloaded or its circuit is open."""
+
+    def __init__(self, provider: str, reason: str):
+        super().__init__(f"{provider} unavailable: {reason}")
+        self.provider = provider
+        self.reason = reason
+
+
+def _env(provider: str, setting: str, default: float) -> float:
+    return float(os.getenv(f"OUTBOUND_{provider.upper()}_{setting}", default))
+
+
+class ProviderGuard:
+    def __init__(self, name: str, max_concurrency: int, timeout: float,
+                 queue_timeout: float = 0.5, failure_threshold: int = 5,
+                 reset_timeout: float = 30.0):
+        self.name = name
+        self.max_concurrency = int(_env(name, "CONCURRENCY", max_concurrency))
+        self.timeout = _env(name, "TIMEOUT", timeout)
+        self.queue_timeout = _env(name, "QUEUE_TIMEOUT", queue_timeout)
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._async_slots = asyncio.Semaphore(self.max_concurrency)
+        self._sync_slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self.metrics = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "timeouts": 0,
+            "rejected": 0,
+            "short_circuited": 0,
+        }
+
+    @property
+    def state(self) -> str:
+        if self._consecutive_failures < self.failure_threshold:
+            return "closed"
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def stats(self) -> Dict[str, Any]:
+        return {"state": self.state, "max_concurrency": self.max_concurrency,
+                "timeout": self.timeout, **self.metrics}
+
+    def _admit(self) -> bool:
+        """Circuit check; returns True if this call is the half-open trial."""
+        with self._lock:
+            state = self.state
+            if state == "open" or (state == "half_open" and self._trial_in_flight):
+                self.metrics["short_circuited"] += 1
+                raise ProviderUnavailable(self.name, "circuit open")
+            if state == "half_open":
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def _record(self, success: bool, timed_out: bool = False, trial: bool = False):
+        with self._lock:
+            self.metrics["calls"] += 1
+            if trial:
+                self._trial_in_flight = False
+            if success:
+                self.metrics["successes"] += 1
+                self._consecutive_failures = 0
+                return
+            self.metrics["timeouts" if timed_out else "failures"] += 1
+            self._consecutive_failures += 1
+            if self._consecutive_failures >= self.failure_threshold:
+                if trial or self._consecutive_failures == self.failure_threshold:
+                    logger.warning("Opening circuit for %s after %d failures",
+                                   self.name, self._consecutive_failures)
+                self._opened_at = time.monotonic()
+
+    def _reject(self):
+        with self._lock:
+            self.metrics["rejected"] += 1
+        raise ProviderUnavailable(self.name, "too many concurrent calls")
+
+    def _abandon(self, trial: bool):
+        """The call ended without a verdict on the provider (cancelled or rejected)."""
+        if trial:
+            with self._lock:
+                self._trial_in_flight = False
+
+    async def _acquire(self, trial: bool):
+        try:
+            await asyncio.wait_for(self._async_slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(trial)
+            self._reject()
+        except BaseException:
+            # Cancelled while waiting for a slot
+            self._abandon(trial)
+            raise
+
+    async def call(self, fn: Callable[..., Awaitable[T]], *args, **kwargs) -> T:
+        """Run an async provider call under this guard."""
+        trial = self._admit()
+        await self._acquire(trial)
+        try:
+            result = await asyncio.wait_for(fn(*args, **kwargs), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self._record(False, timed_out=True, trial=trial)
+            raise ProviderUnavailable(self.name, f"no response within {self.timeout}s")
+        except Exception:
+            self._record(False, trial=trial)
+            raise
+        except BaseException:
+            # Cancelled (a hedged loser, a client that went away): otherwise
+            # the trial flag would stay set and the circuit never close
+            self._abandon(trial)
+            raise
+        finally:
+            self._async_slots.release()
+        self._record(True, trial=trial)
+        return result
+
+    async def stream(self, fn: Callable[..., Awaitable[AsyncIterator[T]]], *args, **kwargs) -> AsyncIterator[T]:
+        """Run a streaming provider call under this guard, yielding its items.
+
+        The slot is held and the deadline runs until the stream is exhausted
+        (or the caller stops reading), not just until the first response
+        object comes back.
+        """
+        trial = self._admit()
+        await self._acquire(trial)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        recorded = False
+        try:
+            response = await asyncio.wait_for(fn(*args, **kwargs), timeout=self.timeout)
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(0.0, deadline - loop.time()))
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        except asyncio.TimeoutError:
+            recorded = True
+            self._record(False, timed_out=True, trial=trial)
+            raise ProviderUnavailable(self.name, f"stream not finished within {self.timeout}s")
+        except Exception:
+            recorded = True
+            self._record(False, trial=trial)
+            raise
+        else:
+            recorded = True
+            self._record(True, trial=trial)
+        finally:
+            self._async_slots.release()
+            if not recorded:
+                # Cancelled, or the caller stopped reading
+                self._abandon(trial)
+
+    async def call_blocking(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run a blocking SDK call in a thread under this guard.
+
+        On timeout the caller is released but the thread runs to completion.
+        """
+        return await self.call(asyncio.to_thread, fn, *args, **kwargs)
+
+    def call_sync(self, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Guard for synchronous code paths (batch scripts, ProfileSearch).
+
+        The deadline is enforced by passing `timeout` to the HTTP client,
+        so only circuit breaking and admission control apply here.
+        """
+        trial = self._admit()
+        if not self._sync_slots.acquire(timeout=self.queue_timeout):
+            self._abandon(trial)
+            self._reject()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._record(False, timed_out="timed out" in str(e).lower(), trial=trial)
+            raise
+        finally:
+            self._sync_slots.release()
+        self._record(True, trial=trial)
+        return result
+
+
+voyage = ProviderGuard("voyage", max_concurrency=16, timeout=10.0)
+gemini = ProviderGuard("gemini", max_concurrency=8, timeout=30.0)
+rapidapi = ProviderGuard("rapidapi", max_concurrency=4, timeout=15.0)
+# LinkedIn's image CDN, for profile photo thumbnails
+photos = ProviderGuard("photos", max_concurrency=8, timeout=10.0, queue_timeout=2.0)
+
+PROVIDERS = {guard.name: guard for guard in (voyage, gemini, rapidapi, photos)}
+
+
+def outbound_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: guard.stats() for name, guard in PROVIDERS.items()}
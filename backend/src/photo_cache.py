@@ -0,0 +1,306 @@
+"""
+Thumbnail cache for profile photos.
+
+Profile photoUrls point at LinkedIn's CDN: slow, full resolution, and they
+expire. PhotoCache fetches each photoUrl once, stores square WebP thumbnails
+on disk and evicts least recently used files once the cache exceeds
+PHOTO_CACHE_MAX_BYTES.
+
+Thumbnails are addressed by profile ID, size and a short hash of the
+photoUrl, so a changed photo gets a new URL and every URL can be cached by
+browsers forever:
+
+    /api/photos/{profile_id}/{size}?v={url_hash}
+
+Search responses carry these URLs as `photoThumbUrl`, and the search
+endpoints prefetch thumbnails for the page they return so they are usually
+on disk before the browser asks.
+
+photoUrl is user-supplied, so only https URLs on PHOTO_ALLOWED_HOSTS (the
+LinkedIn CDN) are fetched, hosts resolving to non-public addresses are
+refused, and redirects are not followed.
+
+Every uvicorn worker shares the cache directory but keeps its own LRU
+index. Each process rescans the directory every RESCAN_INTERVAL so its
+eviction accounts for the other workers' files, and a lookup checks the
+file is still on disk before serving it.
+"""
+import asyncio
+import hashlib
+import io
+import ipaddress
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Set
+from urllib.parse import urlsplit
+
+import requests
+from PIL import Image, ImageOps
+
+from src.outbound import photos as photo_guard
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(os.getenv("PHOTO_CACHE_DIR", "data/photos"))
+MAX_BYTES = int(os.getenv("PHOTO_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+MAX_FILES = int(os.getenv("PHOTO_CACHE_MAX_FILES", "50000"))
+SIZES = (64, 128, 256)
+DEFAULT_SIZE = 128
+PREFETCH_SIZE = DEFAULT_SIZE
+MAX_SOURCE_BYTES = 10 * 1024 * 1024
+WEBP_QUALITY = 80
+RESCAN_INTERVAL = 60.0
+ALLOWED_HOSTS = frozenset(
+    host.strip().lower() for host in os.getenv(
+        "PHOTO_ALLOWED_HOSTS",
+        "media.licdn.com,media-exp1.licdn.com,media-exp2.licdn.com,media-exp3.licdn.com,static.licdn.com"
+    ).split(",") if host.strip()
+)
+
+
+class PhotoUnavailable(Exception):
+    """The source photo couldn't be fetched or decoded."""
+
+
+def url_hash(photo_url: str) -> str:
+    return hashlib.sha1(photo_url.encode("utf-8")).hexdigest()[:12]
+
+
+def is_allowed_photo_url(photo_url: str) -> bool:
+    """An https URL on an allowed photo host, with no credentials or custom port."""
+    try:
+        parts = urlsplit(photo_url)
+        port = parts.port
+    except ValueError:
+        return False
+    return (parts.scheme == "https" and (parts.hostname or "").lower() in ALLOWED_HOSTS
+            and not parts.username and port in (None, 443))
+
+
+def check_public_host(host: str):
+    """Refuse hosts that resolve to private, loopback, link-local or otherwise non-public addresses."""
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, 443, proto=socket.IPPROTO_TCP)}
+    except socket.gaierror as e:
+        raise PhotoUnavailable(f"can't resolve {host}: {e}")
+    for address in addresses:
+        if not ipaddress.ip_address(address.split("%")[0]).is_global:
+            raise PhotoUnavailable(f"{host} resolves to non-public address {address}")
+
+
+def thumbnail_url(profile: Dict[str, Any], size: int = DEFAULT_SIZE) -> Optional[str]:
+    photo_url = profile.get("photoUrl")
+    if not photo_url or not profile.get("_id") or not is_allowed_photo_url(photo_url):
+        return None
+    return f"/api/photos/{profile['_id']}/{size}?v={url_hash(photo_url)}"
+
+
+def make_thumbnail(data: bytes, size: int) -> bytes:
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+    except Exception as e:
+        raise PhotoUnavailable(f"undecodable image: {e}")
+    thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    output = io.BytesIO()
+    thumbnail.save(output, "WEBP", quality=WEBP_QUALITY, method=4)
+    return output.getvalue()
+
+
+class PhotoCache:
+    def __init__(self, directory: Path = CACHE_DIR, max_bytes: int = MAX_BYTES, max_files: int = MAX_FILES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        # filename -> size in bytes, least recently used first
+        self._files: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._prefetching: Set[asyncio.Task] = set()
+        self._loaded = False
+        self._loading: Optional[asyncio.Task] = None
+        self._last_scan = 0.0
+        self.stats = {"hits": 0, "misses": 0, "fetch_errors": 0, "evictions": 0, "prefetched": 0}
+
+    def _scan(self):
+        """Merge the directory into the index: files other workers wrote go in as
+        least recently used (oldest access first), vanished ones are dropped."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        on_disk = {}
+        for path in self.directory.glob("*.webp"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            on_disk[path.name] = (stat.st_atime, stat.st_size)
+        with self._lock:
+            known = [(name, on_disk[name][1]) for name in self._files if name in on_disk]
+            unknown = sorted((atime, name, size) for name, (atime, size) in on_disk.items() if name not in self._files)
+            self._files = OrderedDict([(name, size) for _, name, size in unknown] + known)
+            self._total_bytes = sum(self._files.values())
+            self._last_scan = time.monotonic()
+        self._evict()
+
+    def _load(self):
+        if not self._loaded:
+            self._scan()
+            self._loaded = True
+
+    async def ensure_loaded(self):
+        """Index existing files on first use, off the event loop."""
+        if self._loaded:
+            return
+        if self._loading is None:
+            self._loading = asyncio.create_task(asyncio.to_thread(self._load))
+        try:
+            await asyncio.shield(self._loading)
+        except Exception:
+            self._loading = None
+            raise
+
+    @staticmethod
+    def filename(profile_id: str, version: str, size: int) -> str:
+        return f"{profile_id}_{version}_{size}.webp"
+
+    def path_for(self, name: str) -> Path:
+        return self.directory / name
+
+    def lookup(self, profile_id: str, version: str, size: int) -> Optional[Path]:
+        """The cached thumbnail's path, marking it recently used, or None.
+
+        Misses until the index has loaded (see ensure_loaded).
+        """
+        name = self.filename(profile_id, version, size)
+        path = self.path_for(name)
+        with self._lock:
+            if name not in self._files:
+                self.stats["misses"] += 1
+                return None
+            # Another worker may have evicted it
+            if not path.exists():
+                self._total_bytes -= self._files.pop(name)
+                self.stats["misses"] += 1
+                return None
+            self._files.move_to_end(name)
+            self.stats["hits"] += 1
+        return path
+
+    def _store(self, name: str, data: bytes):
+        path = self.path_for(name)
+        # A temp file of our own: other workers (and threads) may be writing
+        # the same thumbnail, and the rename must only ever publish a whole file
+        tmp = tempfile.NamedTemporaryFile(dir=self.directory, prefix=f"{name}.", suffix=".tmp", delete=False)
+        try:
+            with tmp:
+                tmp.write(data)
+            os.replace(tmp.name, path)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+        with self._lock:
+            self._total_bytes += len(data) - self._files.get(name, 0)
+            self._files[name] = len(data)
+            self._files.move_to_end(name)
+            rescan = time.monotonic() - self._last_scan > RESCAN_INTERVAL
+        if rescan:
+            self._scan()
+        else:
+            self._evict()
+
+    def _evict(self):
+        with self._lock:
+            victims = []
+            while self._files and (self._total_bytes > self.max_bytes or len(self._files) > self.max_files):
+                name, size = self._files.popitem(last=False)
+                self._total_bytes -= size
+                victims.append(name)
+            self.stats["evictions"] += len(victims)
+        for name in victims:
+            try:
+                self.path_for(name).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _fetch_and_resize(self, photo_url: str, name: str, size: int):
+        if not is_allowed_photo_url(photo_url):
+            raise PhotoUnavailable("photo host not allowed")
+        check_public_host(urlsplit(photo_url).hostname)
+        with requests.get(photo_url, timeout=photo_guard.timeout, stream=True, allow_redirects=False) as response:
+            if response.status_code != 200:
+                raise PhotoUnavailable(f"source returned {response.status_code}")
+            data = response.raw.read(MAX_SOURCE_BYTES + 1, decode_content=True)
+        if len(data) > MAX_SOURCE_BYTES:
+            raise PhotoUnavailable("source image too large")
+        self._store(name, make_thumbnail(data, size))
+
+    async def get(self, profile_id: str, photo_url: str, size: int) -> Path:
+        """The thumbnail for `photo_url`, fetching it if needed. Concurrent callers share one fetch."""
+        if not is_allowed_photo_url(photo_url):
+            raise PhotoUnavailable("photo host not allowed")
+        await self.ensure_loaded()
+        version = url_hash(photo_url)
+        path = self.lookup(profile_id, version, size)
+        if path is not None:
+            return path
+
+        name = self.filename(profile_id, version, size)
+        task = self._in_flight.get(name)
+        if task is None:
+            # Its own task, so a client disconnecting doesn't abort a fetch others wait on
+            task = asyncio.create_task(self._fetch(photo_url, name, size))
+            self._in_flight[name] = task
+            task.add_done_callback(lambda done: self._finished(name, done))
+        return await asyncio.shield(task)
+
+    def _finished(self, name: str, task: asyncio.Task):
+        self._in_flight.pop(name, None)
+        # Mark the error retrieved even if every waiter went away
+        if not task.cancelled():
+            task.exception()
+
+    async def _fetch(self, photo_url: str, name: str, size: int) -> Path:
+        try:
+            await photo_guard.call_blocking(self._fetch_and_resize, photo_url, name, size)
+        except Exception:
+            self.stats["fetch_errors"] += 1
+            raise
+        return self.path_for(name)
+
+    def prefetch(self, profiles: Iterable[Dict[str, Any]], size: int = PREFETCH_SIZE):
+        """Start fetching thumbnails for `profiles` in the background."""
+        for profile in profiles:
+            photo_url, profile_id = profile.get("photoUrl"), profile.get("_id")
+            if not photo_url or not profile_id or not is_allowed_photo_url(photo_url):
+                continue
+            name = self.filename(str(profile_id), url_hash(photo_url), size)
+            if name in self._files or name in self._in_flight:
+                continue
+            task = asyncio.create_task(self._prefetch_one(str(profile_id), photo_url, size))
+            self._prefetching.add(task)
+            task.add_done_callback(self._prefetching.discard)
+
+    async def _prefetch_one(self, profile_id: str, photo_url: str, size: int):
+        try:
+            await self.get(profile_id, photo_url, size)
+            self.stats["prefetched"] += 1
+        except Exception as e:
+            logger.debug("Prefetch of photo for %s failed: %s", profile_id, e)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {**self.stats, "files": len(self._files), "bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+
+photo_cache = PhotoCache()
+
+
+def add_thumbnail_urls(profiles: Iterable[Dict[str, Any]]):
+    """Sets photoThumbUrl on each profile that has a photo."""
+    for profile in profiles:
+        profile["photoThumbUrl"] = thumbnail_url(profile)
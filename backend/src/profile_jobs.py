@@ -0,0 +1,116 @@
+"""
+Background jobs for profile write paths.
+
+Signups and profile edits store the profile right away with
+embedding_status "pending" and queue an embed_profile job; the worker fills
+in summary_embedding and flips the status to "ready" (or "failed" once
+retries are exhausted). Search only ranks profiles that have an embedding.
+
+If the enqueue itself fails (Mongo hiccup, process killed between the two
+writes) the profile would stay "pending" for good: a retried signup takes
+the claim path and doesn't enqueue again. PendingEmbeddingSweep re-enqueues
+profiles that have been pending for longer than PENDING_GRACE; enqueueing is
+idempotent, so profiles whose job is merely queued are left alone.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from bson import ObjectId
+
+from src.embeddings import embed_text
+from src.job_queue import JobQueue
+
+logger = logging.getLogger(__name__)
+
+EMBED_PROFILE = "embed_profile"
+PENDING_GRACE = timedelta(minutes=5)
+SWEEP_INTERVAL = float(os.getenv("PENDING_SWEEP_SECONDS", "300"))
+
+
+async def enqueue_profile_embedding(queue: JobQueue, profile_id: str, summary: str) -> str:
+    # Same profile and same summary text means the same embedding
+    digest = hashlib.sha1(summary.encode("utf-8")).hexdigest()
+    return await queue.enqueue(
+        EMBED_PROFILE,
+        {"profile_id": profile_id, "summary": summary},
+        idempotency_key=f"{EMBED_PROFILE}:{profile_id}:{digest}"
+    )
+
+
+def register_profile_jobs(queue: JobQueue, db):
+    collection = db.profilematch
+
+    async def embed_profile(payload: Dict[str, Any]):
+        embedding = await embed_text(payload["summary"])
+        # Only apply if the summary hasn't been edited again in the meantime;
+        # the newer edit has its own job
+        await collection.update_one(
+            {"_id": ObjectId(payload["profile_id"]), "summary": payload["summary"]},
+            {"$set": {
+                "summary_embedding": embedding,
+                "embedding_status": "ready",
+                "updated_at": datetime.utcnow()
+            }}
+        )
+
+    async def mark_failed(payload: Dict[str, Any], error: str):
+        await collection.update_one(
+            {"_id": ObjectId(payload["profile_id"]), "summary": payload["summary"]},
+            {"$set": {"embedding_status": "failed", "updated_at": datetime.utcnow()}}
+        )
+
+    queue.register(EMBED_PROFILE, embed_profile, on_give_up=mark_failed)
+
+
+class PendingEmbeddingSweep:
+    def __init__(self, queue: JobQueue, db):
+        self.queue = queue
+        self.collection = db.profilematch
+        self._task: Optional[asyncio.Task] = None
+
+    async def sweep(self) -> int:
+        """Enqueue an embed_profile job for every profile stuck in pending. Returns how many."""
+        enqueued = 0
+        cursor = self.collection.find(
+            {"embedding_status": "pending", "updated_at": {"$lt": datetime.utcnow() - PENDING_GRACE}},
+            {"summary": 1}
+        )
+        async for doc in cursor:
+            if not doc.get("summary"):
+                continue
+            await enqueue_profile_embedding(self.queue, str(doc["_id"]), doc["summary"])
+            enqueued += 1
+        if enqueued:
+            logger.info("Re-enqueued embeddings for %d pending profiles", enqueued)
+        return enqueued
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        try:
+            # Only pending profiles are indexed, so the sweep doesn't scan the collection
+            await self.collection.create_index(
+                "embedding_status",
+                partialFilterExpression={"embedding_status": "pending"}
+            )
+        except Exception as e:
+            logger.error("Failed to create the pending embedding index: %s", e)
+        while True:
+            try:
+                await self.sweep()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Pending embedding sweep failed: %s", e)
+            await asyncio.sleep(SWEEP_INTERVAL)
@@ -0,0 +1,202 @@
+"""
+Prompt builder for LinkedIn summary generation.
+
+The RapidAPI payload is mostly noise for the summary: URNs, image variants,
+URLs, locale metadata and the same positions listed twice (`position` and
+`fullPositions`). Instead of sending its repr to Gemini, we extract the
+fields the summary actually uses, deduplicate them and render compact plain
+text that fits a token budget.
+
+Sections are added in priority order (headline, about, positions, education,
+honors, then projects, certifications and skills). An entry that doesn't fit
+is retried without its description before it is dropped, so the budget
+trims detail before it trims facts.
+
+Token counts are estimated at ~4 characters per token, which is close
+enough for budgeting English profile text without a tokenizer round trip.
+"""
+import math
+import os
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("SUMMARY_PROMPT_TOKEN_BUDGET", "1500"))
+CHARS_PER_TOKEN = 4
+DESCRIPTION_CHARS = 400
+ABOUT_CHARS = 1200
+MAX_SKILLS = 25
+
+SUMMARY_INSTRUCTIONS = """You are an AI assistant that specializes in generating concise professional summaries for a knowledge database. You will be given details extracted from a person's LinkedIn profile. Your goal is to:
+
+Use the most relevant details (e.g., name, education, positions, key accomplishments, honors).
+Produce a single-paragraph summary that is succinct, factual, and professional.
+Avoid including personal contact details, links, or any extraneous information (e.g., email addresses).
+Focus on the individual’s academic background, professional experience, notable projects, and honors.
+Write in the third person, using a neutral, professional tone.
+Ensure the paragraph is 300 words.
+Do not output anything other than this single-paragraph summary. Do not format the text with markdown. If data is missing or not relevant, simply omit it. If there is no data at all, return an empty string.
+
+Here are the profile details (do not summarize this instruction text, only the details below):
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _clean(value: Any, limit: Optional[int] = None) -> str:
+    if not isinstance(value, str):
+        return ""
+    text = " ".join(value.split())
+    if limit is not None and len(text) > limit:
+        text = text[:limit].rsplit(" ", 1)[0] + "…"
+    return text
+
+
+def _key(*parts: Any) -> Tuple[str, ...]:
+    return tuple(re.sub(r"\W+", " ", str(part or "")).strip().lower() for part in parts)
+
+
+def _year_range(item: Dict[str, Any]) -> str:
+    start = (item.get("start") or {}).get("year") or ""
+    end = (item.get("end") or {}).get("year") or ""
+    if not start and not end:
+        return ""
+    if start and not end:
+        return f"{start}–present"
+    return f"{start}–{end}" if start != end else str(start)
+
+
+def _join(*parts: str, sep: str = ", ") -> str:
+    return sep.join(part for part in parts if part)
+
+
+# Each extractor yields (full line, short line) pairs; short drops the description
+Entry = Tuple[str, str]
+
+
+def _positions(profile: Dict[str, Any]) -> Iterable[Entry]:
+    seen = set()
+    # fullPositions repeats position with a few extra fields; merge both
+    for item in list(profile.get("position") or []) + list(profile.get("fullPositions") or []):
+        if not isinstance(item, dict):
+            continue
+        title, company = _clean(item.get("title")), _clean(item.get("companyName"))
+        key = _key(title, company, (item.get("start") or {}).get("year"))
+        if not (title or company) or key in seen:
+            continue
+        seen.add(key)
+        short = _join(_join(title, company, sep=" at "), _year_range(item))
+        description = _clean(item.get("description"), DESCRIPTION_CHARS)
+        yield _join(short, description, sep=": "), short
+
+
+def _educations(profile: Dict[str, Any]) -> Iterable[Entry]:
+    seen = set()
+    for item in profile.get("educations") or []:
+        if not isinstance(item, dict):
+            continue
+        school = _clean(item.get("schoolName"))
+        degree = _join(_clean(item.get("degree")), _clean(item.get("fieldOfStudy")))
+        key = _key(school, degree)
+        if not school or key in seen:
+            continue
+        seen.add(key)
+        short = _join(school, degree, _year_range(item))
+        details = _join(_clean(item.get("grade")), _clean(item.get("activities"), DESCRIPTION_CHARS),
+                        _clean(item.get("description"), DESCRIPTION_CHARS), sep="; ")
+        yield _join(short, details, sep=": "), short
+
+
+def _honors(profile: Dict[str, Any]) -> Iterable[Entry]:
+    seen = set()
+    for item in profile.get("honors") or []:
+        if not isinstance(item, dict):
+            continue
+        title = _clean(item.get("title"))
+        if not title or _key(title) in seen:
+            continue
+        seen.add(_key(title))
+        short = _join(title, _clean(item.get("issuer")), str((item.get("issuedOn") or {}).get("year") or ""))
+        yield _join(short, _clean(item.get("description"), DESCRIPTION_CHARS), sep=": "), short
+
+
+def _projects(profile: Dict[str, Any]) -> Iterable[Entry]:
+    projects = profile.get("projects") or {}
+    items = projects.get("items") if isinstance(projects, dict) else projects
+    seen = set()
+    for item in items or []:
+        if not isinstance(item, dict):
+            continue
+        title = _clean(item.get("title"))
+        if not title or _key(title) in seen:
+            continue
+        seen.add(_key(title))
+        yield _join(title, _clean(item.get("description"), DESCRIPTION_CHARS), sep=": "), title
+
+
+def _certifications(profile: Dict[str, Any]) -> Iterable[Entry]:
+    seen = set()
+    for item in profile.get("certifications") or []:
+        if not isinstance(item, dict):
+            continue
+        line = _join(_clean(item.get("name")), _clean(item.get("authority")))
+        if line and _key(line) not in seen:
+            seen.add(_key(line))
+            yield line, line
+
+
+SECTIONS = [
+    ("Experience", _positions),
+    ("Education", _educations),
+    ("Honors", _honors),
+    ("Projects", _projects),
+    ("Certifications", _certifications),
+]
+
+
+def compact_profile(profile: Dict[str, Any], token_budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    """Render the summary-relevant parts of a RapidAPI profile within `token_budget`."""
+    if not isinstance(profile, dict):
+        return ""
+    remaining = token_budget * CHARS_PER_TOKEN
+    lines: List[str] = []
+
+    def add(line: str) -> bool:
+        nonlocal remaining
+        if len(line) + 1 > remaining:
+            return False
+        lines.append(line)
+        remaining -= len(line) + 1
+        return True
+
+    name = _clean(profile.get("fullName")) or _join(_clean(profile.get("firstName")), _clean(profile.get("lastName")), sep=" ")
+    for label, value in (("Name", name), ("Headline", _clean(profile.get("headline"))),
+                         ("About", _clean(profile.get("summary"), ABOUT_CHARS))):
+        if value:
+            add(f"{label}: {value}")
+
+    for title, extract in SECTIONS:
+        entries = list(extract(profile))
+        if not entries or not add(f"{title}:"):
+            continue
+        added = 0
+        for full, short in entries:
+            if add(f"- {full}") or (short != full and add(f"- {short}")):
+                added += 1
+        if not added:
+            lines.pop()
+            remaining += len(title) + 2
+
+    skills = list(dict.fromkeys(
+        _clean(skill.get("name")) for skill in profile.get("skills") or []
+        if isinstance(skill, dict) and _clean(skill.get("name"))
+    ))[:MAX_SKILLS]
+    if skills:
+        add(f"Skills: {', '.join(skills)}")
+
+    return "\n".join(lines)
+
+
+def build_summary_prompt(profile: Dict[str, Any], token_budget: int = PROMPT_TOKEN_BUDGET) -> str:
+    return SUMMARY_INSTRUCTIONS + compact_profile(profile, token_budget)
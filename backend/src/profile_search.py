@@ -1,14 +1,15 @@
 import os
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import MongoClient, ReturnDocument
 from pymongo.collection import Collection
 import requests
 from typing import List, Dict, Any
+from src.embeddings import get_embedding_provider
 from bson import ObjectId
 import numpy as np
 import logging
+from datetime import datetime
 
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 def serialize_mongo_doc(doc: Dict[str, Any]) -> Dict[str, Any]:
@@ -46,10 +47,6 @@ class ProfileSearch:
             
             self.db = self.mongo_client['UPenn']
             self.collection: Collection = self.db['profilematch']
-            self.voyage_api_key = os.getenv('VOYAGE_API_KEY')
-            if not self.voyage_api_key:
-                logger.error("VOYAGE_API_KEY not found in environment variables")
-            self.voyage_api_url = "https://api.voyageai.com/v1/embeddings"
             self._ensure_vector_search_index()
         except Exception as e:
             logger.error(f"Error connecting to MongoDB in ProfileSearch: {str(e)}")
@@ -72,22 +69,8 @@ class ProfileSearch:
             )
 
     def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for the given text using Voyage AI API"""
-        headers = {
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.voyage_api_key}"
-        }
-        
-        response = requests.post(
-            self.voyage_api_url,
-            headers=headers,
-            json={"input": text, "model": "voyage-3-large"}
-        )
-        
-        if response.status_code == 200:
-            return response.json()["data"][0]["embedding"]
-        else:
-            raise Exception(f"Error generating embedding: {response.text}")
+        """Generate embedding for the given text using the configured provider"""
+        return get_embedding_provider().embed_batch_sync([text])[0]
 
     def search_profiles(self, query: str, limit: int = 6) -> List[Dict[str, Any]]:
         """Search for profiles using semantic search"""
@@ -152,27 +135,24 @@ class ProfileSearch:
                 # If summary is empty, remove the embedding
                 profile_data["summary_embedding"] = None
 
+            # Keep updated_at current so the polling change feed picks this up
+            profile_data["updated_at"] = datetime.utcnow()
+
             if profile_id and ObjectId.is_valid(profile_id):
-                # Try to find the existing profile
-                existing_profile = self.collection.find_one({"_id": ObjectId(profile_id)})
-                
-                if existing_profile:
-                    # Update existing profile
-                    self.collection.update_one(
-                        {"_id": ObjectId(profile_id)},
-                        {"$set": profile_data}
-                    )
-                    updated_profile = self.collection.find_one({"_id": ObjectId(profile_id)})
-                    if updated_profile is None:
-                        raise Exception("Failed to retrieve updated profile")
+                # Update and read back in one round trip
+                updated_profile = self.collection.find_one_and_update(
+                    {"_id": ObjectId(profile_id)},
+                    {"$set": profile_data},
+                    return_document=ReturnDocument.AFTER
+                )
+                if updated_profile is not None:
                     return serialize_mongo_doc(updated_profile)
             
             # Create new profile if no valid ID or profile not found
-            result = self.collection.insert_one(profile_data)
-            new_profile = self.collection.find_one({"_id": result.inserted_id})
-            if new_profile is None:
-                raise Exception("Failed to retrieve newly created profile")
-            return serialize_mongo_doc(new_profile)
+            profile_data.setdefault("created_at", profile_data["updated_at"])
+            # insert_one adds the new _id to profile_data, which is the stored document
+            self.collection.insert_one(profile_data)
+            return serialize_mongo_doc(profile_data)
                 
         except Exception as e:
             logger.error(f"Error editing/creating profile: {str(e)}")
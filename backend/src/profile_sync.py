@@ -0,0 +1,241 @@
+"""
+Incremental change feed for profilematch.
+
+Profiles are written from several places (User.create_user, update_user,
+claim_profile, delete_user, ProfileSearch.edit_profile). Instead of each
+in-memory structure rebuilding itself, subscribers register with the feed
+and receive every insert, update and delete as it happens.
+
+Subscribers are plain objects with these coroutines:
+    async def on_upsert(self, doc)        # full document, minus raw_linkedin_data
+    async def on_delete(self, profile_id) # string ObjectId
+    async def on_reset(self)              # optional: events may have been missed;
+                                          # also sent once when the feed starts
+
+On a replica set (Atlas) the feed tails a change stream and persists its
+resume token in the sync_state collection. Standalone servers don't support
+change streams, so the feed falls back to polling `updated_at` and
+periodically diffing the ID set to detect deletes.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+STATE_ID = "profilematch"
+POLL_INTERVAL = float(os.getenv("PROFILE_SYNC_POLL_SECONDS", "0.5"))
+RECONCILE_INTERVAL = float(os.getenv("PROFILE_SYNC_RECONCILE_SECONDS", "60"))
+TOKEN_SAVE_INTERVAL = 1.0
+RETRY_DELAY = 5.0
+
+# Fields subscribers never need; raw scrape payloads can be hundreds of KB
+EXCLUDED_FIELDS = {"raw_linkedin_data": 0}
+
+# Server error codes meaning change streams are unavailable or the token is unusable
+CHANGE_STREAMS_UNSUPPORTED = {40573}
+RESUME_TOKEN_LOST = {260, 280, 286}
+
+
+class ProfileChangeFeed:
+    def __init__(self, db):
+        self.collection = db.profilematch
+        self.state = db.sync_state
+        self.subscribers: List[Any] = []
+        self.mode: Optional[str] = None
+        self.events_applied = 0
+        self.last_event_at: Optional[float] = None
+        self.lag_seconds = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._caught_up = False
+
+    def subscribe(self, subscriber):
+        self.subscribers.append(subscriber)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "events_applied": self.events_applied,
+            "lag_seconds": round(self.lag_seconds, 3),
+            "last_event_at": self.last_event_at,
+            "subscribers": len(self.subscribers),
+        }
+
+    async def _dispatch_upsert(self, doc: Dict[str, Any]):
+        doc["_id"] = str(doc["_id"])
+        for subscriber in self.subscribers:
+            try:
+                await subscriber.on_upsert(doc)
+            except Exception as e:
+                logger.error("Subscriber %s failed on upsert %s: %s",
+                             type(subscriber).__name__, doc["_id"], e)
+
+    async def _dispatch_delete(self, profile_id: str):
+        for subscriber in self.subscribers:
+            try:
+                await subscriber.on_delete(profile_id)
+            except Exception as e:
+                logger.error("Subscriber %s failed on delete %s: %s",
+                             type(subscriber).__name__, profile_id, e)
+
+    async def _dispatch_reset(self):
+        """Tell subscribers that changes may have been missed."""
+        for subscriber in self.subscribers:
+            on_reset = getattr(subscriber, "on_reset", None)
+            if on_reset is None:
+                continue
+            try:
+                await on_reset()
+            except Exception as e:
+                logger.error("Subscriber %s failed on reset: %s", type(subscriber).__name__, e)
+
+    def _record_event(self, event_time: Optional[float]):
+        now = time.time()
+        self.events_applied += 1
+        self.last_event_at = now
+        if event_time is not None:
+            self.lag_seconds = max(0.0, now - event_time)
+
+    async def _run(self):
+        try:
+            # Polling reads by updated_at, and the search corpus version
+            # (src/http_cache.py) sorts on it in either mode
+            await self.collection.create_index("updated_at")
+        except PyMongoError as e:
+            logger.error("Failed to create the updated_at index: %s", e)
+        while True:
+            try:
+                await self._watch()
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    logger.info("Change streams unavailable, polling updated_at instead")
+                    await self._poll()
+                    return
+                if e.code in RESUME_TOKEN_LOST:
+                    logger.warning("Resume token no longer valid, restarting change stream from now")
+                    await self.state.delete_one({"_id": STATE_ID})
+                    await self._dispatch_reset()
+                    continue
+                logger.error("Change stream failed: %s", e)
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.error("Change stream failed: %s", e)
+            await asyncio.sleep(RETRY_DELAY)
+
+    async def _watch(self):
+        state = await self.state.find_one({"_id": STATE_ID}) or {}
+        resume_token = state.get("resume_token")
+        pipeline = [{"$project": {f"fullDocument.{field}": 0 for field in EXCLUDED_FIELDS}}]
+
+        async with self.collection.watch(
+            pipeline,
+            full_document="updateLookup",
+            resume_after=resume_token
+        ) as stream:
+            self.mode = "change_stream"
+            logger.info("Watching profilematch change stream (resumed=%s)", resume_token is not None)
+            await self._catch_up()
+            last_saved = time.monotonic()
+            async for change in stream:
+                operation = change["operationType"]
+                if operation in ("insert", "update", "replace") and change.get("fullDocument"):
+                    await self._dispatch_upsert(change["fullDocument"])
+                elif operation == "delete":
+                    await self._dispatch_delete(str(change["documentKey"]["_id"]))
+                else:
+                    continue
+
+                cluster_time = change.get("clusterTime")
+                self._record_event(cluster_time.time if cluster_time else None)
+
+                if time.monotonic() - last_saved >= TOKEN_SAVE_INTERVAL:
+                    await self._save_state({"resume_token": stream.resume_token})
+                    last_saved = time.monotonic()
+
+    async def _catch_up(self):
+        """
+        The saved position is shared by every process, but subscribers start
+        from their own snapshots (the index overlay from the index file's
+        built_at), so changes from before it would never be replayed to them.
+        Once per process, after the feed is open, have them reload instead.
+        """
+        if self._caught_up:
+            return
+        self._caught_up = True
+        await self._dispatch_reset()
+
+    async def _save_state(self, fields: Dict[str, Any]):
+        await self.state.update_one(
+            {"_id": STATE_ID},
+            {"$set": {**fields, "saved_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+    async def _poll(self):
+        self.mode = "polling"
+        state = await self.state.find_one({"_id": STATE_ID}) or {}
+        watermark: datetime = state.get("watermark") or datetime.utcnow()
+        # IDs seen at exactly the watermark, so $gte doesn't redeliver them
+        seen_at_watermark: Set[str] = set()
+        saved_watermark = watermark
+        known_ids = await self._load_ids()
+        await self._catch_up()
+        last_reconcile = time.monotonic()
+
+        while True:
+            try:
+                cursor = self.collection.find(
+                    {"updated_at": {"$gte": watermark}},
+                    EXCLUDED_FIELDS
+                ).sort("updated_at", 1)
+                async for doc in cursor:
+                    profile_id = str(doc["_id"])
+                    updated_at = doc["updated_at"]
+                    if updated_at == watermark and profile_id in seen_at_watermark:
+                        continue
+                    if updated_at > watermark:
+                        watermark = updated_at
+                        seen_at_watermark = set()
+                    seen_at_watermark.add(profile_id)
+                    known_ids.add(profile_id)
+                    await self._dispatch_upsert(doc)
+                    self._record_event(updated_at.replace(tzinfo=timezone.utc).timestamp())
+
+                if time.monotonic() - last_reconcile >= RECONCILE_INTERVAL:
+                    current_ids = await self._load_ids()
+                    for profile_id in known_ids - current_ids:
+                        await self._dispatch_delete(profile_id)
+                        self._record_event(None)
+                    known_ids = current_ids
+                    last_reconcile = time.monotonic()
+
+                if watermark != saved_watermark:
+                    await self._save_state({"watermark": watermark})
+                    saved_watermark = watermark
+            except asyncio.CancelledError:
+                raise
+            except PyMongoError as e:
+                logger.error("Profile polling failed: %s", e)
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _load_ids(self) -> Set[str]:
+        return {str(doc["_id"]) async for doc in self.collection.find({}, {"_id": 1})}
@@ -0,0 +1,230 @@
+"""
+Query log and warm result cache for popular searches.
+
+Search traffic is dominated by a few dozen queries. QueryLog appends every
+search to the search_queries collection in batches (a TTL index drops
+entries after QUERY_LOG_RETENTION_DAYS, default 30: long enough for the
+warm cache's 7-day window and typeahead's 30-day one), and WarmCache
+periodically takes the most frequent recent queries and precomputes their
+embedding and top-N ranked profile IDs, so /api/search can serve them
+without an embedding call or a ranking pass.
+
+WarmCache subscribes to the profile change feed: any profile change marks
+the cached rankings stale, and they are re-ranked (reusing the cached
+embeddings) on the next refresh.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo.errors import OperationFailure
+
+from models.user import User
+from src.embedding_index import search_embedding_index_many
+from src.embeddings import embed_text
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 2.0
+FLUSH_BATCH_SIZE = 200
+MAX_BUFFERED = 10000
+WARM_INTERVAL = float(os.getenv("WARM_CACHE_INTERVAL_SECONDS", "300"))
+WARM_QUERY_COUNT = int(os.getenv("WARM_CACHE_QUERIES", "50"))
+WARM_RESULT_COUNT = int(os.getenv("WARM_CACHE_RESULTS", "60"))
+WARM_WINDOW = timedelta(days=7)
+QUERY_LOG_RETENTION = timedelta(days=int(os.getenv("QUERY_LOG_RETENTION_DAYS", "30")))
+# Server error codes for "an index on these keys exists with other options"
+INDEX_OPTIONS_CONFLICT = {85, 86}
+# How quickly stale rankings are refreshed after a profile change
+STALE_REFRESH_DELAY = 5.0
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class QueryLog:
+    """Buffers search queries in memory and writes them with insert_many."""
+
+    def __init__(self, db):
+        self.collection = db.search_queries
+        self._buffer: List[Dict[str, Any]] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, query: str):
+        if len(self._buffer) >= MAX_BUFFERED:
+            return  # Mongo is falling behind; drop rather than grow without bound
+        self._buffer.append({"query": normalize_query(query), "ts": datetime.utcnow()})
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        while self._buffer:
+            batch = self._buffer[:FLUSH_BATCH_SIZE]
+            del self._buffer[:FLUSH_BATCH_SIZE]
+            await self.collection.insert_many(batch, ordered=False)
+
+    async def ensure_indexes(self):
+        expire_after = int(QUERY_LOG_RETENTION.total_seconds())
+        try:
+            await self.collection.create_index("ts", expireAfterSeconds=expire_after)
+        except OperationFailure as e:
+            if e.code not in INDEX_OPTIONS_CONFLICT:
+                raise
+            # The plain ts index from before retention was added: turn it into a TTL index
+            await self.collection.database.command(
+                "collMod", self.collection.name,
+                index={"keyPattern": {"ts": 1}, "expireAfterSeconds": expire_after}
+            )
+
+    async def _run(self):
+        try:
+            await self.ensure_indexes()
+        except Exception as e:
+            logger.error("Failed to create the query log TTL index: %s", e)
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Failed to flush query log: %s", e)
+
+
+class WarmCache:
+    """Precomputed embeddings and rankings for the most frequent queries."""
+
+    def __init__(self, db):
+        self.queries = db.search_queries
+        self.user_model = User(db)
+        # normalized query -> (embedding, [(profile_id, score), ...])
+        self.entries: Dict[str, Tuple[List[float], List[Tuple[str, float]]]] = {}
+        # Incremented whenever the cached rankings are replaced
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._stale = False
+        self._stale_event = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def get(self, query: str, offset: int, limit: int) -> Optional[List[Tuple[str, float]]]:
+        """The cached page for `query`, or None if it isn't warm."""
+        entry = self.entries.get(normalize_query(query))
+        if entry is None or offset + limit > len(entry[1]):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[1][offset:offset + limit]
+
+    def embedding_for(self, query: str) -> Optional[List[float]]:
+        """The cached embedding for `query`, if it is warm."""
+        entry = self.entries.get(normalize_query(query))
+        return entry[0] if entry is not None else None
+
+    @property
+    def stale(self) -> bool:
+        """Profiles changed since the cached rankings were computed."""
+        return self._stale
+
+    def stats(self) -> Dict[str, Any]:
+        return {"queries": len(self.entries), "hits": self.hits, "misses": self.misses}
+
+    async def on_upsert(self, doc: Dict[str, Any]):
+        self._mark_stale()
+
+    async def on_delete(self, profile_id: str):
+        self._mark_stale()
+
+    async def on_reset(self):
+        self._mark_stale()
+
+    def _mark_stale(self):
+        self._stale = True
+        self._stale_event.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        next_warm = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_warm:
+                    next_warm = time.monotonic() + WARM_INTERVAL
+                    await self.warm()
+                elif self._stale:
+                    await self.rerank()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Warm cache refresh failed: %s", e)
+
+            if not self._stale:
+                self._stale_event.clear()
+                try:
+                    await asyncio.wait_for(self._stale_event.wait(), timeout=max(0.0, next_warm - time.monotonic()))
+                except asyncio.TimeoutError:
+                    continue
+            # Let a burst of profile writes settle before re-ranking
+            await asyncio.sleep(STALE_REFRESH_DELAY)
+
+    async def popular_queries(self) -> List[str]:
+        pipeline = [
+            {"$match": {"ts": {"$gte": datetime.utcnow() - WARM_WINDOW}}},
+            {"$group": {"_id": "$query", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": WARM_QUERY_COUNT}
+        ]
+        return [doc["_id"] async for doc in self.queries.aggregate(pipeline)]
+
+    async def warm(self):
+        """Rebuild the cache from the current most frequent queries."""
+        self._stale = False
+        queries = await self.popular_queries()
+        embeddings = []
+        for query in queries:
+            cached = self.entries.get(query)
+            embeddings.append(cached[0] if cached else await embed_text(query))
+        rankings = await self._rank_many(embeddings)
+        self.entries = dict(zip(queries, zip(embeddings, rankings)))
+        self.generation += 1
+        logger.info("Warmed search cache with %d queries", len(self.entries))
+
+    async def rerank(self):
+        """Re-rank cached queries against the changed profile set."""
+        self._stale = False
+        queries = list(self.entries)
+        embeddings = [self.entries[query][0] for query in queries]
+        rankings = await self._rank_many(embeddings)
+        self.entries = dict(zip(queries, zip(embeddings, rankings)))
+        self.generation += 1
+        logger.debug("Re-ranked %d warm queries", len(self.entries))
+
+    async def _rank_many(self, embeddings: List[List[float]]) -> List[List[Tuple[str, float]]]:
+        if not embeddings:
+            return []
+        # One matrix product for every warm query, off the event loop
+        ranked = await asyncio.to_thread(search_embedding_index_many, embeddings, WARM_RESULT_COUNT)
+        if ranked is not None:
+            return ranked
+        rankings = []
+        for embedding in embeddings:
+            results = await self.user_model.search_users_by_embedding(embedding, limit=WARM_RESULT_COUNT)
+            rankings.append([(doc["_id"], doc["similarity"]) for doc in results])
+        return rankings
@@ -0,0 +1,217 @@
+"""
+Compressed storage for raw LinkedIn scrape payloads.
+
+The RapidAPI payload used to live in each profilematch document as
+raw_linkedin_data, so every lookup and search scan read and decoded it. It
+now lives in the raw_linkedin_profiles collection, keyed by the profile's
+_id, as BSON compressed into a single binary field:
+
+    {_id: <profile ObjectId>, codec: "zlib" | "zstd", size: <BSON bytes>,
+     data: <compressed BSON>, updated_at: <datetime>}
+
+and is only loaded when something asks for it by ID. zlib is the default
+codec; set RAW_PROFILE_CODEC=zstd to use zstandard (requires the
+`zstandard` package). The codec is stored per document so both can be read.
+
+Migrating existing profiles, with before/after measurements:
+    python -m src.raw_profiles migrate [--batch 200] [--samples 200]
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+import bson
+import bson.errors
+from bson import Binary, ObjectId
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RAW_COLLECTION = "raw_linkedin_profiles"
+CODEC = os.getenv("RAW_PROFILE_CODEC", "zlib")
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 10
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("RAW_PROFILE_CODEC=zstd requires the zstandard package")
+    return zstandard
+
+
+def encode_payload(payload: Dict[str, Any], codec: str = CODEC) -> Tuple[str, bytes, int]:
+    """Returns (codec, compressed BSON, uncompressed size)."""
+    raw = bson.encode(payload)
+    if codec == "zstd":
+        return codec, _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(raw), len(raw)
+    if codec == "zlib":
+        return codec, zlib.compress(raw, ZLIB_LEVEL), len(raw)
+    raise ValueError(f"Unknown RAW_PROFILE_CODEC {codec!r}; expected 'zlib' or 'zstd'")
+
+
+def decode_payload(codec: str, data: bytes) -> Dict[str, Any]:
+    if codec == "zstd":
+        raw = _zstd().ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        raw = zlib.decompress(data)
+    else:
+        raise ValueError(f"Unknown raw profile codec {codec!r}")
+    return bson.decode(raw)
+
+
+def build_raw_doc(profile_id: ObjectId, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return encoded_raw_doc(profile_id, encode_payload(payload))
+
+
+def encoded_raw_doc(profile_id: ObjectId, encoded: Tuple[str, bytes, int]) -> Dict[str, Any]:
+    codec, data, size = encoded
+    return {"_id": profile_id, "codec": codec, "size": size, "data": Binary(data), "updated_at": datetime.utcnow()}
+
+
+class RawProfileStore:
+    def __init__(self, db):
+        self.collection = db[RAW_COLLECTION]
+
+    @staticmethod
+    def encode(payload: Any) -> Optional[Tuple[str, bytes, int]]:
+        """
+        Check and compress a client-supplied payload, so a bad one is
+        rejected before the profile is written. Raises ValueError.
+        """
+        if not payload:
+            return None
+        if not isinstance(payload, dict):
+            raise ValueError("raw_data must be a JSON object")
+        try:
+            return encode_payload(payload)
+        except (bson.errors.InvalidDocument, OverflowError) as e:
+            # e.g. an integer too large for BSON
+            raise ValueError(f"raw_data can't be stored: {e}")
+
+    async def save(self, profile_id: str, payload: Optional[Dict[str, Any]]):
+        await self.save_encoded(profile_id, self.encode(payload))
+
+    async def save_encoded(self, profile_id: str, encoded: Optional[Tuple[str, bytes, int]]):
+        if encoded is None:
+            return
+        doc = encoded_raw_doc(ObjectId(profile_id), encoded)
+        await self.collection.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+
+    async def load(self, profile_id: str) -> Optional[Dict[str, Any]]:
+        doc = await self.collection.find_one({"_id": ObjectId(profile_id)})
+        if doc is None:
+            return None
+        return decode_payload(doc["codec"], doc["data"])
+
+    async def delete(self, profile_id: str):
+        await self.collection.delete_one({"_id": ObjectId(profile_id)})
+
+
+# Migration and measurements (synchronous pymongo, run as a script)
+
+def collection_stats(db, name: str) -> Dict[str, Any]:
+    stats = db.command("collStats", name)
+    return {
+        "count": stats.get("count", 0),
+        "avg_doc_bytes": stats.get("avgObjSize", 0),
+        "data_bytes": stats.get("size", 0),
+        "storage_bytes": stats.get("storageSize", 0),
+    }
+
+
+def measure_lookups(collection, samples: int) -> Dict[str, Any]:
+    """
+    Latency of the reads the API does on profilematch: a point lookup by
+    email (full document, as get_user_by_linkedin_url does) and a full scan
+    (what every search aggregation does). The scan also reports the bytes it
+    decodes, i.e. the working set a search needs resident in cache.
+    """
+    emails = [doc["email"] for doc in collection.find({"email": {"$type": "string"}}, {"email": 1}).limit(5000)]
+    latencies = []
+    for email in random.sample(emails, min(samples, len(emails))):
+        started = time.perf_counter()
+        collection.find_one({"email": email})
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    scanned_bytes = sum(len(bson.encode(doc)) for doc in collection.find({}))
+    scan_ms = (time.perf_counter() - started) * 1000
+
+    result = {"scan_ms": round(scan_ms, 1), "scan_bytes": scanned_bytes}
+    if latencies:
+        latencies.sort()
+        result.update({
+            "lookup_p50_ms": round(statistics.median(latencies), 2),
+            "lookup_p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+        })
+    return result
+
+
+def migrate(db, batch_size: int) -> Dict[str, int]:
+    """
+    Moves raw_linkedin_data out of profilematch in batches. Each batch is
+    written to the raw collection before it is unset from the profiles, so
+    an interrupted run loses nothing and can simply be re-run.
+    """
+    from pymongo import ReplaceOne
+
+    profiles, raw = db.profilematch, db[RAW_COLLECTION]
+    moved = raw_bytes = compressed_bytes = 0
+    while True:
+        batch = list(profiles.find({"raw_linkedin_data": {"$exists": True}}, {"raw_linkedin_data": 1}).limit(batch_size))
+        if not batch:
+            break
+        writes = []
+        for doc in batch:
+            payload = doc["raw_linkedin_data"]
+            if isinstance(payload, dict) and payload:
+                raw_doc = build_raw_doc(doc["_id"], payload)
+                raw_bytes += raw_doc["size"]
+                compressed_bytes += len(raw_doc["data"])
+                writes.append(ReplaceOne({"_id": doc["_id"]}, raw_doc, upsert=True))
+        if writes:
+            raw.bulk_write(writes, ordered=False)
+        profiles.update_many(
+            {"_id": {"$in": [doc["_id"] for doc in batch]}},
+            {"$unset": {"raw_linkedin_data": ""}}
+        )
+        moved += len(batch)
+        logger.info("Moved raw data for %d profiles", moved)
+    return {"profiles": moved, "raw_bytes": raw_bytes, "compressed_bytes": compressed_bytes}
+
+
+def main():
+    from pymongo import MongoClient
+    from logging_config import configure_logging
+
+    parser = argparse.ArgumentParser(description="Move raw LinkedIn payloads into compressed storage")
+    parser.add_argument("command", choices=["migrate", "measure"])
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--samples", type=int, default=200, help="point lookups to time")
+    args = parser.parse_args()
+
+    configure_logging()
+    db = MongoClient(os.getenv("MONGODB_URI"))["UPenn"]
+
+    report = {"before": {**collection_stats(db, "profilematch"), **measure_lookups(db.profilematch, args.samples)}}
+    if args.command == "migrate":
+        report["migration"] = migrate(db, args.batch)
+        report["after"] = {**collection_stats(db, "profilematch"), **measure_lookups(db.profilematch, args.samples)}
+        report["raw_collection"] = collection_stats(db, RAW_COLLECTION)
+    # storage_bytes only shrinks after `compact`; data_bytes and scan_bytes reflect the change immediately
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
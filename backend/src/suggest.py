@@ -0,0 +1,339 @@
+"""
+In-memory prefix index for search-bar typeahead.
+
+Every distinct name, company and role in profilematch is a term. Terms are
+indexed under their full normalized text and under each later word
+("john smith" is also found by "smith"), in one sorted list of
+(key, term) tuples per field, so a prefix lookup is a bisect plus a scan of
+the matching range of each list. Keeping fields apart stops thousands of
+matching names from crowding out the company a user is typing.
+
+Terms are ranked by popularity: how many profiles carry the term plus how
+often it has been searched recently (from the search_queries log).
+
+Prefixes of up to three characters match too many entries to rank on every
+keystroke, so each keeps a TopList: its TOP_SIZE best terms, built by one
+full scan of its range the first time it is asked for and then kept exact
+as terms change. A term gaining popularity moves up or joins the lists of
+its prefixes. A listed term losing popularity moves down, or leaves the list
+if it no longer beats the last entry (the rest of the list is still exact,
+just shorter); a list only gets rebuilt once it is shorter than the
+request. Longer prefixes match few entries; their scans stop after MAX_SCAN
+entries.
+
+The index loads once at startup and then follows the profile change feed,
+so it stays current without reloading.
+"""
+import asyncio
+import bisect
+import heapq
+import logging
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ("name", "company", "role")
+MAX_SCAN = 300  # Entries examined per field for a long prefix, bounding worst-case latency
+SHORT_PREFIX_LENGTH = 3
+TOP_SIZE = 40  # Terms kept per short prefix; twice the largest request, so a few drop-outs don't force a rebuild
+SEARCH_WEIGHT = 2  # A recent search of a term counts as much as two profiles
+SEARCH_WINDOW = timedelta(days=30)
+SEARCH_REFRESH_INTERVAL = float(os.getenv("SUGGEST_SEARCH_REFRESH_SECONDS", "600"))
+WORD_PATTERN = re.compile(r"\w+")
+
+TermKey = Tuple[str, str]  # (field, normalized text)
+
+
+def normalize_term(text: str) -> str:
+    return " ".join(WORD_PATTERN.findall(text.lower()))
+
+
+def index_keys(normalized: str) -> List[str]:
+    """The term itself plus the suffix starting at each later word."""
+    words = normalized.split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+def short_prefixes(normalized: str) -> Set[str]:
+    """Every prefix of up to SHORT_PREFIX_LENGTH characters of the term's index keys."""
+    return {key[:length] for key in index_keys(normalized) for length in range(1, min(len(key), SHORT_PREFIX_LENGTH) + 1)}
+
+
+class Term:
+    __slots__ = ("text", "profiles", "searches")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.profiles: Set[str] = set()
+        self.searches = 0
+
+    @property
+    def popularity(self) -> int:
+        return len(self.profiles) + SEARCH_WEIGHT * self.searches
+
+
+class TopList:
+    """A short prefix's best terms, best first. `complete` when it holds every matching term."""
+    __slots__ = ("keys", "complete")
+
+    def __init__(self, keys: List[TermKey], complete: bool):
+        self.keys = keys
+        self.complete = complete
+
+
+class SuggestIndex:
+    def __init__(self, db):
+        self.collection = db.profilematch
+        self.queries = db.search_queries
+        # field -> sorted [(index key, normalized term), ...]
+        self._entries: Dict[str, List[Tuple[str, str]]] = {field: [] for field in FIELDS}
+        self._terms: Dict[TermKey, Term] = {}
+        self._by_profile: Dict[str, List[TermKey]] = {}
+        self._top: Dict[str, TopList] = {}
+        self._task: Optional[asyncio.Task] = None
+        # Feed events that arrive while a load is scanning the collection
+        self._pending: Optional[List[Tuple[str, Any]]] = None
+        self.ready = False
+
+    def _rank(self, prefix: str, key: TermKey) -> tuple:
+        """Sort key: most popular first, then terms that themselves start with the prefix, then shorter."""
+        field, normalized = key
+        return (-self._terms[key].popularity, not normalized.startswith(prefix), len(normalized), normalized, field)
+
+    def _place(self, prefix: str, top: TopList, key: TermKey):
+        ranks = [self._rank(prefix, other) for other in top.keys]
+        top.keys.insert(bisect.bisect_left(ranks, self._rank(prefix, key)), key)
+
+    def _raised(self, key: TermKey):
+        """The term is new or more popular: move it up or into its prefixes' lists."""
+        for prefix in short_prefixes(key[1]):
+            top = self._top.get(prefix)
+            if top is None:
+                continue
+            if key in top.keys:
+                top.keys.remove(key)
+            elif not top.complete and (not top.keys or self._rank(prefix, key) > self._rank(prefix, top.keys[-1])):
+                # Below the last listed term, where unlisted terms may outrank it
+                continue
+            self._place(prefix, top, key)
+            if len(top.keys) > TOP_SIZE:
+                top.keys.pop()
+                top.complete = False
+
+    def _lowered(self, key: TermKey, removed: bool):
+        """The term is less popular or gone: move it down or out of its prefixes' lists."""
+        for prefix in short_prefixes(key[1]):
+            top = self._top.get(prefix)
+            if top is None or key not in top.keys:
+                # Unlisted terms were already below the cut
+                continue
+            top.keys.remove(key)
+            if removed:
+                continue
+            # The remaining terms are still the exact top of the others; the
+            # term keeps a place only where it provably belongs
+            if top.complete or (top.keys and self._rank(prefix, key) < self._rank(prefix, top.keys[-1])):
+                self._place(prefix, top, key)
+
+    def _build_top(self, prefix: str) -> TopList:
+        """Rank every term matching `prefix` (one full scan of its range in each field)."""
+        terms = self._terms
+        ranked = []
+        for field, entries in self._entries.items():
+            start = bisect.bisect_left(entries, (prefix,))
+            end = bisect.bisect_left(entries, (prefix + "\U0010ffff",), lo=start)
+            for normalized in dict.fromkeys(term for _, term in entries[start:end]):
+                # Same order as _rank, inlined: this loop can cover tens of thousands of terms
+                term = terms[(field, normalized)]
+                ranked.append((-len(term.profiles) - SEARCH_WEIGHT * term.searches,
+                               not normalized.startswith(prefix), len(normalized), normalized, field))
+        top = TopList([(rank[4], rank[3]) for rank in heapq.nsmallest(TOP_SIZE, ranked)],
+                      complete=len(ranked) <= TOP_SIZE)
+        self._top[prefix] = top
+        return top
+
+    def _add(self, profile_id: str, field: str, text: Any):
+        if not isinstance(text, str):
+            return
+        normalized = normalize_term(text)
+        if not normalized:
+            return
+        key = (field, normalized)
+        term = self._terms.get(key)
+        if term is None:
+            term = self._terms[key] = Term(text.strip())
+            for index_key in index_keys(normalized):
+                bisect.insort(self._entries[field], (index_key, normalized))
+        term.profiles.add(profile_id)
+        self._by_profile.setdefault(profile_id, []).append(key)
+        self._raised(key)
+
+    def _remove(self, profile_id: str):
+        for key in self._by_profile.pop(profile_id, []):
+            term = self._terms.get(key)
+            if term is None:
+                continue
+            field, normalized = key
+            term.profiles.discard(profile_id)
+            if term.profiles:
+                self._lowered(key, removed=False)
+                continue
+            self._lowered(key, removed=True)
+            del self._terms[key]
+            entries = self._entries[field]
+            for index_key in index_keys(normalized):
+                entry = (index_key, normalized)
+                position = bisect.bisect_left(entries, entry)
+                if position < len(entries) and entries[position] == entry:
+                    del entries[position]
+
+    def upsert(self, doc: Dict[str, Any]):
+        profile_id = str(doc["_id"])
+        self._remove(profile_id)
+        for field in FIELDS:
+            self._add(profile_id, field, doc.get(field))
+
+    def delete(self, profile_id: str):
+        self._remove(profile_id)
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[Dict[str, Any]]:
+        normalized = normalize_term(prefix)
+        if not normalized:
+            return []
+
+        if len(normalized) <= SHORT_PREFIX_LENGTH:
+            top = self._top.get(normalized)
+            if top is None or (not top.complete and len(top.keys) < limit):
+                top = self._build_top(normalized)
+            keys = top.keys[:limit]
+        else:
+            candidates = []
+            for field, entries in self._entries.items():
+                position = bisect.bisect_left(entries, (normalized,))
+                end = min(len(entries), position + MAX_SCAN)
+                for index_key, term_text in entries[position:end]:
+                    if not index_key.startswith(normalized):
+                        break
+                    candidates.append((field, term_text))
+            keys = heapq.nsmallest(limit, set(candidates), key=lambda key: self._rank(normalized, key))
+
+        results = []
+        for key in keys:
+            term = self._terms[key]
+            results.append({"text": term.text, "field": key[0], "count": len(term.profiles)})
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "terms": len(self._terms),
+                "entries": sum(len(entries) for entries in self._entries.values()),
+                "profiles": len(self._by_profile), "prefix_lists": len(self._top)}
+
+    # Change feed subscriber
+
+    async def on_upsert(self, doc: Dict[str, Any]):
+        if self._pending is not None:
+            self._pending.append(("upsert", doc))
+        elif self.ready:
+            self.upsert(doc)
+
+    async def on_delete(self, profile_id: str):
+        if self._pending is not None:
+            self._pending.append(("delete", profile_id))
+        elif self.ready:
+            self.delete(profile_id)
+
+    async def on_reset(self):
+        if not self.ready or self._pending is not None:
+            return  # A load is pending or under way; it reads the current collection
+        await self.load()
+
+    async def load(self):
+        """Rebuild from profilematch, then replay changes that arrived meanwhile."""
+        started = time.perf_counter()
+        self._pending = []
+        try:
+            entries: Dict[str, List[Tuple[str, str]]] = {field: [] for field in FIELDS}
+            terms: Dict[TermKey, Term] = {}
+            by_profile: Dict[str, List[TermKey]] = {}
+            async for doc in self.collection.find({}, {field: 1 for field in FIELDS}):
+                profile_id = str(doc["_id"])
+                for field in FIELDS:
+                    text = doc.get(field)
+                    normalized = normalize_term(text) if isinstance(text, str) else ""
+                    if not normalized:
+                        continue
+                    key = (field, normalized)
+                    term = terms.get(key)
+                    if term is None:
+                        term = terms[key] = Term(text.strip())
+                        entries[field].extend((index_key, normalized) for index_key in index_keys(normalized))
+                    term.profiles.add(profile_id)
+                    by_profile.setdefault(profile_id, []).append(key)
+            # One sort per field instead of an insort per term
+            for field_entries in entries.values():
+                field_entries.sort()
+            self._entries, self._terms, self._by_profile = entries, terms, by_profile
+            # Prefix lists are rebuilt on demand against the new terms
+            self._top = {}
+            for action, payload in self._pending:
+                if action == "upsert":
+                    self.upsert(payload)
+                else:
+                    self.delete(payload)
+        finally:
+            self._pending = None
+        self.ready = True
+        logger.info("Loaded %d suggestion terms in %.2fs", len(self._terms), time.perf_counter() - started)
+
+    async def refresh_search_counts(self):
+        """Pull recent search frequencies for indexed terms from the query log."""
+        pipeline = [
+            {"$match": {"ts": {"$gte": datetime.utcnow() - SEARCH_WINDOW}}},
+            {"$group": {"_id": "$query", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": 5000},
+        ]
+        counts: Dict[str, int] = {}
+        async for doc in self.queries.aggregate(pipeline):
+            counts[normalize_term(doc["_id"] or "")] = doc["count"]
+        for key, term in self._terms.items():
+            searches = counts.get(key[1], 0)
+            if searches == term.searches:
+                continue
+            raised = searches > term.searches
+            term.searches = searches
+            if raised:
+                self._raised(key)
+            else:
+                self._lowered(key, removed=False)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while not self.ready:
+            try:
+                await self.load()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Failed to load suggestion index: %s", e)
+                await asyncio.sleep(10)
+        while True:
+            try:
+                await self.refresh_search_counts()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Failed to refresh suggestion search counts: %s", e)
+            await asyncio.sleep(SEARCH_REFRESH_INTERVAL)
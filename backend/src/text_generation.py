@@ -6,11 +6,15 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import asyncio
 import logging
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, Any
+
+from src.outbound import gemini
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
+EXPLANATION_MODEL = 'gemini-1.5-flash-8b'
+
 class TextGenerationRequest(BaseModel):
     query: str
     profile: dict
@@ -29,6 +33,18 @@ def create_prompt(request: TextGenerationRequest) -> str:
     Be specific and highlight relevant aspects of their background.
     """
 
+async def stream_explanation(query: str, profile: Dict[str, Any]) -> AsyncIterator[str]:
+    """Yields the explanation for one search result as Gemini generates it.
+
+    The Gemini slot is held, and the deadline applies, until the last chunk.
+    """
+    prompt = create_prompt(TextGenerationRequest(query=query, profile=profile))
+    model = genai.GenerativeModel(EXPLANATION_MODEL)
+    async with aclosing(gemini.stream(model.generate_content_async, prompt, stream=True)) as chunks:
+        async for chunk in chunks:
+            if chunk.text:
+                yield chunk.text
+
 def generate_text_handler(request: TextGenerationRequest):
     prompt = create_prompt(request)
     return StreamingResponse(
@@ -4,6 +4,7 @@ from pymongo import MongoClient
 from pymongo.collection import Collection
 import requests
 from typing import List, Dict, Any
+from src.embeddings import get_embedding_provider
 
 class VectorSearch:
     def __init__(self, collection_name: str, database_name: str = "UPenn"):
@@ -11,8 +12,6 @@ class VectorSearch:
         self.mongo_client = MongoClient(os.getenv('MONGODB_URI'))
         self.db = self.mongo_client[database_name]
         self.collection: Collection = self.db[collection_name]
-        self.voyage_api_key = os.getenv('VOYAGE_API_KEY')
-        self.voyage_api_url = "https://api.voyageai.com/v1/embeddings"
         self._ensure_vector_search_index()
     
     def _ensure_vector_search_index(self):
@@ -29,21 +28,8 @@ class VectorSearch:
             )
     
     def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding using Voyage AI API"""
-        headers = {
-            "Authorization": f"Bearer {self.voyage_api_key}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "model": "voyage-3-large",
-            "input": text
-        }
-        
-        response = requests.post(self.voyage_api_url, headers=headers, json=data)
-        response.raise_for_status()
-        
-        return response.json()['data'][0]['embedding']
+        """Generate embedding using the configured provider"""
+        return get_embedding_provider().embed_batch_sync([text])[0]
     
     def add_document(self, text: str, metadata: Dict[str, Any] = None) -> str:
         """Add a document with its embedding to MongoDB"""
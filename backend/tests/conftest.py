@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# Tests import backend modules the way main.py does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Module-level clients and providers only read these; nothing connects
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("VOYAGE_API_KEY", "test")
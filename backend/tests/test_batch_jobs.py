@@ -0,0 +1,65 @@
+import asyncio
+
+import numpy as np
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from dependencies import get_batch_runner
+from routes import admin
+from src import batch_jobs
+from src.embedding_index import EmbeddingIndex, IndexOverlay, build_index
+
+
+def test_load_embeddings_applies_overlay(tmp_path, monkeypatch):
+    kept, deleted, edited, created = (str(ObjectId()) for _ in range(4))
+    path = tmp_path / "index.idx"
+    build_index([(kept, [1.0, 0.0]), (deleted, [0.0, 1.0]), (edited, [0.5, 0.5])], str(path))
+    index = EmbeddingIndex(str(path))
+    overlay = IndexOverlay()
+    asyncio.run(overlay.on_delete(deleted))
+    asyncio.run(overlay.on_upsert({"_id": edited, "summary_embedding": [0.0, 1.0]}))
+    asyncio.run(overlay.on_upsert({"_id": created, "summary_embedding": [1.0, 1.0]}))
+    monkeypatch.setattr(batch_jobs, "get_embedding_index", lambda: index)
+    monkeypatch.setattr(batch_jobs, "overlay", overlay)
+
+    ids, matrix, _ = asyncio.run(batch_jobs.load_embeddings(None))
+
+    rows = dict(zip(ids, matrix.tolist()))
+    assert deleted not in rows
+    assert rows == {kept: [1.0, 0.0], edited: [0.0, 1.0], created: [1.0, 1.0]}
+
+
+class RecordingRunner:
+    def __init__(self):
+        self.submitted = []
+
+    async def submit(self, job_type, params):
+        self.submitted.append((job_type, params))
+        return "job"
+
+
+@pytest.fixture
+def client_and_runner():
+    runner = RecordingRunner()
+    app = FastAPI()
+    app.include_router(admin.router, prefix="/api/admin/jobs")
+    app.dependency_overrides[get_batch_runner] = lambda: runner
+    return TestClient(app), runner
+
+
+@pytest.mark.parametrize("params", [{"k": 0}, {"clusters": -3}, {"iterations": 0}, {"k": "ten"}, {"k": True}])
+def test_submit_rejects_non_positive_params(client_and_runner, params):
+    client, runner = client_and_runner
+    job_type = "knn_graph" if "k" in params else "kmeans"
+    response = client.post("/api/admin/jobs", json={"type": job_type, "params": params})
+    assert response.status_code == 400
+    assert runner.submitted == []
+
+
+def test_submit_accepts_valid_params(client_and_runner):
+    client, runner = client_and_runner
+    response = client.post("/api/admin/jobs", json={"type": "knn_graph", "params": {"k": 10}})
+    assert response.status_code == 202
+    assert runner.submitted == [("knn_graph", {"k": 10})]
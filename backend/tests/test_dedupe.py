@@ -0,0 +1,87 @@
+from datetime import datetime
+
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from src.dedupe import find_duplicate_groups, merge_group
+from src.raw_profiles import RAW_COLLECTION
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def test_identical_embeddings_need_matching_names():
+    profiles = [{"name": "Jane Doe"}, {"name": "John Smith"}, {"name": "Jane A. Doe"}]
+    # Template summaries: every profile embeds the same
+    matrix = np.vstack([unit([1, 0, 0])] * 3)
+    assert find_duplicate_groups(profiles, matrix) == [[0, 2]]
+
+
+def test_same_email_with_different_names_is_not_grouped():
+    profiles = [{"name": "Jane Doe", "email": "a@x.com"}, {"name": "John Smith", "email": "A@x.com"}]
+    matrix = np.vstack([unit([1, 0]), unit([0, 1])])
+    assert find_duplicate_groups(profiles, matrix) == []
+
+
+def test_same_linkedin_url_is_grouped():
+    profiles = [
+        {"name": "Jane Doe", "linkedinUrl": "https://www.linkedin.com/in/janedoe/"},
+        {"name": "J. Doe", "linkedinUrl": "linkedin.com/in/janedoe"},
+    ]
+    matrix = np.vstack([unit([1, 0]), unit([0, 1])])
+    assert find_duplicate_groups(profiles, matrix) == [[0, 1]]
+
+
+class FakeCollection:
+    def __init__(self):
+        self.updates = []
+        self.deleted = []
+        self.database = {RAW_COLLECTION: self}
+
+    def update_one(self, filter, update):
+        self.updates.append((filter, update))
+
+    def delete_many(self, filter):
+        self.deleted.extend(filter["_id"]["$in"])
+
+
+def test_merge_keeps_claimed_profiles_with_other_emails():
+    keeper = {"_id": ObjectId(), "email": "jane@x.com", "name": "Jane Doe", "summary": "",
+              "updated_at": datetime(2024, 1, 2)}
+    other_account = {"_id": ObjectId(), "email": "other@x.com", "name": "Jane Doe", "summary": "Theirs"}
+    unclaimed = {"_id": ObjectId(), "name": "Jane Doe", "summary": "Scraped summary", "location": "Philadelphia"}
+    collection = FakeCollection()
+
+    result = merge_group(collection, [unclaimed, other_account, keeper])
+
+    assert result["kept"] == str(keeper["_id"])
+    assert result["removed"] == [str(unclaimed["_id"])]
+    assert result["conflicts"] == [str(other_account["_id"])]
+    assert other_account["_id"] not in collection.deleted
+    (filter, update), = collection.updates
+    assert update["$set"]["summary"] == "Scraped summary"
+    assert update["$set"]["embedding_status"] == "pending"
+    assert "updated_at" in update["$set"]
+    assert result["reembed"]
+
+
+def test_merge_moves_linkedin_url_under_unique_index():
+    mongomock = pytest.importorskip("mongomock")
+    collection = mongomock.MongoClient().UPenn.profilematch
+    # The index models.user.User.ensure_indexes creates
+    collection.create_index("linkedinUrl", unique=True, partialFilterExpression={"linkedinUrl": {"$gt": ""}})
+    keeper = {"_id": ObjectId(), "email": "jane@x.com", "name": "Jane Doe", "updated_at": datetime(2024, 1, 2)}
+    scraped = {"_id": ObjectId(), "name": "Jane Doe", "linkedinUrl": "https://www.linkedin.com/in/janedoe",
+               "summary": "Scraped summary"}
+    collection.insert_many([keeper, scraped])
+
+    result = merge_group(collection, [scraped, keeper])
+
+    assert result["removed"] == [str(scraped["_id"])]
+    merged = collection.find_one({"_id": keeper["_id"]})
+    assert merged["linkedinUrl"] == "https://www.linkedin.com/in/janedoe"
+    assert merged["summary"] == "Scraped summary"
+    assert collection.count_documents({}) == 1
@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from src import embedding_index
+from src.embedding_index import EmbeddingIndex, build_index, search_embedding_index, search_embedding_index_many
+
+
+@pytest.fixture
+def use_index(monkeypatch):
+    def use(path):
+        index = EmbeddingIndex(str(path))
+        monkeypatch.setattr(embedding_index, "get_embedding_index", lambda: index)
+        return index
+    return use
+
+
+def test_empty_index_falls_back(tmp_path, use_index):
+    path = tmp_path / "empty.idx"
+    build_index([], str(path))
+    use_index(path)
+    assert search_embedding_index([0.1, 0.2, 0.3], 5) is None
+    assert search_embedding_index_many([[0.1, 0.2, 0.3]], 5) is None
+
+
+def test_dimension_mismatch_falls_back(tmp_path, use_index):
+    path = tmp_path / "index.idx"
+    ids = [str(ObjectId()) for _ in range(3)]
+    build_index([(profile_id, [1.0, 0.0, 0.0, 0.0]) for profile_id in ids], str(path))
+    use_index(path)
+    assert search_embedding_index([0.1, 0.2, 0.3], 5) is None
+    assert search_embedding_index_many([[1.0, 0.0, 0.0, 0.0], [0.1, 0.2]], 5) is None
+    assert len(search_embedding_index([1.0, 0.0, 0.0, 0.0], 2)) == 2
+
+
+class FakeProfiles:
+    """Async find() over in-memory docs, enough for IndexOverlay.on_reset."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def _iterate(self, matches):
+        for doc in matches:
+            yield doc
+
+    def find(self, query, projection):
+        since = query.get("updated_at", {}).get("$gt")
+        return self._iterate([doc for doc in self.docs if since is None or doc["updated_at"] > since])
+
+
+def test_overlay_catches_up_on_changes_since_build(tmp_path, use_index):
+    import asyncio
+    from datetime import datetime, timedelta
+
+    kept, edited, deleted = (str(ObjectId()) for _ in range(3))
+    path = tmp_path / "index.idx"
+    build_index([(kept, [1.0, 0.0]), (edited, [0.0, 1.0]), (deleted, [0.7, 0.7])], str(path))
+    index = use_index(path)
+    built_at = datetime.utcfromtimestamp(index.built_at)
+    created = str(ObjectId())
+    overlay = embedding_index.IndexOverlay()
+    overlay.collection = FakeProfiles([
+        {"_id": ObjectId(kept), "updated_at": built_at - timedelta(minutes=5), "summary_embedding": [1.0, 0.0]},
+        # Changed after the build, before this process started watching
+        {"_id": ObjectId(edited), "updated_at": built_at + timedelta(minutes=1), "summary_embedding": [1.0, 0.1]},
+        {"_id": ObjectId(created), "updated_at": built_at + timedelta(minutes=2), "summary_embedding": [0.9, 0.0]},
+    ])
+
+    asyncio.run(overlay.on_reset())
+
+    assert set(overlay.upserts) == {edited, created}
+    assert set(overlay.deleted) == {deleted}
+    ranked = [profile_id for profile_id, _ in overlay.merge(index, [1.0, 0.0], 5)]
+    assert deleted not in ranked
+    assert set(ranked) == {kept, edited, created}
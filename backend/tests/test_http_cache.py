@@ -0,0 +1,88 @@
+import asyncio
+from datetime import datetime
+
+from src import http_cache
+from src.http_cache import SEARCH_CACHE_CONTROL, CorpusVersion
+
+
+class FakeProfiles:
+    """The two reads CorpusVersion makes, over a shared list of docs."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def find_one(self, query, projection, sort):
+        dated = [doc for doc in self.docs if doc.get("updated_at")]
+        return max(dated, key=lambda doc: doc["updated_at"]) if dated else None
+
+    async def estimated_document_count(self):
+        return len(self.docs)
+
+
+class FakeFeed:
+    def __init__(self, collection):
+        self.collection = collection
+        self.mode = "polling"
+
+
+class FakeWarmCache:
+    stale = False
+
+
+def worker(docs):
+    version = CorpusVersion()
+    version.feed = FakeFeed(FakeProfiles(docs))
+    version.warm_cache = FakeWarmCache()
+    return version
+
+
+async def settled_etag(version, query="engineer", offset=0):
+    etag = version.search_etag(query, offset)
+    if etag is None:
+        await version._task
+        etag = version.search_etag(query, offset)
+    return etag
+
+
+def test_workers_agree_and_change_together(monkeypatch):
+    monkeypatch.setattr(http_cache, "get_embedding_index", lambda: None)
+    docs = [{"_id": "a", "updated_at": datetime(2024, 1, 1)}, {"_id": "b", "updated_at": datetime(2024, 1, 2)}]
+
+    async def scenario():
+        first, second = worker(docs), worker(docs)
+        etag = await settled_etag(first)
+        # A revalidation that lands on another worker still matches
+        assert await settled_etag(second) == etag
+
+        docs.append({"_id": "c", "updated_at": datetime(2024, 1, 3)})
+        for version in (first, second):
+            await version.on_upsert(docs[-1])
+        changed = await settled_etag(first)
+        assert changed != etag
+        assert await settled_etag(second) == changed
+
+        # A delete leaves the newest updated_at alone but changes the count
+        docs.pop(0)
+        await first.on_delete("a")
+        assert await settled_etag(first) not in (etag, changed)
+
+    asyncio.run(scenario())
+
+
+def test_no_etag_while_version_unknown_or_warm_cache_stale(monkeypatch):
+    monkeypatch.setattr(http_cache, "get_embedding_index", lambda: None)
+
+    async def scenario():
+        version = worker([{"_id": "a", "updated_at": datetime(2024, 1, 1)}])
+        # First search starts the read and goes without an ETag
+        assert version.search_etag("engineer", 0) is None
+        await version._task
+        assert version.search_etag("engineer", 0) is not None
+        version.warm_cache.stale = True
+        assert version.search_etag("engineer", 0) is None
+
+    asyncio.run(scenario())
+
+
+def test_search_responses_are_private():
+    assert SEARCH_CACHE_CONTROL.startswith("private")
@@ -0,0 +1,139 @@
+import asyncio
+
+from bson import ObjectId
+
+from src import job_queue as job_queue_module
+from src.job_queue import JobQueue
+
+
+class FlakyJobs:
+    """A jobs collection holding one queued job; update_one fails the first time."""
+
+    def __init__(self):
+        self.job = {"_id": ObjectId(), "type": "test", "payload": {}, "status": "queued",
+                    "attempts": 0, "max_attempts": 3}
+        self.update_failures = 1
+        self.updates = []
+
+    async def find_one_and_update(self, filter, update, **kwargs):
+        if self.job["status"] != "queued":
+            return None
+        self.job["status"] = "running"
+        self.job["attempts"] += 1
+        return dict(self.job)
+
+    async def update_one(self, filter, update):
+        if self.update_failures:
+            self.update_failures -= 1
+            # As if the job's lease had expired and it was reclaimable
+            self.job["status"] = "queued"
+            raise ConnectionError("transient Mongo error")
+        self.updates.append(update["$set"]["status"])
+        self.job.update(update["$set"])
+
+
+class FakeDb:
+    def __init__(self):
+        self.jobs = FlakyJobs()
+
+
+def test_worker_survives_failed_status_update(monkeypatch):
+    monkeypatch.setattr(job_queue_module, "POLL_INTERVAL", 0.01)
+
+    async def scenario():
+        db = FakeDb()
+        queue = JobQueue(db)
+        runs = []
+
+        async def handler(payload):
+            runs.append(payload)
+
+        queue.register("test", handler)
+        queue.start(worker_count=1)
+        for _ in range(100):
+            if db.jobs.updates:
+                break
+            await asyncio.sleep(0.01)
+        worker_alive = not queue._workers[0].done()
+        await queue.stop()
+        return db.jobs, runs, worker_alive
+
+    jobs, runs, worker_alive = asyncio.run(scenario())
+    assert worker_alive
+    # The first "done" write failed, so the job ran again and then completed
+    assert len(runs) == 2
+    assert jobs.updates == ["done"]
+
+
+def test_worker_survives_raising_give_up_handler(monkeypatch):
+    monkeypatch.setattr(job_queue_module, "POLL_INTERVAL", 0.01)
+
+    async def scenario():
+        db = FakeDb()
+        db.jobs.update_failures = 0
+        db.jobs.job["max_attempts"] = 1
+        queue = JobQueue(db)
+
+        async def handler(payload):
+            raise ValueError("embedding failed")
+
+        async def give_up(payload, error):
+            raise ConnectionError("transient Mongo error")
+
+        queue.register("test", handler, on_give_up=give_up)
+        queue.start(worker_count=1)
+        await asyncio.sleep(0.1)
+        worker_alive = not queue._workers[0].done()
+        await queue.stop()
+        return db.jobs, worker_alive
+
+    jobs, worker_alive = asyncio.run(scenario())
+    assert worker_alive
+    assert jobs.updates == ["failed"]
+
+
+class PendingProfiles:
+    def __init__(self, docs):
+        self.docs = docs
+        self.queries = []
+
+    async def _iterate(self, docs):
+        for doc in docs:
+            yield doc
+
+    def find(self, filter, projection):
+        self.queries.append(filter)
+        cutoff = filter["updated_at"]["$lt"]
+        return self._iterate([doc for doc in self.docs
+                              if doc["embedding_status"] == filter["embedding_status"] and doc["updated_at"] < cutoff])
+
+
+class RecordingQueue:
+    def __init__(self):
+        self.keys = []
+
+    async def enqueue(self, job_type, payload, idempotency_key, **kwargs):
+        self.keys.append(idempotency_key)
+        return "job"
+
+
+def test_sweep_enqueues_profiles_stuck_pending():
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+
+    from src.profile_jobs import EMBED_PROFILE, PendingEmbeddingSweep
+
+    old = datetime.utcnow() - timedelta(hours=1)
+    stuck, fresh, ready = ObjectId(), ObjectId(), ObjectId()
+    profiles = PendingProfiles([
+        {"_id": stuck, "embedding_status": "pending", "updated_at": old, "summary": "Builds things"},
+        # Its job was just enqueued and may not have run yet
+        {"_id": fresh, "embedding_status": "pending", "updated_at": datetime.utcnow(), "summary": "New"},
+        {"_id": ready, "embedding_status": "ready", "updated_at": old, "summary": "Done"},
+    ])
+    queue = RecordingQueue()
+    sweep = PendingEmbeddingSweep(queue, SimpleNamespace(profilematch=profiles))
+
+    assert asyncio.run(sweep.sweep()) == 1
+    (key,) = queue.keys
+    assert key.startswith(f"{EMBED_PROFILE}:{stuck}:")
@@ -0,0 +1,81 @@
+import asyncio
+
+from bson import ObjectId
+
+from src import knn_graph
+from src.knn_graph import KnnGraphUpdater
+
+
+class FakeKnnCollection:
+    def __init__(self):
+        self.rows = {}
+        self.calls = []
+
+    async def find_one(self, filter, projection=None):
+        return self.rows.get(filter["_id"])
+
+    async def update_many(self, filter, update):
+        self.calls.append(("update_many", filter, update))
+
+    async def bulk_write(self, operations, ordered=True):
+        self.calls.append(("bulk_write", operations))
+
+    async def replace_one(self, filter, replacement, upsert=False):
+        self.calls.append(("replace_one", filter, replacement))
+        self.rows[filter["_id"]] = {"_id": filter["_id"], **replacement}
+
+
+class FakeDb:
+    def __init__(self):
+        self.profile_knn = FakeKnnCollection()
+
+
+def test_changed_embedding_pulls_stale_entries_then_skips_unchanged(monkeypatch):
+    profile_id, neighbour_id = ObjectId(), ObjectId()
+    monkeypatch.setattr(knn_graph, "search_embedding_index",
+                        lambda embedding, limit: [(str(profile_id), 1.0), (str(neighbour_id), 0.8)])
+    db = FakeDb()
+    updater = KnnGraphUpdater(db, k=5)
+    doc = {"_id": str(profile_id), "name": "Jane", "summary_embedding": [0.1, 0.2]}
+
+    asyncio.run(updater.on_upsert(doc))
+    kinds = [call[0] for call in db.profile_knn.calls]
+    assert kinds == ["update_many", "bulk_write", "replace_one"]
+    _, pull_filter, pull = db.profile_knn.calls[0]
+    # Every row listing the profile, except its new neighbours, drops it
+    assert pull_filter == {"neighbors.id": profile_id, "_id": {"$nin": [neighbour_id]}}
+    assert pull == {"$pull": {"neighbors": {"id": profile_id}}}
+    _, operations = db.profile_knn.calls[1]
+    assert [operation._filter for operation in operations] == [{"_id": neighbour_id}]
+
+    # A name edit with the same embedding doesn't re-rank
+    db.profile_knn.calls.clear()
+    asyncio.run(updater.on_upsert({**doc, "name": "Jane Doe"}))
+    assert db.profile_knn.calls == []
+
+
+def test_index_is_current_detects_stale_index(tmp_path):
+    import pytest
+    mongomock = pytest.importorskip("mongomock")
+    from datetime import datetime, timedelta
+
+    from src.embedding_index import EmbeddingIndex, build_index, index_is_current
+
+    profiles = mongomock.MongoClient().UPenn.profilematch
+    long_ago = datetime(2020, 1, 1)
+    ids = [ObjectId(), ObjectId()]
+    profiles.insert_many([{"_id": profile_id, "summary_embedding": [1.0, 0.0], "updated_at": long_ago}
+                          for profile_id in ids])
+    path = str(tmp_path / "index.idx")
+    build_index([(str(profile_id), [1.0, 0.0]) for profile_id in ids], path)
+    index = EmbeddingIndex(path)
+    assert index_is_current(index, profiles)
+
+    # Edited after the build
+    profiles.update_one({"_id": ids[0]}, {"$set": {"updated_at": datetime.utcnow() + timedelta(minutes=1)}})
+    assert not index_is_current(index, profiles)
+
+    # Deleted after the build: nothing newer, but the row count no longer matches
+    profiles.update_one({"_id": ids[0]}, {"$set": {"updated_at": long_ago}})
+    profiles.delete_one({"_id": ids[1]})
+    assert not index_is_current(index, profiles)
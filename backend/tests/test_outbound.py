@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from src.outbound import ProviderGuard, ProviderUnavailable
+
+
+class SlowStream:
+    """A streaming response whose chunks arrive `delay` seconds apart."""
+
+    def __init__(self, chunks, delay):
+        self.chunks = list(chunks)
+        self.delay = delay
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.chunks:
+            raise StopAsyncIteration
+        await asyncio.sleep(self.delay)
+        return self.chunks.pop(0)
+
+
+def opener(chunks, delay=0.0):
+    async def open_stream():
+        # Like generate_content_async(stream=True): returns right away
+        return SlowStream(chunks, delay)
+    return open_stream
+
+
+def test_stream_holds_slot_until_exhausted():
+    async def scenario():
+        guard = ProviderGuard("test", max_concurrency=1, timeout=5.0, queue_timeout=0.05)
+        first = guard.stream(opener(["a", "b"]))
+        assert await first.__anext__() == "a"
+        # The first stream is still being read, so its slot is taken
+        with pytest.raises(ProviderUnavailable):
+            async for _ in guard.stream(opener(["c"])):
+                pass
+        assert [chunk async for chunk in first] == ["b"]
+        assert [chunk async for chunk in guard.stream(opener(["c"]))] == ["c"]
+        assert guard.metrics["successes"] == 2
+        assert guard.metrics["rejected"] == 1
+
+    asyncio.run(scenario())
+
+
+def test_stream_deadline_covers_whole_iteration():
+    async def scenario():
+        guard = ProviderGuard("test", max_concurrency=1, timeout=0.25)
+        received = []
+        # Each chunk is well within the deadline; the stream as a whole is not
+        with pytest.raises(ProviderUnavailable):
+            async for chunk in guard.stream(opener(range(10), delay=0.1)):
+                received.append(chunk)
+        assert 0 < len(received) < 10
+        assert guard.metrics["timeouts"] == 1
+        # The slot came back
+        assert [chunk async for chunk in guard.stream(opener(["x"]))] == ["x"]
+
+    asyncio.run(scenario())
+
+
+def test_stream_releases_slot_when_reader_stops():
+    async def scenario():
+        guard = ProviderGuard("test", max_concurrency=1, timeout=5.0, queue_timeout=0.05)
+        stream = guard.stream(opener(["a", "b", "c"]))
+        assert await stream.__anext__() == "a"
+        await stream.aclose()
+        assert [chunk async for chunk in guard.stream(opener(["x"]))] == ["x"]
+        assert guard.metrics["failures"] == 0
+
+    asyncio.run(scenario())
+
+
+def open_circuit(guard):
+    guard._consecutive_failures = guard.failure_threshold
+    guard._opened_at = 0.0  # Long enough ago: the next call is the half-open trial
+
+
+def test_cancelled_trial_lets_the_next_call_try():
+    async def scenario():
+        guard = ProviderGuard("test", max_concurrency=1, timeout=5.0)
+        open_circuit(guard)
+        assert guard.state == "half_open"
+
+        trial = asyncio.create_task(guard.call(asyncio.sleep, 10))
+        await asyncio.sleep(0.01)
+        # Another call while the trial runs is short-circuited
+        with pytest.raises(ProviderUnavailable):
+            await guard.call(asyncio.sleep, 0)
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        # The cancelled trial gave no verdict; the next call is the new trial
+        assert await guard.call(asyncio.sleep, 0, result="ok") == "ok"
+        assert guard.state == "closed"
+
+    asyncio.run(scenario())
+
+
+def test_trial_cancelled_waiting_for_slot_is_released():
+    async def scenario():
+        guard = ProviderGuard("test", max_concurrency=1, timeout=5.0, queue_timeout=5.0)
+        await guard._async_slots.acquire()  # Every slot taken
+        open_circuit(guard)
+        waiting = asyncio.create_task(guard.call(asyncio.sleep, 0))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        guard._async_slots.release()
+        assert await guard.call(asyncio.sleep, 0, result="ok") == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_stream_trial_is_released():
+    async def scenario():
+        guard = ProviderGuard("test", max_concurrency=1, timeout=5.0)
+        open_circuit(guard)
+
+        async def read():
+            async for _ in guard.stream(opener(range(10), delay=1.0)):
+                pass
+
+        reader = asyncio.create_task(read())
+        await asyncio.sleep(0.01)
+        reader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await reader
+        assert [chunk async for chunk in guard.stream(opener(["x"]))] == ["x"]
+
+    asyncio.run(scenario())
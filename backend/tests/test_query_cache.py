@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+from pymongo.errors import OperationFailure
+
+from src import query_cache
+from src.query_cache import QUERY_LOG_RETENTION, QueryLog, WarmCache
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.commands = []
+
+    async def command(self, *args, **kwargs):
+        self.commands.append((args, kwargs))
+
+
+class QueryCollection:
+    name = "search_queries"
+
+    def __init__(self, existing_plain_index=False):
+        self.database = FakeDatabase()
+        self.existing_plain_index = existing_plain_index
+        self.indexes = []
+
+    async def create_index(self, keys, **kwargs):
+        if self.existing_plain_index:
+            raise OperationFailure("Index with name: ts_1 already exists with different options", code=85)
+        self.indexes.append((keys, kwargs))
+
+
+class FakeDb:
+    def __init__(self, collection):
+        self.search_queries = collection
+
+    def __getattr__(self, name):
+        return None  # Collections WarmCache holds but these tests don't use
+
+    def __getitem__(self, name):
+        return None
+
+
+def test_query_log_expires_entries():
+    collection = QueryCollection()
+    asyncio.run(QueryLog(FakeDb(collection)).ensure_indexes())
+    assert collection.indexes == [("ts", {"expireAfterSeconds": int(QUERY_LOG_RETENTION.total_seconds())})]
+
+
+def test_query_log_converts_existing_plain_index():
+    collection = QueryCollection(existing_plain_index=True)
+    asyncio.run(QueryLog(FakeDb(collection)).ensure_indexes())
+    (args, kwargs), = collection.database.commands
+    assert args == ("collMod", "search_queries")
+    assert kwargs["index"]["expireAfterSeconds"] == int(QUERY_LOG_RETENTION.total_seconds())
+
+
+def test_rerank_ranks_all_queries_in_one_batch_off_the_loop(monkeypatch):
+    calls = []
+
+    def rank_many(embeddings, limit):
+        calls.append((len(embeddings), threading.current_thread() is threading.main_thread()))
+        return [[(f"profile-{i}", 1.0)] for i in range(len(embeddings))]
+
+    monkeypatch.setattr(query_cache, "search_embedding_index_many", rank_many)
+    cache = WarmCache(FakeDb(QueryCollection()))
+    cache.entries = {"engineer": ([1.0, 0.0], []), "designer": ([0.0, 1.0], [])}
+
+    asyncio.run(cache.rerank())
+
+    assert calls == [(2, False)]
+    assert cache.entries["engineer"] == ([1.0, 0.0], [("profile-0", 1.0)])
+    assert cache.entries["designer"] == ([0.0, 1.0], [("profile-1", 1.0)])
@@ -0,0 +1,236 @@
+"""Each profile write endpoint makes a fixed number of Mongo round trips."""
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from pymongo.errors import DuplicateKeyError
+
+from dependencies import get_db, get_job_queue
+from models.user import PROFILE_PROJECTION, User
+from routes import auth, users
+from src.job_queue import JobQueue
+from src.profile_search import ProfileSearch
+from src.raw_profiles import RAW_COLLECTION
+
+PROFILE_ID = ObjectId()
+
+
+class CountingCollection:
+    """Records every call as one round trip; `results` supplies return values by method name."""
+
+    def __init__(self, name, calls, results):
+        self.name = name
+        self.calls = calls
+        self.results = results
+
+    def __getattr__(self, method):
+        def call(*args, **kwargs):
+            self.calls[self.name] += 1
+            self.calls[(self.name, method)] += 1
+            self.calls.setdefault("args", []).append((self.name, method, args, kwargs))
+            result = self.results.get((self.name, method))
+            return result(*args, **kwargs) if callable(result) else result
+
+        async def async_call(*args, **kwargs):
+            return call(*args, **kwargs)
+
+        return call if self.results.get("sync") else async_call
+
+
+class CountingDb:
+    def __init__(self, results=None):
+        self.calls = Counter()
+        self.results = results or {}
+
+    def __getattr__(self, name):
+        return CountingCollection(name, self.calls, self.results)
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+class InsertResult:
+    inserted_id = ObjectId()
+
+
+def make_client(db):
+    app = FastAPI()
+    app.include_router(users.router, prefix="/api/users")
+    app.include_router(auth.router, prefix="/api/auth")
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_job_queue] = lambda: JobQueue(db)
+    return TestClient(app)
+
+
+SIGNUP = {
+    "email": "jane@example.com", "name": "Jane Doe", "location": "Philadelphia",
+    "linkedinUrl": "https://www.linkedin.com/in/janedoe", "company": "Acme", "role": "Engineer",
+    "summary": "Builds things", "raw_data": {"full_name": "Jane Doe"},
+}
+
+
+def upserted(filter, update, **kwargs):
+    """find_one_and_update as if it inserted the document."""
+    return {"_id": PROFILE_ID, "created_at": update["$setOnInsert"]["created_at"]}
+
+
+def test_signup_new_profile():
+    db = CountingDb({
+        ("profilematch", "find_one_and_update"): upserted,
+        ("jobs", "insert_one"): InsertResult(),
+    })
+    response = make_client(db).post("/api/auth/complete-signup", json=SIGNUP)
+    assert response.status_code == 200
+    assert response.json()["embeddingStatus"] == "pending"
+    assert db.calls["profilematch"] == 1
+    assert db.calls[RAW_COLLECTION] == 1
+    assert db.calls["jobs"] == 1
+
+
+def test_signup_claims_existing_profile():
+    db = CountingDb({
+        ("profilematch", "find_one_and_update"): {"_id": PROFILE_ID, "created_at": datetime(2020, 1, 1)},
+    })
+    response = make_client(db).post("/api/auth/complete-signup", json=SIGNUP)
+    assert response.json() == {"userId": str(PROFILE_ID), "claimed": True}
+    assert db.calls["profilematch"] == 1
+    assert db.calls[RAW_COLLECTION] == 0
+    assert db.calls["jobs"] == 0
+
+
+@pytest.mark.parametrize("raw_data", ["not an object", [1, 2], {"connections": 2 ** 70}])
+def test_signup_rejects_bad_raw_data_before_writing(raw_data):
+    db = CountingDb({("profilematch", "find_one_and_update"): upserted})
+    response = make_client(db).post("/api/auth/complete-signup", json={**SIGNUP, "raw_data": raw_data})
+    assert response.status_code == 400
+    # No orphaned profile
+    assert db.calls["profilematch"] == 0
+    assert db.calls[RAW_COLLECTION] == 0
+
+
+def test_concurrent_signup_duplicate_key_claims():
+    attempts = []
+
+    def upsert(filter, update, **kwargs):
+        attempts.append(filter)
+        if len(attempts) == 1:
+            raise DuplicateKeyError("E11000 duplicate key error")
+        return {"_id": PROFILE_ID, "created_at": update["$setOnInsert"]["created_at"] - timedelta(seconds=1)}
+
+    db = CountingDb({("profilematch", "find_one_and_update"): upsert})
+    response = make_client(db).post("/api/auth/complete-signup", json=SIGNUP)
+    assert response.json() == {"userId": str(PROFILE_ID), "claimed": True}
+    assert db.calls["profilematch"] == 2
+
+
+@pytest.mark.parametrize("summary_changed, jobs", [(True, 1), (False, 0)])
+def test_update_profile(summary_changed, jobs):
+    updated = {"_id": PROFILE_ID, "email": "jane@example.com", "summary": "New summary",
+               "embedding_status": "pending" if summary_changed else "ready", "updated_at": datetime.utcnow()}
+    db = CountingDb({
+        ("profilematch", "find_one_and_update"): lambda *args, **kwargs: dict(updated),
+        ("jobs", "insert_one"): InsertResult(),
+    })
+    response = make_client(db).put("/api/users/profile", params={"email": "jane@example.com"},
+                                   json={"summary": "New summary"})
+    assert response.status_code == 200
+    assert db.calls["profilematch"] == 1
+    assert db.calls["jobs"] == jobs
+    _, _, _, kwargs = db.calls["args"][0]
+    assert kwargs["projection"] == PROFILE_PROJECTION
+
+
+def test_delete_profile():
+    db = CountingDb({("profilematch", "find_one_and_delete"): {"_id": PROFILE_ID}})
+    response = make_client(db).delete("/api/users/profile", params={"email": "jane@example.com"})
+    assert response.status_code == 200
+    assert db.calls[("profilematch", "find_one_and_delete")] == 1
+    assert db.calls["profilematch"] == 1
+    assert db.calls[RAW_COLLECTION] == 1
+
+
+def test_delete_missing_profile():
+    db = CountingDb()
+    response = make_client(db).delete("/api/users/profile", params={"email": "nobody@example.com"})
+    assert response.status_code == 404
+    assert db.calls["profilematch"] == 1
+    assert db.calls[RAW_COLLECTION] == 0
+
+
+def test_profile_search_edit_profile():
+    db = CountingDb({"sync": True, ("profilematch", "find_one_and_update"): {"_id": PROFILE_ID, "name": "Jane"}})
+    profile_search = ProfileSearch.__new__(ProfileSearch)
+    profile_search.collection = db.profilematch
+    profile_search.generate_embedding = lambda text: [0.1, 0.2]
+    result = profile_search.edit_profile(str(PROFILE_ID), {"summary": "Builds things"})
+    assert result["_id"] == str(PROFILE_ID)
+    assert db.calls["profilematch"] == 1
+
+
+def test_get_users_by_ids_excludes_bulky_fields():
+    finds = []
+
+    class EmptyCursor:
+        def __aiter__(self):
+            return self
+
+        async def __anext__(self):
+            raise StopAsyncIteration
+
+    class Collection:
+        def find(self, filter, projection=None):
+            finds.append(projection)
+            return EmptyCursor()
+
+    user_model = User(CountingDb())
+    user_model.collection = Collection()
+    asyncio.run(user_model.get_users_by_ids([str(PROFILE_ID)]))
+    assert finds == [PROFILE_PROJECTION]
+
+
+def test_similar_users_mongo_fallback_excludes_bulky_fields(monkeypatch):
+    """With no embedding index, /similar ranks with the aggregation; its results go to the client as-is."""
+    from models import user as user_module
+    monkeypatch.setattr(user_module, "search_embedding_index", lambda embedding, limit: None)
+    other_id = ObjectId()
+    stored = [
+        {"_id": PROFILE_ID, "name": "Jane Doe", "summary_embedding": [1.0, 0.0],
+         "raw_linkedin_data": {"full_name": "Jane Doe"}},
+        {"_id": other_id, "name": "John Smith", "summary_embedding": [0.9, 0.1],
+         "raw_linkedin_data": {"full_name": "John Smith"}},
+    ]
+    pipelines = []
+
+    async def aggregate(pipeline):
+        pipelines.append(pipeline)
+        project = pipeline[-1].get("$project", {})
+        for doc in stored:
+            yield {field: value for field, value in doc.items() if field not in project}
+
+    db = CountingDb({
+        ("profile_knn", "find_one"): None,
+        ("profilematch", "find_one"): stored[0],
+        "sync": False,
+    })
+    client = make_client(db)
+    monkeypatch.setattr(CountingCollection, "aggregate", lambda self, pipeline: aggregate(pipeline), raising=False)
+
+    response = client.get(f"/api/users/{PROFILE_ID}/similar")
+
+    assert response.status_code == 200
+    assert pipelines[0][-1] == {"$project": PROFILE_PROJECTION}
+    results = response.json()["results"]
+    assert [doc["_id"] for doc in results] == [str(other_id)]
+    assert all("summary_embedding" not in doc and "raw_linkedin_data" not in doc for doc in results)
+
+
+@pytest.mark.parametrize("limit", [0, -3])
+def test_similar_users_rejects_non_positive_limit(limit):
+    db = CountingDb()
+    response = make_client(db).get(f"/api/users/{PROFILE_ID}/similar", params={"limit": limit})
+    assert response.status_code == 400
+    assert db.calls["profile_knn"] == 0
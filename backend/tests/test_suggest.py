@@ -0,0 +1,55 @@
+import random
+
+from src.suggest import SuggestIndex, index_keys, normalize_term
+
+
+class FakeDb:
+    profilematch = None
+    search_queries = None
+
+
+def make_index():
+    index = SuggestIndex(FakeDb())
+    index.ready = True
+    return index
+
+
+def brute_force(index, prefix, limit):
+    normalized = normalize_term(prefix)
+    matches = [key for key in index._terms
+               if any(index_key.startswith(normalized) for index_key in index_keys(key[1]))]
+    matches.sort(key=lambda key: index._rank(normalized, key))
+    return [index._terms[key].text for key in matches[:limit]]
+
+
+def test_popular_term_beats_lexicographically_earlier_ones():
+    index = make_index()
+    for i in range(3000):
+        index.upsert({"_id": f"c{i}", "company": f"Ga{i:05d}"})
+    for i in range(500):
+        index.upsert({"_id": f"g{i}", "company": "Goldman Sachs"})
+    assert index.suggest("g", 3)[0] == {"text": "Goldman Sachs", "field": "company", "count": 500}
+
+
+def test_prefix_lists_stay_exact_through_changes():
+    rng = random.Random(7)
+    companies = [f"{first}{second} Corp" for first in "abc" for second in "abcdefghij"]
+    names = [f"{first}{i} Smith" for first in "abc" for i in range(20)]
+    index = make_index()
+    prefixes = ["a", "b", "c", "ab", "s", "sm", "co", "a1", "abc"]
+
+    for step in range(3000):
+        profile_id = f"p{rng.randrange(400)}"
+        if rng.random() < 0.2:
+            index.delete(profile_id)
+        else:
+            index.upsert({"_id": profile_id, "name": rng.choice(names),
+                          "company": rng.choice(companies[:rng.randrange(1, len(companies))])})
+        if step % 50 == 0:
+            # Query as we go so the lists are maintained rather than rebuilt
+            for prefix in prefixes:
+                limit = rng.choice([1, 5, 8, 20])
+                assert [s["text"] for s in index.suggest(prefix, limit)] == brute_force(index, prefix, limit)
+
+    for prefix in prefixes:
+        assert [s["text"] for s in index.suggest(prefix, 20)] == brute_force(index, prefix, 20)